@@ -1,17 +1,38 @@
-from langchain_openai import ChatOpenAI
+from agents.lazyLoading import Lazy
+
+
+# A ChatOpenAI built on first use. The settings stay readable without building
+# it (or importing langchain_openai), e.g. for cache keys and rate limit budgets.
+class LazyChatModel(Lazy):
+    def __init__(self, name: str, **settings):
+        super().__init__(name, lambda: _chat_openai(settings))
+        self.settings = settings
+        self.model_name: str = settings["model"]
+        self.temperature: float | None = settings.get("temperature")
+        self.max_tokens: int | None = settings.get("max_completion_tokens", settings.get("max_tokens"))
+
+
+def _chat_openai(settings: dict):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(**settings)
 
 
 # Define Model
-model = ChatOpenAI(
+# SDK retries are off: the rate limiter (agents/rateLimiter.py) retries 429s and
+# transient errors within the model's budget, so retries aren't multiplied
+model = LazyChatModel(
+    "model",
     model="gpt-4o-mini",
     temperature=0.7,
-    max_retries=2,
+    max_retries=0,
 )
 
-image_analysis_model = ChatOpenAI(
+image_analysis_model = LazyChatModel(
+    "image_analysis_model",
     model="gpt-4o-mini",
     max_completion_tokens=4000,
     temperature=0.3,
+    max_retries=0,
 )
 
 # BRAND AGENT PROMPTS
@@ -41,6 +62,15 @@ they come from an official document, but use the AI-generated profile to fill in
 any gaps or enrich areas that are vague or missing.
 """
 
+BRAND_SECTION_UPDATE_PROMPT = """
+You are a brand strategy expert. You are given a company's current brand profile,
+its updated questionnaire data and the questionnaire fields that changed.
+
+Regenerate only the requested sections of the profile so they reflect the
+updated questionnaire. Keep them consistent with the rest of the current profile,
+and keep anything the changed fields don't affect.
+"""
+
 # CONTENT AGENT PROMPTS
 CAPTION_GEN_PROMPT = """
 You are a social media expert creating content.
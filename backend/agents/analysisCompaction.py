@@ -0,0 +1,227 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Any
+
+from agents.responseCache import ResponseCache, MemoryTier
+from agents.lazyLoading import Lazy
+
+
+# Token budget for the reference image section of the image prompt
+IMAGE_ANALYSIS_TOKEN_BUDGET = int(os.getenv("IMAGE_ANALYSIS_TOKEN_BUDGET", "600"))
+COMPACTION_MODEL = "gpt-4o-mini"
+
+# Bump when the field ranking or output format changes
+COMPACTION_VERSION = "1"
+
+# Analysis fields in the order they matter for recreating the look of the
+# reference images. Style, light and color first; people and props last.
+FIELD_PRIORITY: list[str] = [
+    # Tier 1
+    "generation_parameters.prompts",
+    "technical_specs.medium",
+    "technical_specs.style",
+    "artistic_elements.visual_style",
+    "color_profile.dominant_colors",
+    "color_profile.color_palette",
+    "lighting.type",
+    "lighting.direction",
+    "lighting.quality",
+    "lighting.mood",
+    "lighting.light_temperature",
+    "lighting.contrast_ratio",
+    "composition.layout",
+    "composition.focal_points",
+    "subject_analysis.primary_subject",
+    "background.setting_type",
+    "artistic_elements.atmosphere",
+    "generation_parameters.keywords",
+    # Tier 2
+    "color_profile.temperature",
+    "color_profile.saturation",
+    "color_profile.contrast",
+    "lighting.directionality",
+    "lighting.shadows.type",
+    "lighting.shadows.density",
+    "lighting.ambient_fill",
+    "technical_specs.depth_of_field",
+    "technical_specs.perspective",
+    "technical_specs.texture",
+    "technical_specs.sharpness",
+    "technical_specs.grain",
+    "composition.rule_applied",
+    "composition.aspect_ratio",
+    "composition.balance",
+    "subject_analysis.positioning",
+    "subject_analysis.scale",
+    "subject_analysis.facial_expression.overall_emotion",
+    "background.wall_surface.material",
+    "background.wall_surface.finish",
+    "background.wall_surface.color",
+    "background.floor_surface.material",
+    "background.background_treatment",
+    "artistic_elements.mood",
+    "artistic_elements.genre",
+    "generation_parameters.technical_settings",
+    "generation_parameters.post_processing",
+    # Tier 3
+    "lighting.highlights.treatment",
+    "subject_analysis.body_positioning.posture",
+    "subject_analysis.hair.length",
+    "subject_analysis.hair.cut",
+    "subject_analysis.hair.texture",
+    "subject_analysis.hands_and_gestures.interaction",
+    "subject_analysis.facial_expression.mouth",
+    "background.objects_catalog",
+    "background.spatial_depth",
+    "artistic_elements.influences",
+    "typography.placement",
+]
+
+# Values that carry no information
+EMPTY_VALUES = {"", "none", "n/a", "na", "null", "not applicable", "not present", "not visible", "unknown"}
+
+# Compacted summaries keyed by analysis set + budget
+compaction_cache = ResponseCache([MemoryTier(max_entries=256)], name="analysis_compaction")
+
+_stats_lock = threading.Lock()
+_stats: dict[str, int] = {"calls": 0, "rawTokens": 0, "compactTokens": 0}
+
+
+# The model's tiktoken encoding, or None if it can't be loaded
+def _load_encoding() -> Any:
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(COMPACTION_MODEL)
+    except Exception as e:
+        print(f"Error loading tiktoken encoding, estimating tokens instead: {e}")
+        return None
+
+
+_encoding = Lazy("tiktoken_encoding", _load_encoding)
+
+
+# Token count with the model's tiktoken encoding (~4 chars per token if it can't be loaded)
+def count_tokens(text: str) -> int:
+    encoding = _encoding.get()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def _lookup(analysis: dict, path: str) -> Any:
+    value: Any = analysis
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _format_value(path: str, value: Any) -> str:
+    if path == "color_profile.dominant_colors" and isinstance(value, list):
+        return ", ".join(
+            " ".join(str(c.get(k)) for k in ("color", "hex", "percentage") if c.get(k))
+            for c in value if isinstance(c, dict)
+        )
+    if isinstance(value, list):
+        return "; ".join(str(v) for v in value if str(v).strip())
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    return " ".join(str(value).split())
+
+
+def _label(path: str) -> str:
+    # Drop the top-level section where the leaf name is already descriptive
+    parts = path.split(".")
+    return ".".join(parts[1:]) if parts[0] in ("subject_analysis", "generation_parameters") else path
+
+
+def _usable(analyses: Any) -> list[dict]:
+    if isinstance(analyses, dict):
+        analyses = [analyses]
+    if not isinstance(analyses, list):
+        return []
+    return [a for a in analyses if isinstance(a, dict) and a.get("success") is not False]
+
+
+# Build the compact summary: fields in priority order, values shared by every
+# image written once. A field that doesn't fit the remaining budget is skipped
+# so smaller, lower-ranked fields can still use the space.
+def _compact(analyses: list[dict], budget: int) -> str:
+    shared: list[str] = []
+    per_image: list[list[str]] = [[] for _ in analyses]
+    used = 0
+
+    for path in FIELD_PRIORITY:
+        values = [_format_value(path, _lookup(a, path)) for a in analyses]
+        present = [v for v in values if v.lower().strip(" .") not in EMPTY_VALUES]
+        if not present:
+            continue
+
+        if len(analyses) > 1 and len(present) == len(values) and len({v.lower() for v in values}) == 1:
+            lines = [(None, f"- {_label(path)}: {values[0]}")]
+        else:
+            lines = [
+                (i, f"- {_label(path)}: {v}")
+                for i, v in enumerate(values)
+                if v.lower().strip(" .") not in EMPTY_VALUES
+            ]
+
+        cost = sum(count_tokens(line) + 1 for _, line in lines)
+        if used + cost > budget:
+            continue
+        used += cost
+
+        for i, line in lines:
+            (shared if i is None else per_image[i]).append(line)
+
+    sections: list[str] = []
+    if shared:
+        sections.append(f"Shared by all {len(analyses)} reference images:\n" + "\n".join(shared))
+    for i, lines in enumerate(per_image, start=1):
+        if lines:
+            header = "Reference image:" if len(analyses) == 1 else f"Image {i}:"
+            sections.append(header + "\n" + "\n".join(lines))
+    return "\n\n".join(sections)
+
+
+# Compact image analyses for the image prompt (cached per analysis set).
+# Anything that isn't a list of analysis dicts is passed through as text.
+def compact_image_analyses(image_analysis: Any, budget: int = IMAGE_ANALYSIS_TOKEN_BUDGET) -> str:
+    analyses = _usable(image_analysis)
+    if not analyses:
+        return "" if not image_analysis else str(image_analysis)
+
+    payload = json.dumps(analyses, sort_keys=True, default=str)
+    key = hashlib.sha256(f"{COMPACTION_VERSION}:{budget}:{payload}".encode()).hexdigest()
+
+    cached = compaction_cache.get(key)
+    if cached is None:
+        cached = {
+            "text": _compact(analyses, budget),
+            # What the prompt used to contain: the raw analysis list
+            "rawTokens": count_tokens(str(image_analysis)),
+        }
+        cached["compactTokens"] = count_tokens(cached["text"])
+        compaction_cache.set(key, cached)
+
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["rawTokens"] += cached["rawTokens"]
+        _stats["compactTokens"] += cached["compactTokens"]
+    print(
+        f"Image analysis compacted: {cached['rawTokens']} -> {cached['compactTokens']} tokens "
+        f"({cached['rawTokens'] - cached['compactTokens']} saved)"
+    )
+    return cached["text"]
+
+
+def compaction_stats() -> dict[str, Any]:
+    with _stats_lock:
+        stats: dict[str, Any] = dict(_stats)
+    stats["savedTokens"] = stats["rawTokens"] - stats["compactTokens"]
+    stats["savedRatio"] = round(stats["savedTokens"] / stats["rawTokens"], 4) if stats["rawTokens"] else 0.0
+    stats["cache"] = compaction_cache.stats()
+    return stats
@@ -1,14 +1,18 @@
 from dotenv import load_dotenv
+import os
 import json
-from typing import Any, Optional
+import hashlib
+import functools
+from typing import Any, Callable, Optional
 from werkzeug.datastructures import FileStorage
-import pdfplumber
-import io
 
-from pydantic import BaseModel, Field
-from langchain.agents import create_agent
+from pydantic import BaseModel, Field, create_model
 
-from agents.agentSetup import model, BRAND_ANALYSIS_PROMPT, GUIDELINE_MERGING_PROMPT
+from agents.agentSetup import model, BRAND_ANALYSIS_PROMPT, BRAND_SECTION_UPDATE_PROMPT, GUIDELINE_MERGING_PROMPT
+from agents.responseCache import CachedAgent, create_cached_agent
+from agents.pdfExtraction import extract_pdf_text
+from agents.fanOut import fan_out_settled
+from metrics import timed
 
 
 # Setup environment files
@@ -35,36 +39,39 @@ class BrandAnalysisResponseFormat(BaseModel):
 brand_analysis_tools = []
 
 # Define Agents
-brand_analysis_agent = create_agent(
+brand_analysis_agent = create_cached_agent(
    model, 
    tools=brand_analysis_tools,
    system_prompt=BRAND_ANALYSIS_PROMPT,
    response_format=BrandAnalysisResponseFormat,
+   name="brand_analysis_agent",
 )
 
-guideline_merging_agent = create_agent(
+guideline_merging_agent = create_cached_agent(
    model, 
    tools=brand_analysis_tools,
    system_prompt=GUIDELINE_MERGING_PROMPT,
    response_format=BrandAnalysisResponseFormat,
+   name="guideline_merging_agent",
 )
 
 
 # Analyze brand from questionnaire data
-def analyze_brand(questionnaire_data: dict) -> dict[str, Any]:
+@timed("analyze_brand")
+def analyze_brand(questionnaire_data: dict, fresh: bool = False) -> dict[str, Any]:
     try:
         # Invoke the agent
-        response = brand_analysis_agent.invoke({
+        response = brand_analysis_agent.invoke_structured({
             "messages": [
                 {
                     "role": "user",
                     "content": f"Analyze this questionnaire data:\n{json.dumps(questionnaire_data, indent=2)}"
                 }
             ]
-        })
+        }, fresh)
 
         # Return the required data
-        return response["structured_response"].model_dump()
+        return response
     except Exception as e:
         print(f"Error in analyze_brand(): {str(e)}")
         return { 
@@ -75,29 +82,32 @@ def analyze_brand(questionnaire_data: dict) -> dict[str, Any]:
 
 
 # Analyze uploaded brand guidelines
-def analyze_guidelines(uploaded_file: FileStorage) -> dict[str, Any]:
-    try:
-        # Get file
-        file_bytes = uploaded_file.read()
+def analyze_guidelines(uploaded_file: FileStorage, fresh: bool = False) -> dict[str, Any]:
+    return analyze_guidelines_pdf(uploaded_file.read(), fresh)
 
-        # Extract text from pdf file
-        file_text = ""
-        with pdfplumber.open(io.BytesIO(file_bytes)) as pdf:
-            for page in pdf.pages:
-                file_text += page.extract_text() or ""
+
+# Analyze brand guidelines from the PDF's bytes
+@timed("analyze_guidelines")
+def analyze_guidelines_pdf(file_bytes: bytes, fresh: bool = False) -> dict[str, Any]:
+    try:
+        # Extract text from pdf file (cached by file hash, trimmed to the text budget)
+        extracted = extract_pdf_text(file_bytes)
+        file_text = extracted["text"]
+        if extracted["truncated"]:
+            print(f"Guidelines PDF trimmed to budget: {extracted['pagesUsed']}/{extracted['pageCount']} pages, {len(file_text)} chars")
 
         # Invoke the agent
-        response = brand_analysis_agent.invoke({
+        response = brand_analysis_agent.invoke_structured({
             "messages": [
                 {
                     "role": "user",
                     "content": f"Analyze this data:\n{file_text}"
                 }
             ]
-        })
+        }, fresh)
 
         # Return the required data
-        return response["structured_response"].model_dump()
+        return response
     except Exception as e:
         print(f"Error in analyze_guidelines(): {str(e)}")
         return {
@@ -108,10 +118,11 @@ def analyze_guidelines(uploaded_file: FileStorage) -> dict[str, Any]:
 
 
 # Merge brand guidelines
-def merge_guidelines(generated_profile: dict, uploaded_analysis: dict) -> dict[str, Any]:
+@timed("merge_guidelines")
+def merge_guidelines(generated_profile: dict, uploaded_analysis: dict, fresh: bool = False) -> dict[str, Any]:
     try:
         # Invoke the agent
-        response = guideline_merging_agent.invoke({
+        response = guideline_merging_agent.invoke_structured({
             "messages": [
                 {
                     "role": "user",
@@ -125,10 +136,10 @@ def merge_guidelines(generated_profile: dict, uploaded_analysis: dict) -> dict[s
                     """
                 }
             ]
-        })
+        }, fresh)
 
         # Return the required data
-        return response["structured_response"].model_dump()
+        return response
     except Exception as e:
         print(f"Error in merge_brand_guidelines(): {str(e)}")
         return {
@@ -138,49 +149,472 @@ def merge_guidelines(generated_profile: dict, uploaded_analysis: dict) -> dict[s
         }
 
 
-#Generate brand guidelines
-def generate_brand_guidelines(brand_profile: dict, uploaded_analysis: dict | None = None) -> str:
+# =====================================================
+# INCREMENTAL UPDATES
+# =====================================================
+# Profile sections each questionnaire field feeds. Editing only mapped fields
+# regenerates just their sections; any other field (e.g. brandDescription)
+# changes the whole profile.
+QUESTIONNAIRE_FIELD_SECTIONS: dict[str, list[str]] = {
+    "tone": ["brand_voice", "posting_style"],
+    "brandPersonality": ["brand_voice", "posting_style"],
+    "targetAudience": ["target_audience", "content_themes"],
+    "uniqueValue": ["content_themes"],
+    "competitors": ["content_themes"],
+    "platforms": ["posting_style"],
+    "industry": ["industry", "content_themes", "color_palette"],
+    "email": [],
+    "budget": [],
+}
+# Above this many affected sections a full analysis is cheaper and more coherent
+BRAND_PARTIAL_MAX_SECTIONS = int(os.getenv("BRAND_PARTIAL_MAX_SECTIONS", "4"))
+
+
+# Top-level questionnaire fields that were added, removed or changed
+def changed_questionnaire_fields(old: dict, new: dict) -> list[str]:
+    return sorted(field for field in set(old) | set(new) if old.get(field) != new.get(field))
+
+
+# Profile sections to regenerate for the changed fields (in profile order),
+# or None when the change is too broad for a partial update
+def affected_sections(changed_fields: list[str]) -> list[str] | None:
+    sections: set[str] = set()
+    for field in changed_fields:
+        if field not in QUESTIONNAIRE_FIELD_SECTIONS:
+            return None
+        sections.update(QUESTIONNAIRE_FIELD_SECTIONS[field])
+
+    ordered = [key for key in BrandAnalysisResponseFormat.model_fields if key in sections]
+    return ordered if len(ordered) <= BRAND_PARTIAL_MAX_SECTIONS else None
+
+
+# Profile sections whose values differ
+def changed_sections(old_profile: dict, new_profile: dict) -> list[str]:
+    return [key for key in BrandAnalysisResponseFormat.model_fields if old_profile.get(key) != new_profile.get(key)]
+
+
+# Agent whose structured response holds only `sections` of the brand profile,
+# for updating sections ("update") or re-merging them ("merge")
+SECTION_AGENT_PROMPTS = {"update": BRAND_SECTION_UPDATE_PROMPT, "merge": GUIDELINE_MERGING_PROMPT}
+
+
+@functools.lru_cache(maxsize=None)
+def _section_agent(kind: str, sections: tuple[str, ...]) -> CachedAgent:
+    fields = {
+        key: (field.annotation, field)
+        for key, field in BrandAnalysisResponseFormat.model_fields.items()
+        if key in sections
+    }
+    return create_cached_agent(
+        model,
+        tools=brand_analysis_tools,
+        system_prompt=SECTION_AGENT_PROMPTS[kind],
+        response_format=create_model("BrandProfileSections", **fields),
+        name=f"brand_sections_{kind}:{','.join(sections)}",
+    )
+
+
+# Regenerate only `sections` of the profile after the questionnaire changed
+@timed("update_brand_sections")
+def update_brand_sections(
+    brand_profile: dict,
+    questionnaire_data: dict,
+    changed_fields: list[str],
+    sections: list[str],
+    fresh: bool = False,
+) -> dict[str, Any]:
+    try:
+        response = _section_agent("update", tuple(sections)).invoke_structured({
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"""
+                        Current brand profile:
+                        {json.dumps(brand_profile, indent=2)}
+
+                        Updated questionnaire data:
+                        {json.dumps(questionnaire_data, indent=2)}
+
+                        Changed questionnaire fields: {', '.join(changed_fields)}
+                        Regenerate these sections: {', '.join(sections)}
+                    """
+                }
+            ]
+        }, fresh)
+
+        return {**brand_profile, **response}
+    except Exception as e:
+        print(f"Error in update_brand_sections(): {str(e)}")
+        return {
+            "success": False,
+            "message": "Error updating brand profile",
+            "error": str(e)
+        }
+
+
+# Re-merge only `sections` into a previously merged profile
+@timed("merge_guideline_sections")
+def merge_guideline_sections(
+    generated_profile: dict,
+    uploaded_analysis: dict,
+    merged_profile: dict,
+    sections: list[str],
+    fresh: bool = False,
+) -> dict[str, Any]:
+    try:
+        response = _section_agent("merge", tuple(sections)).invoke_structured({
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"""
+                        Here are the two brand profiles, merge only these sections: {', '.join(sections)}
+                        1. AI-Generated Profile (based on a questionnaire):
+                        {json.dumps({key: generated_profile.get(key) for key in sections}, indent=2)}
+
+                        2. Uploaded Brand Guidelines Profile (extracted from their official document):
+                        {json.dumps({key: uploaded_analysis.get(key) for key in sections}, indent=2)}
+                    """
+                }
+            ]
+        }, fresh)
+
+        return {**merged_profile, **response}
+    except Exception as e:
+        print(f"Error in merge_guideline_sections(): {str(e)}")
+        return {
+            "success": False,
+            "message": "Error merging brand profiles",
+            "error": str(e)
+        }
+
+
+# Questionnaire analysis that reuses the previous profile (`previous` is the
+# stored questionnaire artifact) and regenerates only the sections the changed
+# fields affect. Returns (profile, mode, regenerated sections); mode is
+# "ran" (full analysis), "partial" or "reused".
+def analyze_brand_incremental(
+    questionnaire_data: dict,
+    previous: dict | None = None,
+    fresh: bool = False,
+) -> tuple[dict[str, Any], str, list[str]]:
+    previous_questionnaire = artifact_inputs(QUESTIONNAIRE_STAGE, previous)
+    if fresh or not isinstance(previous_questionnaire, dict) or _is_error(previous.get("output")):
+        return analyze_brand(questionnaire_data, fresh), "ran", []
+
+    changed_fields = changed_questionnaire_fields(previous_questionnaire, questionnaire_data)
+    sections = affected_sections(changed_fields)
+    if sections is None:
+        return analyze_brand(questionnaire_data, fresh), "ran", []
+    if not sections:
+        return previous["output"], "reused", []
+
+    print(f"Questionnaire fields {changed_fields} changed, regenerating {sections}")
+    return update_brand_sections(previous["output"], questionnaire_data, changed_fields, sections, fresh), "partial", sections
+
+
+# Profile sections in the order they are rendered: (key, markdown heading, prompt label)
+BRAND_PROFILE_SECTIONS: list[tuple[str, str, str]] = [
+    ("brand_voice", "Brand Voice", "Voice"),
+    ("color_palette", "Color Palette", "Colors"),
+    ("typeface", "Typeface", "Typefaces"),
+    ("industry", "Industry", "Industry"),
+    ("target_audience", "Target Audience", "Audience"),
+    ("content_themes", "Content Themes", "Themes"),
+    ("posting_style", "Posting Style", "Posting style"),
+]
+
+
+def _section_text(value: Any) -> str:
+    if isinstance(value, list):
+        return ', '.join(str(v) for v in value)
+    return str(value or '').strip()
+
+
+# Render the brand profile as the editable markdown guidelines
+def render_brand_guidelines(brand_profile: dict) -> str:
+    sections = "\n\n".join(
+        f"## {heading}\n{_section_text(brand_profile.get(key))}"
+        for key, heading, _ in BRAND_PROFILE_SECTIONS
+    )
+    return f"\n# BRAND GUIDELINES\n\n{sections}"
+
+
+# Render the brand profile as the compact text sent with every content prompt
+def render_prompt_context(brand_profile: dict) -> str:
+    return "\n".join(
+        f"{label}: {_section_text(brand_profile.get(key))}"
+        for key, _, label in BRAND_PROFILE_SECTIONS
+        if _section_text(brand_profile.get(key))
+    )
+
+
+# Read a profile back out of (possibly user-edited) markdown guidelines.
+# Returns None when the text doesn't follow the generated layout.
+def parse_brand_guidelines(content: str) -> dict[str, Any] | None:
+    headings = {heading.lower(): key for key, heading, _ in BRAND_PROFILE_SECTIONS}
+    list_keys = {"brand_voice", "color_palette", "typeface", "content_themes"}
+
+    sections: dict[str, list[str]] = {}
+    current: str | None = None
+    for line in content.splitlines():
+        if line.startswith("## "):
+            current = headings.get(line[3:].strip().lower())
+            if current:
+                sections[current] = []
+        elif current and line.strip():
+            sections[current].append(line.strip())
+
+    if "brand_voice" not in sections:
+        return None
+
+    profile: dict[str, Any] = {}
+    for key, _, _ in BRAND_PROFILE_SECTIONS:
+        text = " ".join(sections.get(key, []))
+        if key in list_keys:
+            profile[key] = [item.strip() for item in text.split(",") if item.strip()]
+        else:
+            profile[key] = text or None
+    return profile
+
+
+# Generate brand guidelines: the structured profile (merged with any uploaded
+# guidelines), its markdown rendering and the compact prompt context
+def generate_brand_guidelines(brand_profile: dict, uploaded_analysis: dict | None = None, fresh: bool = False) -> dict[str, Any]:
     try:
         if uploaded_analysis and "brand_voice" in uploaded_analysis:
-            brand_profile = merge_guidelines(brand_profile, uploaded_analysis)
+            brand_profile = merge_guidelines(brand_profile, uploaded_analysis, fresh)
 
         # Check if brand_profile is an error response
         if "success" in brand_profile and not brand_profile.get("success"):
-            error_msg = brand_profile.get("error", "Unknown error")
-            return f"Error generating brand guidelines: {error_msg}"
-        
+            return {
+                "success": False,
+                "message": "Error generating brand guidelines",
+                "error": brand_profile.get("error", "Unknown error")
+            }
+
         # Check if required keys exist
-        required_keys = ['brand_voice', 'color_palette',  'typeface', 'industry', 'target_audience', 'content_themes', 'posting_style']
-        missing_keys = [key for key in required_keys if key not in brand_profile]
-        
+        missing_keys = [key for key, _, _ in BRAND_PROFILE_SECTIONS if key not in brand_profile]
         if missing_keys:
-            return f"Error: Missing required brand profile data: {', '.join(missing_keys)}"
-        
-        guidelines: str = f"""
-# BRAND GUIDELINES
+            return {
+                "success": False,
+                "message": "Error generating brand guidelines",
+                "error": f"Missing required brand profile data: {', '.join(missing_keys)}"
+            }
 
-## Brand Voice
-{', '.join(brand_profile['brand_voice'])}
+        return {
+            "success": True,
+            "profile": brand_profile,
+            "content": render_brand_guidelines(brand_profile),
+            "promptContext": render_prompt_context(brand_profile),
+        }
+    except Exception as e:
+        print(f"Error in generate_brand_guidelines(): {str(e)}")
+        return {
+            "success": False,
+            "message": "Error generating brand guidelines",
+            "error": str(e)
+        }
 
-## Color Palette
-{', '.join(brand_profile['color_palette'])}
 
-## Typeface
-{', '.join(brand_profile['typeface'])}
+# =====================================================
+# GUIDELINES PIPELINE
+# =====================================================
+# Stages of the guidelines flow. Questionnaire analysis, PDF analysis and the PDF
+# upload don't depend on each other and run concurrently; the merge runs once
+# both profiles are in. Each stage's output is kept as an artifact with a hash
+# of its inputs, so a rerun only repeats the stages whose inputs changed.
+QUESTIONNAIRE_STAGE = "questionnaire"
+PDF_ANALYSIS_STAGE = "pdf_analysis"
+PDF_STORE_STAGE = "pdf_store"
+MERGE_STAGE = "merge"
 
-## Industry
-{brand_profile['industry']}
+# Changes whenever a prompt, the model or the profile schema changes, so
+# artifacts from an older setup are never reused
+GUIDELINES_PIPELINE_VERSION = hashlib.sha256(
+    "\n".join([
+        model.model_name,
+        BRAND_ANALYSIS_PROMPT,
+        BRAND_SECTION_UPDATE_PROMPT,
+        GUIDELINE_MERGING_PROMPT,
+        json.dumps(BrandAnalysisResponseFormat.model_json_schema(), sort_keys=True),
+    ]).encode()
+).hexdigest()[:16]
 
-## Target Audience
-{brand_profile['target_audience']}
 
-## Content Themes
-{', '.join(brand_profile['content_themes'])}
+def stage_input_hash(stage: str, inputs: Any) -> str:
+    payload = json.dumps(
+        {"stage": stage, "version": GUIDELINES_PIPELINE_VERSION, "inputs": inputs},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
 
-## Posting Style
-{brand_profile['posting_style']}"""
 
-        return guidelines
-    except Exception as e:
-        print(f"Error in generate_brand_guidelines(): {str(e)}")
-        return f"Error generating guidelines: {str(e)}"
+def make_artifact(stage: str, inputs: Any, output: Any) -> dict[str, Any]:
+    return {"inputHash": stage_input_hash(stage, inputs), "inputs": inputs, "output": output}
+
+
+# Inputs recorded with a stored artifact, or None when it was produced by an
+# older pipeline version (its hash no longer matches) or recorded none
+def artifact_inputs(stage: str, artifact: dict | None) -> Any:
+    if not artifact or artifact.get("inputs") is None:
+        return None
+    if artifact.get("inputHash") != stage_input_hash(stage, artifact["inputs"]):
+        return None
+    return artifact["inputs"]
+
+
+def _is_error(output: Any) -> bool:
+    return isinstance(output, dict) and output.get("success") is False
+
+
+# Merge the questionnaire profile with the uploaded analysis. When the uploaded
+# analysis is unchanged since the stored merge, only the sections that changed
+# in the questionnaire profile are re-merged. Returns (profile, mode, sections).
+def merge_incremental(
+    brand_profile: dict,
+    uploaded_analysis: dict,
+    previous: dict | None = None,
+    fresh: bool = False,
+) -> tuple[dict[str, Any], str, list[str]]:
+    previous_inputs = artifact_inputs(MERGE_STAGE, previous)
+    if fresh or not previous_inputs or _is_error(previous.get("output")):
+        return merge_guidelines(brand_profile, uploaded_analysis, fresh), "ran", []
+
+    previous_profile, previous_uploaded = previous_inputs
+    sections = changed_sections(previous_profile, brand_profile)
+    if previous_uploaded != uploaded_analysis or len(sections) > BRAND_PARTIAL_MAX_SECTIONS:
+        return merge_guidelines(brand_profile, uploaded_analysis, fresh), "ran", []
+    if not sections:
+        return previous["output"], "reused", []
+
+    return merge_guideline_sections(brand_profile, uploaded_analysis, previous["output"], sections, fresh), "partial", sections
+
+
+# Run the guidelines pipeline.
+#   questionnaire: questionnaire answers, or None to skip analysis and merge
+#   pdf_bytes: uploaded guidelines PDF, or None to reuse the stored PDF analysis
+#   store_pdf: uploads the PDF and returns its URL (runs alongside the analyses)
+#   pdf_filename: part of the upload's inputs (same file under a new name is stored again)
+#   artifacts: stored artifacts from the previous run, {stage: {"inputHash", "inputs", "output"}}
+# Returns the generated guidelines (when a questionnaire was given) plus
+# "uploadedAnalysis", "fileUrl", "stages" ({stage: "ran" | "partial" | "reused"}),
+# "regeneratedSections" (for partial stages) and "artifacts" (the stages that
+# produced new output, to be stored). Errors keep "artifacts" so the stages that
+# did succeed are not repeated on retry.
+@timed("guidelines_pipeline")
+def run_guidelines_pipeline(
+    questionnaire: dict | None,
+    pdf_bytes: bytes | None = None,
+    store_pdf: Callable[[], str] | None = None,
+    pdf_filename: str | None = None,
+    artifacts: dict[str, dict] | None = None,
+    fresh: bool = False,
+) -> dict[str, Any]:
+    previous = {} if fresh else dict(artifacts or {})
+    pdf_hash = hashlib.sha256(pdf_bytes).hexdigest() if pdf_bytes is not None else None
+
+    stage_inputs: dict[str, Any] = {}
+    if questionnaire is not None:
+        stage_inputs[QUESTIONNAIRE_STAGE] = questionnaire
+    if pdf_bytes is not None:
+        stage_inputs[PDF_ANALYSIS_STAGE] = pdf_hash
+        if store_pdf is not None:
+            stage_inputs[PDF_STORE_STAGE] = [pdf_hash, pdf_filename]
+
+    outputs: dict[str, Any] = {}
+    stages: dict[str, str] = {}
+    regenerated: dict[str, list[str]] = {}
+    new_artifacts: dict[str, dict] = {}
+
+    def run_questionnaire() -> dict:
+        profile, mode, sections = analyze_brand_incremental(questionnaire, previous.get(QUESTIONNAIRE_STAGE), fresh)
+        stages[QUESTIONNAIRE_STAGE] = mode
+        if sections:
+            regenerated[QUESTIONNAIRE_STAGE] = sections
+        return profile
+
+    run_stages = {
+        QUESTIONNAIRE_STAGE: run_questionnaire,
+        PDF_ANALYSIS_STAGE: lambda: analyze_guidelines_pdf(pdf_bytes, fresh),
+        PDF_STORE_STAGE: lambda: {"fileUrl": store_pdf()},
+    }
+
+    # Reuse every stage whose inputs are unchanged, run the rest concurrently
+    pending: list[str] = []
+    for stage, inputs in stage_inputs.items():
+        stored = previous.get(stage)
+        if stored and stored.get("inputHash") == stage_input_hash(stage, inputs):
+            outputs[stage] = stored["output"]
+            stages[stage] = "reused"
+        else:
+            pending.append(stage)
+
+    results = fan_out_settled(lambda stage: run_stages[stage](), pending, max_workers=len(pending) or 1)
+    errors: list[tuple[str, Any]] = []
+    for stage, result in zip(pending, results):
+        stages.setdefault(stage, "ran")
+        if isinstance(result, BaseException):
+            print(f"Guidelines pipeline stage {stage} failed: {result}")
+            errors.append((stage, str(result)))
+        elif _is_error(result):
+            errors.append((stage, result.get("error", "Unknown error")))
+        else:
+            outputs[stage] = result
+            new_artifacts[stage] = make_artifact(stage, stage_inputs[stage], result)
+
+    # Without a new PDF, merge with the analysis of the last uploaded one
+    uploaded_analysis = outputs.get(PDF_ANALYSIS_STAGE)
+    if pdf_bytes is None and artifacts and artifacts.get(PDF_ANALYSIS_STAGE):
+        uploaded_analysis = artifacts[PDF_ANALYSIS_STAGE]["output"]
+
+    result: dict[str, Any] = {
+        "uploadedAnalysis": uploaded_analysis,
+        "fileUrl": (outputs.get(PDF_STORE_STAGE) or {}).get("fileUrl"),
+        "stages": stages,
+        "regeneratedSections": regenerated,
+        "artifacts": new_artifacts,
+    }
+
+    # The upload runs alongside the analyses, so it may finish although the run
+    # fails; a failed run then neither records nor reports it (nothing is stored)
+    def failed(error: dict[str, Any]) -> dict[str, Any]:
+        new_artifacts.pop(PDF_STORE_STAGE, None)
+        return {**error, **result, "fileUrl": None}
+
+    if errors:
+        stage, error = errors[0]
+        return failed({
+            "success": False,
+            "message": f"Guidelines pipeline stage {stage} failed",
+            "error": error,
+            "stage": stage,
+        })
+
+    if questionnaire is None:
+        return {"success": True, **result}
+
+    brand_profile = outputs[QUESTIONNAIRE_STAGE]
+    if uploaded_analysis and "brand_voice" in uploaded_analysis:
+        merge_inputs = [brand_profile, uploaded_analysis]
+        stored = previous.get(MERGE_STAGE)
+        if stored and stored.get("inputHash") == stage_input_hash(MERGE_STAGE, merge_inputs):
+            brand_profile = stored["output"]
+            stages[MERGE_STAGE] = "reused"
+        else:
+            brand_profile, stages[MERGE_STAGE], sections = merge_incremental(brand_profile, uploaded_analysis, stored, fresh)
+            if sections:
+                regenerated[MERGE_STAGE] = sections
+            if not _is_error(brand_profile):
+                new_artifacts[MERGE_STAGE] = make_artifact(MERGE_STAGE, merge_inputs, brand_profile)
+
+    guidelines = generate_brand_guidelines(brand_profile)
+    if guidelines.get("success") is False:
+        new_artifacts.pop(MERGE_STAGE, None)
+        return failed({**guidelines, "stage": MERGE_STAGE})
+
+    return {
+        **guidelines,
+        "brandProfile": outputs[QUESTIONNAIRE_STAGE],
+        **result,
+    }
@@ -1,13 +1,20 @@
 from dotenv import load_dotenv
-from typing import Any
+from typing import Any, Callable
 import json
+import os
+import hashlib
 
 from pydantic import BaseModel, Field
-from langchain.agents import create_agent
-from langchain_community.utilities.dalle_image_generator import DallEAPIWrapper
 
 from agents.agentSetup import model, image_analysis_model, CAPTION_GEN_PROMPT, IMAGE_ANALYSIS_PROMPT, POST_IMAGE_PROMPT_GEN
 from agents.responseModels import ImageAnalysisResponseFormat
+from agents.fanOut import fan_out_settled, afan_out_settled
+from agents.responseCache import create_cached_agent
+from agents.rateLimiter import rate_limited, arate_limited, estimate_tokens
+from agents.analysisCompaction import compact_image_analyses, count_tokens
+from agents.lazyLoading import Lazy, lazy_import
+from metrics import timed
+from jsonCodec import loads as json_loads
 
 
 # Setup environment files
@@ -25,61 +32,70 @@ class ImagePromptResponseFormat(BaseModel):
     prompt: str = Field(description="Image generation prompt")
     aspect_ratio: str = Field(description="Aspect ration of the image to be generated")
 
+# Image analysis limits
+IMAGE_ANALYSIS_MAX_CONCURRENCY = int(os.getenv("IMAGE_ANALYSIS_MAX_CONCURRENCY", "4"))
+IMAGE_ANALYSIS_TIMEOUT = float(os.getenv("IMAGE_ANALYSIS_TIMEOUT", "90"))
+
+# Changes whenever the prompt, model or output schema changes, so cached analyses
+# from an older setup are never reused
+IMAGE_ANALYSIS_VERSION = hashlib.sha256(
+    "\n".join([
+        image_analysis_model.model_name,
+        IMAGE_ANALYSIS_PROMPT,
+        json.dumps(ImageAnalysisResponseFormat.model_json_schema(), sort_keys=True),
+    ]).encode()
+).hexdigest()[:16]
+
 # Define models
-post_caption_gen_agent = create_agent(
+image_analysis_structured_model = Lazy(
+    "image_analysis_structured_model",
+    lambda: image_analysis_model.get().with_structured_output(ImageAnalysisResponseFormat),
+)
+dalle_image_generator = lazy_import("langchain_community.utilities.dalle_image_generator")
+
+
+# SDK retries are off here too; the rate limiter retries
+def _async_openai_client() -> Any:
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(max_retries=0)
+
+
+# Not warmed: an async client built in the gunicorn master would be shared by every worker
+async_openai = Lazy("async_openai", _async_openai_client, warm=False)
+
+post_caption_gen_agent = create_cached_agent(
    model, 
    tools=[],
    system_prompt=CAPTION_GEN_PROMPT,
    response_format=CaptionResponseFormat,
+   name="post_caption_gen_agent",
 )
 
-post_image_prompt_gen_agent = create_agent(
+post_image_prompt_gen_agent = create_cached_agent(
    model, 
    tools=[],
    system_prompt=POST_IMAGE_PROMPT_GEN,
    response_format=ImagePromptResponseFormat,
+   name="post_image_prompt_gen_agent",
 )
 
 
-# Generate post caption
-def generate_caption(
-    brand_guidelines: str,
-    post_topic: str,
-    platform: str,
-    image_analysis: dict | list | None = None,
-) -> dict:
-    try:
-        # Build a human-readable summary of the reference image analyses
-        analysis_snippet = ""
-        if image_analysis:
-            try:
-                if isinstance(image_analysis, list):
-                    summary_parts: list[str] = []
-                    for idx, item in enumerate(image_analysis, start=1):
-                        if not isinstance(item, dict):
-                            continue
-                        meta = item.get("metadata", {}) or {}
-                        color_profile = item.get("color_profile", {}) or {}
-                        lighting = item.get("lighting", {}) or {}
-                        artistic = item.get("artistic_elements", {}) or {}
-                        summary_parts.append(
-                            f"Image {idx}: type={meta.get('image_type')}, "
-                            f"purpose={meta.get('primary_purpose')}, "
-                            f"palette={color_profile.get('color_palette')}, "
-                            f"lighting_mood={lighting.get('mood')}, "
-                            f"light_temperature={lighting.get('light_temperature')}, "
-                            f"style={artistic.get('visual_style')}, "
-                            f"atmosphere={artistic.get('atmosphere')}."
-                        )
-                    analysis_snippet = "\n".join(summary_parts)
-                elif isinstance(image_analysis, dict):
-                    meta = image_analysis.get("metadata", {}) or {}
-                    color_profile = image_analysis.get("color_profile", {}) or {}
-                    lighting = image_analysis.get("lighting", {}) or {}
-                    artistic = image_analysis.get("artistic_elements", {}) or {}
-                    analysis_snippet = (
-                        "Single reference image: "
-                        f"type={meta.get('image_type')}, "
+# Build a human-readable summary of the reference image analyses
+def summarize_image_analysis(image_analysis: dict | list | None) -> str:
+    analysis_snippet = ""
+    if image_analysis:
+        try:
+            if isinstance(image_analysis, list):
+                summary_parts: list[str] = []
+                for idx, item in enumerate(image_analysis, start=1):
+                    if not isinstance(item, dict):
+                        continue
+                    meta = item.get("metadata", {}) or {}
+                    color_profile = item.get("color_profile", {}) or {}
+                    lighting = item.get("lighting", {}) or {}
+                    artistic = item.get("artistic_elements", {}) or {}
+                    summary_parts.append(
+                        f"Image {idx}: type={meta.get('image_type')}, "
                         f"purpose={meta.get('primary_purpose')}, "
                         f"palette={color_profile.get('color_palette')}, "
                         f"lighting_mood={lighting.get('mood')}, "
@@ -87,36 +103,83 @@ def generate_caption(
                         f"style={artistic.get('visual_style')}, "
                         f"atmosphere={artistic.get('atmosphere')}."
                     )
-            except Exception:
-                analysis_snippet = ""
+                analysis_snippet = "\n".join(summary_parts)
+            elif isinstance(image_analysis, dict):
+                meta = image_analysis.get("metadata", {}) or {}
+                color_profile = image_analysis.get("color_profile", {}) or {}
+                lighting = image_analysis.get("lighting", {}) or {}
+                artistic = image_analysis.get("artistic_elements", {}) or {}
+                analysis_snippet = (
+                    "Single reference image: "
+                    f"type={meta.get('image_type')}, "
+                    f"purpose={meta.get('primary_purpose')}, "
+                    f"palette={color_profile.get('color_palette')}, "
+                    f"lighting_mood={lighting.get('mood')}, "
+                    f"light_temperature={lighting.get('light_temperature')}, "
+                    f"style={artistic.get('visual_style')}, "
+                    f"atmosphere={artistic.get('atmosphere')}."
+                )
+        except Exception:
+            analysis_snippet = ""
+    return analysis_snippet
+
+
+# Agent input for a post caption. Brand guidelines and image analysis come
+# before the per-post fields so batches share a prompt prefix (provider-side
+# prompt caching only applies to identical prefixes).
+def caption_agent_input(
+    brand_guidelines: str,
+    post_topic: str,
+    platform: str,
+    image_analysis: dict | list | None = None,
+) -> dict:
+    analysis_snippet = summarize_image_analysis(image_analysis)
+
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": f"""
+                    Use this information to create suitable social media content.
+
+                    Brand guidelines:
+                    {brand_guidelines}
+
+                    Reference image analysis (use this to align the caption with the visual style, subjects, mood, and composition of the images):
+                    {analysis_snippet}
+
+                    Platform:
+                    {platform}
+
+                    Post topic:
+                    {post_topic}
+                """
+            }
+        ]
+    }
+
 
+# Generate post caption
+@timed("generate_caption")
+def generate_caption(
+    brand_guidelines: str,
+    post_topic: str,
+    platform: str,
+    image_analysis: dict | list | None = None,
+    on_token: Callable[[str], None] | None = None,
+    fresh: bool = False,
+) -> dict:
+    try:
         # Invoke the agent
-        response = post_caption_gen_agent.invoke({
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""
-                        Use this information to create suitable social media content.
-
-                        Brand guidelines:
-                        {brand_guidelines}
-
-                        Platform:
-                        {platform}
-
-                        Post topic:
-                        {post_topic}
-
-                        Reference image analysis (use this to align the caption with the visual style, subjects, mood, and composition of the images):
-                        {analysis_snippet}
-                    """
-                }
-            ]
-        })
+        response = post_caption_gen_agent.invoke_structured(
+            caption_agent_input(brand_guidelines, post_topic, platform, image_analysis),
+            fresh,
+            on_token,
+        )
 
         # Return the required data
-        print(response["structured_response"].model_dump())
-        return response["structured_response"].model_dump()
+        print(response)
+        return response
     except Exception as e:
         print("Error generating post caption")
         return {
@@ -126,34 +189,74 @@ def generate_caption(
         }
 
 
+@timed("generate_caption")
+async def agenerate_caption(
+    brand_guidelines: str,
+    post_topic: str,
+    platform: str,
+    image_analysis: dict | list | None = None,
+    on_token: Callable[[str], None] | None = None,
+    fresh: bool = False,
+) -> dict:
+    try:
+        return await post_caption_gen_agent.ainvoke_structured(
+            caption_agent_input(brand_guidelines, post_topic, platform, image_analysis),
+            fresh,
+            on_token,
+        )
+    except Exception as e:
+        print("Error generating post caption")
+        return {
+            "success": False,
+            "message": "Error generating post caption",
+            "error": str(e)
+        }
+
+
+# Tokens every caption in a batch shares ahead of its topic and platform
+def shared_caption_prefix_tokens(brand_guidelines: str, image_analysis: dict | list | None = None) -> int:
+    return count_tokens(CAPTION_GEN_PROMPT + brand_guidelines + summarize_image_analysis(image_analysis))
+
+
+# Model input for analyzing the given images together
+def image_analysis_messages(public_image_urls: list[str]) -> list[dict]:
+    content: list[dict[str, Any]] = [{
+        "type": "text",
+        "text": IMAGE_ANALYSIS_PROMPT
+    }]
+
+    for url in public_image_urls:
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": url,
+                "detail": "high"
+            }
+        })
+
+    return [
+        {
+            "role": "user",
+            "content": content
+        }
+    ]
+
+
 # Analyze image
+@timed("analyze_images")
 def analyze_images(public_image_urls: list[str]) -> dict:
     try:
-        content: list[dict[str, Any]] = [{
-            "type": "text",
-            "text": IMAGE_ANALYSIS_PROMPT
-        }]
-
-        for url in public_image_urls:
-            content.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": url,
-                    "detail": "high"
-                }
-            })
-
-        structured_model = image_analysis_model.with_structured_output(ImageAnalysisResponseFormat)
-        response = structured_model.invoke([
-            {
-                "role": "user",
-                "content": content
-            }
-        ])
+        messages = image_analysis_messages(public_image_urls)
+        response = rate_limited(
+            image_analysis_model.model_name,
+            estimate_tokens(messages, max_tokens=image_analysis_model.max_tokens),
+            lambda: image_analysis_structured_model.get().invoke(messages),
+        )
 
         # Return the required data
-        print(response.model_dump())
-        return response.model_dump()
+        analysis = json_loads(response.model_dump_json())
+        print(analysis)
+        return analysis
     except Exception as e:
         print(f"Error analyzing images: {e}")
         return { 
@@ -163,66 +266,185 @@ def analyze_images(public_image_urls: list[str]) -> dict:
         }
 
 
+@timed("analyze_images")
+async def aanalyze_images(public_image_urls: list[str]) -> dict:
+    try:
+        messages = image_analysis_messages(public_image_urls)
+        response = await arate_limited(
+            image_analysis_model.model_name,
+            estimate_tokens(messages, max_tokens=image_analysis_model.max_tokens),
+            lambda: image_analysis_structured_model.get().ainvoke(messages),
+        )
+        return json_loads(response.model_dump_json())
+    except Exception as e:
+        print(f"Error analyzing images: {e}")
+        return {
+            "success" : False,
+            "message" : "Error analyzing images",
+            "error" : str(e)
+        }
+
+
+# Turn fan-out outcomes into one analysis (or error dict) per URL
+def _analysis_results(public_image_urls: list[str], outcomes: list) -> list[dict]:
+    analyses: list[dict] = []
+    for url, outcome in zip(public_image_urls, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"Error analyzing image {url}: {outcome}")
+            outcome = {
+                "success": False,
+                "message": "Error analyzing images",
+                "error": str(outcome),
+            }
+        analyses.append(outcome)
+
+    return analyses
+
+
+# Analyze each image separately and concurrently, one result per URL (in order).
+# Failed or timed-out images come back as error dicts so the rest still succeed.
+def analyze_images_batch(
+    public_image_urls: list[str],
+    max_concurrency: int = IMAGE_ANALYSIS_MAX_CONCURRENCY,
+    timeout: float = IMAGE_ANALYSIS_TIMEOUT,
+) -> list[dict]:
+    outcomes = fan_out_settled(
+        lambda url: analyze_images([url]),
+        public_image_urls,
+        max_workers=max_concurrency,
+        timeout=timeout,
+    )
+    return _analysis_results(public_image_urls, outcomes)
+
+
+async def aanalyze_images_batch(
+    public_image_urls: list[str],
+    max_concurrency: int = IMAGE_ANALYSIS_MAX_CONCURRENCY,
+    timeout: float = IMAGE_ANALYSIS_TIMEOUT,
+) -> list[dict]:
+    outcomes = await afan_out_settled(
+        lambda url: aanalyze_images([url]),
+        public_image_urls,
+        max_concurrency=max_concurrency,
+        timeout=timeout,
+    )
+    return _analysis_results(public_image_urls, outcomes)
+
+
+# Agent input for a DALL-E prompt (shared fields first, as for captions)
+def image_prompt_agent_input(
+    brand_guidelines: str,
+    caption_data: dict,
+    image_analysis: dict | list,
+    industry: str = "general business",
+) -> dict:
+    caption_text = caption_data.get('caption', '')
+
+    # Highest-value fields only, shared attributes written once, within a token budget
+    reference_images = compact_image_analyses(image_analysis)
+
+    return {
+        "messages": [
+            {
+                "role": "user",
+                "content": f"""
+                    Use the following information to create a DALL-E image prompt that matches the visual style and subjects of the reference images.
+
+                    Brand guidelines:
+                    {brand_guidelines}
+
+                    Platform industry:
+                    {industry}
+
+                    Reference image analysis (this describes the composition, color palette, lighting, technical style, mood, and subject details of the reference images; base the new image on this style so it looks like it came from the same shoot):
+                    {reference_images}
+
+                    Generated caption text:
+                    {caption_text}
+                """
+            }
+        ]
+    }
+
+
 # Generate image prompt
+@timed("generate_image_prompt")
 def generate_image_prompt(
     brand_guidelines: str,
     caption_data: dict,
-    image_analysis: dict | list
+    image_analysis: dict | list,
+    on_token: Callable[[str], None] | None = None,
+    fresh: bool = False,
+    industry: str = "general business",
 ) -> str:
     try:
-        caption_text = caption_data.get('caption', '')
-        industry = 'general business'
-        if 'Industry' in brand_guidelines:
-            try:
-                industry = brand_guidelines.split('Industry')[1].split('\n')[0].strip()
-            except Exception:
-                pass
-
         # Invoke the agent
-        response = post_image_prompt_gen_agent.invoke({
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""
-                        Use the following information to create a DALL-E image prompt that matches the visual style and subjects of the reference images.
-
-                        Brand guidelines:
-                        {brand_guidelines}
-
-                        Platform industry:
-                        {industry}
-
-                        Generated caption text:
-                        {caption_text}
-
-                        Reference image analysis (this describes the composition, color palette, lighting, technical style, mood, and subject details of each reference image; base the new image on this style so it looks like it came from the same shoot):
-                        {image_analysis}
-                    """
-                }
-            ]
-        })
+        response = post_image_prompt_gen_agent.invoke_structured(
+            image_prompt_agent_input(brand_guidelines, caption_data, image_analysis, industry),
+            fresh,
+            on_token,
+        )
 
         # Return the required data
-        print(response["structured_response"].prompt)
-        return response["structured_response"].prompt
+        print(response["prompt"])
+        return response["prompt"]
+    except Exception as e:
+        print(f"Error generating image prompt: {e}")
+        return f"Error generating image prompt: {e}"
+
+
+@timed("generate_image_prompt")
+async def agenerate_image_prompt(
+    brand_guidelines: str,
+    caption_data: dict,
+    image_analysis: dict | list,
+    on_token: Callable[[str], None] | None = None,
+    fresh: bool = False,
+    industry: str = "general business",
+) -> str:
+    try:
+        response = await post_image_prompt_gen_agent.ainvoke_structured(
+            image_prompt_agent_input(brand_guidelines, caption_data, image_analysis, industry),
+            fresh,
+            on_token,
+        )
+        return response["prompt"]
     except Exception as e:
         print(f"Error generating image prompt: {e}")
         return f"Error generating image prompt: {e}"
 
 
 # Generate image
+@timed("generate_image")
 def generate_image(image_prompt: str, size: str) -> str:
     try:
-        dalle = DallEAPIWrapper(
+        dalle = dalle_image_generator.get().DallEAPIWrapper(
             model="dall-e-3",
             size=size,
             n=1,
+            max_retries=0,
         )
 
-        url = dalle.run(image_prompt)
+        url = rate_limited(dalle.model_name, 0, lambda: dalle.run(image_prompt))
 
         print(url)
         return url
     except Exception as e:
         print(f"Error generating image: {e}")
         return f"Error generating image: {e}"
+
+
+@timed("generate_image")
+async def agenerate_image(image_prompt: str, size: str) -> str:
+    try:
+        client = async_openai.get()
+        response = await arate_limited("dall-e-3", 0, lambda: client.images.generate(
+            model="dall-e-3",
+            prompt=image_prompt,
+            size=size,
+            n=1,
+        ))
+        return response.data[0].url
+    except Exception as e:
+        print(f"Error generating image: {e}")
+        return f"Error generating image: {e}"
@@ -0,0 +1,190 @@
+import os
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, FIRST_EXCEPTION, wait
+from typing import Any, Awaitable, Callable, Iterable, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# Upper bound on concurrent LLM chains per request
+FAN_OUT_MAX_WORKERS = int(os.getenv("FAN_OUT_MAX_WORKERS", "4"))
+
+
+class FanOutCancelled(Exception):
+    pass
+
+
+# Hard failure of one item; cancels the rest of the fan-out
+class FanOutError(Exception):
+    def __init__(self, item: Any, message: str):
+        super().__init__(message)
+        self.item = item
+        self.message = message
+
+
+# Shared between sibling tasks so a chain can stop between steps
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self._event.is_set():
+            raise FanOutCancelled()
+
+
+# Run `fn(item, token)` for every item concurrently and return results in input order
+def fan_out(
+    fn: Callable[[T, CancelToken], R],
+    items: Iterable[T],
+    max_workers: int = FAN_OUT_MAX_WORKERS,
+) -> list[R]:
+    items = list(items)
+    if not items:
+        return []
+
+    token = CancelToken()
+
+    # Nothing to overlap, skip the pool
+    if len(items) == 1 or max_workers <= 1:
+        return [fn(item, token) for item in items]
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+    try:
+        futures = [executor.submit(fn, item, token) for item in items]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+
+        # Surface the first hard failure (in input order) and cancel siblings
+        for future in futures:
+            if future in done and not future.cancelled() and future.exception() is not None:
+                token.cancel()
+                for f in futures:
+                    f.cancel()
+                raise future.exception()
+
+        return [future.result() for future in futures]
+    finally:
+        # Don't block the request on siblings that are already mid-call
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Run `fn(item)` for every item concurrently, never failing as a whole.
+# Each slot in the returned list is either the result or the exception raised
+# (`TimeoutError` once an item has been running longer than `timeout` seconds).
+def fan_out_settled(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = FAN_OUT_MAX_WORKERS,
+    timeout: float | None = None,
+) -> list[R | BaseException]:
+    items = list(items)
+    if not items:
+        return []
+
+    started: dict[int, float] = {}
+
+    def run(index: int, item: T) -> R:
+        started[index] = time.monotonic()
+        return fn(item)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))))
+    try:
+        futures = [executor.submit(run, i, item) for i, item in enumerate(items)]
+        results: list[Any] = [None] * len(items)
+        pending = set(range(len(items)))
+
+        while pending:
+            now = time.monotonic()
+            next_deadline: float | None = None
+
+            for i in list(pending):
+                future = futures[i]
+                if future.done():
+                    error = future.exception()
+                    results[i] = error if error is not None else future.result()
+                    pending.discard(i)
+                elif timeout is not None and i in started:
+                    deadline = started[i] + timeout
+                    if now >= deadline:
+                        future.cancel()
+                        results[i] = TimeoutError(f"Timed out after {timeout:g}s")
+                        pending.discard(i)
+                    elif next_deadline is None or deadline < next_deadline:
+                        next_deadline = deadline
+
+            if pending:
+                # Wake on the next completion or the nearest deadline; queued
+                # items have no start time yet so poll for them too
+                wait_for = None if timeout is None else 0.05
+                if next_deadline is not None:
+                    wait_for = max(0.0, min(wait_for, next_deadline - now))
+                wait([futures[i] for i in pending], timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        return results
+    finally:
+        # Timed-out calls finish in the background instead of holding the request
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# =====================================================
+# ASYNC (asgiApp.py)
+# =====================================================
+# asyncio version of `fan_out`: await `fn(item)` for every item, at most
+# `max_concurrency` at a time, results in input order. The first failure
+# cancels the siblings that are still running.
+async def afan_out(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    max_concurrency: int = FAN_OUT_MAX_WORKERS,
+) -> list[R]:
+    items = list(items)
+    if not items:
+        return []
+
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(item: T) -> R:
+        async with slots:
+            return await fn(item)
+
+    tasks = [asyncio.ensure_future(run(item)) for item in items]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+
+        # Surface the first hard failure (in input order)
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+        return [task.result() for task in tasks]
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# asyncio version of `fan_out_settled`: each slot is the result or the exception
+# raised (`TimeoutError` once an item has been running longer than `timeout` seconds)
+async def afan_out_settled(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    max_concurrency: int = FAN_OUT_MAX_WORKERS,
+    timeout: float | None = None,
+) -> list[R | BaseException]:
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(item: T) -> R:
+        async with slots:
+            try:
+                return await asyncio.wait_for(fn(item), timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"Timed out after {timeout:g}s")
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
@@ -0,0 +1,76 @@
+import time
+import importlib
+import threading
+from typing import Any, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+
+# Heavy SDKs (openai/langchain, pdfplumber, cloudinary) and the agent graphs are
+# built on first use rather than at import, so a process or gunicorn worker
+# boots quickly. Every Lazy registers itself, and `warm_up` builds them all up
+# front, e.g. in the gunicorn master before it forks (see gunicorn.conf.py).
+_registry: list["Lazy"] = []
+_registry_lock = threading.Lock()
+
+
+class Lazy(Generic[T]):
+    # `warm=False` keeps a value out of `warm_up` (e.g. clients that must not be shared across a fork)
+    def __init__(self, name: str, factory: Callable[[], T], warm: bool = True):
+        self.name = name
+        self.warm = warm
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value: T | None = None
+        self._built = False
+        with _registry_lock:
+            _registry.append(self)
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    # Build on first call; concurrent first callers wait for the one build
+    def get(self) -> T:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._value = self._factory()
+                    self._built = True
+        return self._value
+
+    # Replace the value (benchmarks install fakes this way)
+    def set(self, value: T) -> None:
+        with self._lock:
+            self._value = value
+            self._built = True
+
+
+def lazy_import(module: str, warm: bool = True) -> Lazy[Any]:
+    return Lazy(module, lambda: importlib.import_module(module), warm)
+
+
+# Build every registered value that isn't built yet; returns seconds per value.
+# Failures are reported and skipped: the value is built (or fails) on first use instead.
+def warm_up() -> dict[str, float]:
+    timings: dict[str, float] = {}
+    attempted: set[int] = set()
+    while True:
+        with _registry_lock:
+            pending = [lazy for lazy in _registry if lazy.warm and not lazy.built and id(lazy) not in attempted]
+        if not pending:
+            return timings
+
+        for lazy in pending:
+            attempted.add(id(lazy))
+            started = time.perf_counter()
+            try:
+                lazy.get()
+            except Exception as e:
+                print(f"Warm-up of {lazy.name} failed: {e}")
+                continue
+            timings[lazy.name] = round(time.perf_counter() - started, 4)
+
+
+def lazy_stats() -> dict[str, bool]:
+    with _registry_lock:
+        return {lazy.name: lazy.built for lazy in _registry}
@@ -0,0 +1,148 @@
+import os
+import io
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from agents.responseCache import ResponseCache, MemoryTier, PostgresTier, LLM_CACHE_TIERS
+from agents.lazyLoading import lazy_import
+from metrics import timed
+
+
+# Extraction settings
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Documents with fewer pages are extracted in-process (pool overhead isn't worth it)
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+# Budget for text sent to the brand analysis agent
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "80"))
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "60000"))
+
+pdfplumber = lazy_import("pdfplumber")
+
+# Extracted pages keyed by file hash (memory, plus Postgres when enabled)
+pdf_text_cache = ResponseCache(
+    [MemoryTier(max_entries=32)]
+    + ([PostgresTier(table="pdf_text_cache")] if "postgres" in LLM_CACHE_TIERS else []),
+    name="pdf_text",
+)
+
+_pool: ProcessPoolExecutor | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                # Spawned workers don't inherit the API's threads, sockets or locks
+                _pool = ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                _pool_pid = pid
+    return _pool
+
+
+# Runs in a worker process: extract text from the given 1-based page numbers
+def _extract_pages(path: str, page_numbers: list[int]) -> list[str]:
+    with pdfplumber.get().open(path, pages=page_numbers) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+# Pick at most `limit` page numbers spread evenly over the document
+def select_pages(page_count: int, limit: int = PDF_MAX_PAGES) -> list[int]:
+    if page_count <= limit:
+        return list(range(1, page_count + 1))
+    step = page_count / limit
+    return sorted({int(i * step) + 1 for i in range(limit)})
+
+
+# Returns (text of the selected pages, total page count)
+def extract_pdf_pages(
+    file_bytes: bytes,
+    max_pages: int = PDF_MAX_PAGES,
+    workers: int = PDF_EXTRACT_WORKERS,
+) -> tuple[list[str], int]:
+    with pdfplumber.get().open(io.BytesIO(file_bytes)) as pdf:
+        page_count = len(pdf.pages)
+
+        page_numbers = select_pages(page_count, max_pages)
+        if workers <= 1 or len(page_numbers) < PDF_PARALLEL_MIN_PAGES:
+            return [pdf.pages[n - 1].extract_text() or "" for n in page_numbers], page_count
+
+    # One contiguous chunk of pages per worker
+    chunk_size = -(-len(page_numbers) // workers)
+    chunks = [page_numbers[i:i + chunk_size] for i in range(0, len(page_numbers), chunk_size)]
+
+    # Workers read the document from a temp file, so only its path is pickled per chunk
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(file_bytes)
+    try:
+        pages: list[str] = []
+        for chunk_pages in _get_pool().map(_extract_pages, [tmp.name] * len(chunks), chunks):
+            pages.extend(chunk_pages)
+    finally:
+        os.unlink(tmp.name)
+    return pages, page_count
+
+
+# Drop headers/footers repeated on most pages and blank lines
+def condense_pages(pages: list[str]) -> list[str]:
+    page_lines = [[line.strip() for line in page.splitlines() if line.strip()] for page in pages]
+
+    if len(page_lines) > 2:
+        counts: dict[str, int] = {}
+        for lines in page_lines:
+            for line in set(lines):
+                counts[line] = counts.get(line, 0) + 1
+        repeated = {line for line, count in counts.items() if count > len(page_lines) / 2}
+        page_lines = [[line for line in lines if line not in repeated] for lines in page_lines]
+
+    return ["\n".join(lines) for lines in page_lines if lines]
+
+
+# Give every page an equal share of `max_chars` so the whole document stays
+# represented; pages shorter than their share pass the leftover on
+def fit_to_budget(texts: list[str], max_chars: int = PDF_MAX_CHARS) -> str:
+    separators = max(0, len(texts) - 1) * 2
+    if sum(len(t) for t in texts) + separators <= max_chars:
+        return "\n\n".join(texts)
+
+    remaining_budget = max(0, max_chars - separators)
+    shares: dict[int, int] = {}
+    pending = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for n, i in enumerate(pending):
+        shares[i] = min(len(texts[i]), remaining_budget // (len(pending) - n))
+        remaining_budget -= shares[i]
+
+    return "\n\n".join(texts[i][:shares[i]] for i in range(len(texts)) if shares[i])
+
+
+# Extract (or reuse) a PDF's text and fit it to the analysis budget
+@timed("pdf_extraction")
+def extract_pdf_text(file_bytes: bytes, max_chars: int = PDF_MAX_CHARS) -> dict[str, Any]:
+    key = f"{hashlib.sha256(file_bytes).hexdigest()}:{PDF_MAX_PAGES}"
+
+    extracted = pdf_text_cache.get(key)
+    if extracted is None:
+        pages, page_count = extract_pdf_pages(file_bytes)
+        extracted = {"pages": pages, "pageCount": page_count}
+        pdf_text_cache.set(key, extracted)
+
+    texts = condense_pages(extracted["pages"])
+    text = fit_to_budget(texts, max_chars)
+    sampled = extracted["pageCount"] > len(extracted["pages"])
+
+    return {
+        "text": text,
+        "pageCount": extracted["pageCount"],
+        "pagesUsed": len(extracted["pages"]),
+        "truncated": sampled or text != "\n\n".join(texts),
+    }
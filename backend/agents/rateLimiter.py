@@ -0,0 +1,440 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+from metrics import count_llm_call
+
+R = TypeVar("R")
+
+
+# Limiter settings
+# Per-model budgets, "model=rpm/tpm" comma separated (tpm 0 = requests only)
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "gpt-4o-mini=500/200000,dall-e-3=5/0")
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", "500"))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", "200000"))
+# "memory" limits each process on its own; "postgres" shares the budget across workers
+LLM_RATE_LIMIT_BACKEND = os.getenv("LLM_RATE_LIMIT_BACKEND", "memory")
+# Share of each budget that batch work leaves for interactive requests
+LLM_BATCH_HEADROOM = float(os.getenv("LLM_BATCH_HEADROOM", "0.2"))
+# Extra attempts after the provider answers 429 or fails transiently (the
+# OpenAI clients are built with max_retries=0, so these are the only retries)
+LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+LLM_RATE_LIMIT_BACKOFF = float(os.getenv("LLM_RATE_LIMIT_BACKOFF", "2"))
+
+# Token estimates used to reserve TPM budget before a call
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "800"))
+IMAGE_INPUT_TOKEN_ESTIMATE = 1105
+
+# Priority classes
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+_priority: ContextVar[str] = ContextVar("llm_priority", default=INTERACTIVE)
+
+
+# Run LLM calls made inside the block at the given priority (this thread / task only)
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+# Rough prompt size (~4 characters per token) plus the expected completion
+def estimate_tokens(messages: list[dict], system_prompt: str = "", max_tokens: int | None = None) -> int:
+    chars = len(system_prompt)
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    chars += len(part.get("text") or "")
+                elif part.get("type") == "image_url":
+                    images += 1
+    return chars // 4 + images * IMAGE_INPUT_TOKEN_ESTIMATE + (max_tokens or COMPLETION_TOKEN_ESTIMATE)
+
+
+# Token usage reported by the messages in an agent's final state
+def usage_tokens(state: dict) -> int | None:
+    total = 0
+    found = False
+    for message in state.get("messages") or []:
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            total += usage.get("total_tokens", 0)
+            found = True
+    return total if found else None
+
+
+# =====================================================
+# BUCKETS
+# =====================================================
+# Both bucket types work by reservation: `reserve` takes `amount` immediately
+# (the balance may go negative) and returns how long the caller must wait for
+# it to be covered. With a `floor`, the reservation is only made if the balance
+# stays at or above it; otherwise nothing is taken and the wait is how long
+# until it would be.
+class MemoryBucket:
+    def __init__(self, key: str, per_minute: int):
+        self.key = key
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self._balance = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float, floor: float | None = None) -> tuple[bool, float]:
+        with self._lock:
+            now = time.monotonic()
+            balance = min(self.capacity, self._balance + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            if floor is not None and balance - amount < floor:
+                self._balance = balance
+                return False, (amount + floor - balance) / self.rate
+
+            self._balance = balance - amount
+            return True, max(0.0, -self._balance / self.rate)
+
+    # Empty the bucket so nothing is granted for the next `seconds`
+    def drain(self, seconds: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            balance = min(self.capacity, self._balance + (now - self._updated_at) * self.rate)
+            self._balance = min(balance, -seconds * self.rate)
+            self._updated_at = now
+
+
+# One row per bucket in `llm_rate_buckets`; refill and reservation happen in a
+# single statement under the row lock, timed by the database clock
+class PostgresBucket:
+    def __init__(self, key: str, per_minute: int):
+        self.key = key
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self._created = False
+
+    def reserve(self, amount: float, floor: float | None = None) -> tuple[bool, float]:
+        from databaseConnection import db_connection
+
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                if not self._created:
+                    cursor.execute(
+                        """
+                        INSERT INTO llm_rate_buckets (bucket_key, tokens)
+                        VALUES (%s, %s)
+                        ON CONFLICT (bucket_key) DO NOTHING;
+                        """,
+                        (self.key, self.capacity),
+                    )
+                cursor.execute(
+                    """
+                    WITH current AS (
+                        SELECT LEAST(%(capacity)s, tokens + %(rate)s * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)) AS balance
+                        FROM llm_rate_buckets
+                        WHERE bucket_key = %(key)s
+                        FOR UPDATE
+                    )
+                    UPDATE llm_rate_buckets b SET
+                        tokens = CASE
+                            WHEN %(floor)s::float8 IS NULL OR c.balance - %(amount)s >= %(floor)s::float8
+                            THEN c.balance - %(amount)s
+                            ELSE c.balance
+                        END,
+                        updated_at = clock_timestamp()
+                    FROM current c
+                    WHERE b.bucket_key = %(key)s
+                    RETURNING c.balance;
+                    """,
+                    {"key": self.key, "capacity": self.capacity, "rate": self.rate, "amount": amount, "floor": floor},
+                )
+                balance = float(cursor.fetchone()[0])
+            conn.commit()
+        self._created = True
+
+        if floor is not None and balance - amount < floor:
+            return False, (amount + floor - balance) / self.rate
+        return True, max(0.0, (amount - balance) / self.rate)
+
+    def drain(self, seconds: float) -> None:
+        from databaseConnection import db_connection
+
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE llm_rate_buckets SET
+                        tokens = LEAST(
+                            LEAST(%(capacity)s, tokens + %(rate)s * EXTRACT(EPOCH FROM clock_timestamp() - updated_at)),
+                            -%(seconds)s * %(rate)s
+                        ),
+                        updated_at = clock_timestamp()
+                    WHERE bucket_key = %(key)s;
+                    """,
+                    {"key": self.key, "capacity": self.capacity, "rate": self.rate, "seconds": seconds},
+                )
+            conn.commit()
+
+
+BUCKET_TYPES = {"memory": MemoryBucket, "postgres": PostgresBucket}
+
+
+# =====================================================
+# LIMITERS
+# =====================================================
+# Spread out callers woken for the same refill
+def _jitter(delay: float) -> float:
+    return delay + random.uniform(0, min(1.0, delay * 0.25))
+
+
+# Requests-per-minute and tokens-per-minute budget for one model
+class ModelLimiter:
+    def __init__(self, model: str, rpm: int, tpm: int, backend: str = LLM_RATE_LIMIT_BACKEND):
+        bucket_type = BUCKET_TYPES[backend]
+        self.model = model
+        # Bucket calls do I/O (async callers run them in a thread)
+        self.blocking = backend != "memory"
+        self.requests = bucket_type(f"{model}:rpm", rpm)
+        self.tokens = bucket_type(f"{model}:tpm", tpm) if tpm > 0 else None
+
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = {"calls": 0, "waits": 0, "waitSeconds": 0.0, "rateLimited": 0}
+
+    def _count(self, counter: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[counter] += amount
+
+    # Returns (seconds to sleep before retrying, seconds to sleep before calling);
+    # exactly one is None
+    def _try_reserve(self, tokens: int, priority: str) -> tuple[float | None, float | None]:
+        batch = priority == BATCH
+        floor_requests = self.requests.capacity * LLM_BATCH_HEADROOM if batch else None
+        granted, wait_requests = self.requests.reserve(1, floor_requests)
+        if not granted:
+            return wait_requests, None
+
+        wait_tokens = 0.0
+        if self.tokens:
+            floor_tokens = self.tokens.capacity * LLM_BATCH_HEADROOM if batch else None
+            # Never ask for more than the bucket can hold
+            amount = min(tokens, self.tokens.capacity - (floor_tokens or 0))
+            granted, wait_tokens = self.tokens.reserve(amount, floor_tokens)
+            if not granted:
+                self.requests.reserve(-1)
+                return wait_tokens, None
+
+        return None, max(wait_requests, wait_tokens)
+
+    # Block until the call fits the budget. Interactive callers reserve straight
+    # away and wait their turn; batch callers only reserve while the budget is
+    # above the interactive headroom.
+    def acquire(self, tokens: int, priority: str | None = None) -> None:
+        priority = priority or current_priority()
+        waited = 0.0
+        while True:
+            retry_in, delay = self._try_reserve(tokens, priority)
+            sleep_for = _jitter(retry_in if retry_in is not None else delay)
+            if sleep_for > 0:
+                time.sleep(sleep_for)
+                waited += sleep_for
+            if retry_in is None:
+                break
+        self._finished_acquire(waited)
+
+    async def aacquire(self, tokens: int, priority: str | None = None) -> None:
+        priority = priority or current_priority()
+        waited = 0.0
+        while True:
+            if self.blocking:
+                retry_in, delay = await asyncio.to_thread(self._try_reserve, tokens, priority)
+            else:
+                retry_in, delay = self._try_reserve(tokens, priority)
+            sleep_for = _jitter(retry_in if retry_in is not None else delay)
+            if sleep_for > 0:
+                await asyncio.sleep(sleep_for)
+                waited += sleep_for
+            if retry_in is None:
+                break
+        self._finished_acquire(waited)
+
+    def _finished_acquire(self, waited: float) -> None:
+        self._count("calls")
+        if waited:
+            self._count("waits")
+            self._count("waitSeconds", waited)
+
+    # Charge (or refund) the difference between the estimate and actual usage
+    def settle(self, estimated: int, actual: int | None) -> None:
+        if self.tokens and actual is not None:
+            try:
+                self.tokens.reserve(actual - min(estimated, self.tokens.capacity))
+            except Exception as e:
+                print(f"Error settling {self.model} token budget: {e}")
+
+    # After a 429, empty the request bucket so every caller of this model
+    # backs off together (then trickles back) instead of retrying in lockstep
+    def penalize(self, seconds: float) -> None:
+        self._count("rateLimited")
+        try:
+            self.requests.drain(seconds)
+        except Exception as e:
+            print(f"Error penalizing {self.model} request budget: {e}")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats: dict[str, Any] = dict(self._counters)
+        stats["waitSeconds"] = round(stats["waitSeconds"], 3)
+        stats["rpm"] = int(self.requests.capacity)
+        stats["tpm"] = int(self.tokens.capacity) if self.tokens else 0
+        return stats
+
+
+def _parse_limits(spec: str) -> dict[str, tuple[int, int]]:
+    limits: dict[str, tuple[int, int]] = {}
+    for entry in spec.split(","):
+        if "=" not in entry:
+            continue
+        model, budget = entry.split("=", 1)
+        rpm, _, tpm = budget.partition("/")
+        limits[model.strip()] = (int(rpm), int(tpm or 0))
+    return limits
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, tuple[int, int]] | None = None, backend: str = LLM_RATE_LIMIT_BACKEND):
+        self.limits = _parse_limits(LLM_RATE_LIMITS) if limits is None else limits
+        self.backend = backend
+        self._limiters: dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str | None) -> ModelLimiter:
+        model = model or "default"
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(model)
+                if limiter is None:
+                    rpm, tpm = self.limits.get(model, (LLM_DEFAULT_RPM, LLM_DEFAULT_TPM))
+                    limiter = self._limiters[model] = ModelLimiter(model, rpm, tpm, self.backend)
+        return limiter
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": self.backend, "models": {m: l.stats() for m, l in list(self._limiters.items())}}
+
+
+rate_limiter = RateLimiter()
+
+
+# Checked via sys.modules so this module doesn't import the openai SDK: an
+# error can only be an openai.RateLimitError once the SDK has been loaded
+def _is_rate_limit(error: Exception) -> bool:
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, openai.RateLimitError)
+
+
+# Connection errors, timeouts and 5xx answers are worth another attempt
+def _is_transient(error: Exception) -> bool:
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, (openai.APIConnectionError, openai.InternalServerError))
+
+
+def _retry_after(error: Any, attempt: int) -> float:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return LLM_RATE_LIMIT_BACKOFF * (2 ** attempt)
+
+
+# Run `call()` within `model`'s budget, backing off together with every other
+# caller of the model when the provider still answers 429. Transient errors are
+# retried after a backoff; every attempt takes from the budget.
+# `usage(result)` returns the tokens actually used, when known.
+# `can_retry()` returning False stops retries (e.g. output was already streamed).
+def rate_limited(
+    model: str | None,
+    tokens: int,
+    call: Callable[[], R],
+    usage: Callable[[R], int | None] | None = None,
+    priority: str | None = None,
+    can_retry: Callable[[], bool] | None = None,
+) -> R:
+    limiter = rate_limiter.for_model(model)
+    attempt = 0
+    while True:
+        limiter.acquire(tokens, priority)
+        try:
+            result = call()
+        except Exception as e:
+            rate_limit = _is_rate_limit(e)
+            count_llm_call(model, "rate_limited" if rate_limit else "error")
+            if attempt >= LLM_RATE_LIMIT_RETRIES or not (rate_limit or _is_transient(e)):
+                raise
+            if can_retry is not None and not can_retry():
+                raise
+            if rate_limit:
+                limiter.penalize(_retry_after(e, attempt))
+            else:
+                time.sleep(_jitter(LLM_RATE_LIMIT_BACKOFF * (2 ** attempt)))
+            attempt += 1
+            continue
+        actual = usage(result) if usage else None
+        if usage:
+            limiter.settle(tokens, actual)
+        count_llm_call(model, "ok", actual if actual is not None else tokens, reported=actual is not None)
+        return result
+
+
+async def arate_limited(
+    model: str | None,
+    tokens: int,
+    call: Callable[[], Awaitable[R]],
+    usage: Callable[[R], int | None] | None = None,
+    priority: str | None = None,
+    can_retry: Callable[[], bool] | None = None,
+) -> R:
+    limiter = rate_limiter.for_model(model)
+    attempt = 0
+    while True:
+        await limiter.aacquire(tokens, priority)
+        try:
+            result = await call()
+        except Exception as e:
+            rate_limit = _is_rate_limit(e)
+            count_llm_call(model, "rate_limited" if rate_limit else "error")
+            if attempt >= LLM_RATE_LIMIT_RETRIES or not (rate_limit or _is_transient(e)):
+                raise
+            if can_retry is not None and not can_retry():
+                raise
+            if rate_limit:
+                await _maybe_in_thread(limiter, limiter.penalize, _retry_after(e, attempt))
+            else:
+                await asyncio.sleep(_jitter(LLM_RATE_LIMIT_BACKOFF * (2 ** attempt)))
+            attempt += 1
+            continue
+        actual = usage(result) if usage else None
+        if usage:
+            await _maybe_in_thread(limiter, limiter.settle, tokens, actual)
+        count_llm_call(model, "ok", actual if actual is not None else tokens, reported=actual is not None)
+        return result
+
+
+async def _maybe_in_thread(limiter: ModelLimiter, fn: Callable, *args: Any) -> Any:
+    if limiter.blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
@@ -0,0 +1,403 @@
+import os
+import asyncio
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+from pydantic import BaseModel
+
+from agents.rateLimiter import rate_limited, arate_limited, estimate_tokens, usage_tokens
+from agents.lazyLoading import Lazy
+from metrics import count_cache
+from jsonCodec import clone, dumps as json_dumps, loads as json_loads
+
+
+# Cache settings
+LLM_CACHE_TIERS = [t.strip() for t in os.getenv("LLM_CACHE_TIERS", "memory,postgres").split(",") if t.strip()]
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_TTL_HOURS = int(os.getenv("LLM_CACHE_TTL_HOURS", "168"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "100000"))
+# Postgres tiers evict expired and least recently used rows on every Nth write (per process)
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "100"))
+
+
+# =====================================================
+# TIERS
+# =====================================================
+class MemoryTier:
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries: int = LLM_CACHE_MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PostgresTier:
+    name = "postgres"
+    blocking = True
+
+    # `table` must have the llm_response_cache columns (see schema.sql)
+    def __init__(
+        self,
+        ttl_hours: int = LLM_CACHE_TTL_HOURS,
+        table: str = "llm_response_cache",
+        max_rows: int = LLM_CACHE_MAX_ROWS,
+        evict_every: int = LLM_CACHE_EVICT_EVERY,
+    ):
+        self.ttl_hours = ttl_hours
+        self.table = table
+        self.max_rows = max_rows
+        self.evict_every = max(evict_every, 1)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    # The first write of each process evicts too, so rarely written tables are still trimmed
+    def _eviction_due(self) -> bool:
+        with self._lock:
+            due = self._writes % self.evict_every == 0
+            self._writes += 1
+        return due
+
+    def get(self, key: str) -> dict | None:
+        from databaseConnection import db_connection
+
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE {self.table}
+                    SET last_used_at = NOW(), hits = hits + 1
+                    WHERE cache_key = %s
+                      AND created_at > NOW() - make_interval(hours => %s)
+                    RETURNING response;
+                    """,
+                    (key, self.ttl_hours),
+                )
+                row = cursor.fetchone()
+            conn.commit()
+        return row[0] if row else None
+
+    def set(self, key: str, value: dict) -> None:
+        from databaseConnection import db_connection
+
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {self.table} (cache_key, response)
+                    VALUES (%s, %s::jsonb)
+                    ON CONFLICT (cache_key) DO UPDATE SET
+                        response = EXCLUDED.response,
+                        created_at = NOW(),
+                        last_used_at = NOW();
+                    """,
+                    (key, json_dumps(value)),
+                )
+
+                if self._eviction_due():
+                    cursor.execute(
+                        f"""
+                        DELETE FROM {self.table}
+                        WHERE created_at <= NOW() - make_interval(hours => %s)
+                           OR cache_key IN (
+                               SELECT cache_key FROM {self.table}
+                               ORDER BY last_used_at DESC
+                               OFFSET %s
+                           );
+                        """,
+                        (self.ttl_hours, self.max_rows),
+                    )
+                    count_cache(self.table, "evicted", cursor.rowcount)
+            conn.commit()
+
+
+TIER_TYPES = {"memory": MemoryTier, "postgres": PostgresTier}
+
+
+# =====================================================
+# CACHE
+# =====================================================
+class ResponseCache:
+    def __init__(self, tiers: list, name: str = "llm"):
+        self.tiers = tiers
+        self.name = name
+        # Whether lookups can block on I/O (async callers run them in a thread)
+        self.blocking = any(getattr(tier, "blocking", True) for tier in tiers)
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = {"misses": 0, "writes": 0, "errors": 0, "bypassed": 0}
+        for tier in tiers:
+            self._counters[f"{tier.name}Hits"] = 0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+        count_cache(self.name, counter)
+
+    def get(self, key: str) -> dict | None:
+        for i, tier in enumerate(self.tiers):
+            try:
+                value = tier.get(key)
+            except Exception as e:
+                print(f"Error reading {tier.name} LLM cache: {e}")
+                self._count("errors")
+                continue
+
+            if value is not None:
+                self._count(f"{tier.name}Hits")
+                # Backfill faster tiers
+                for faster in self.tiers[:i]:
+                    try:
+                        faster.set(key, value)
+                    except Exception:
+                        pass
+                return value
+
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: dict) -> None:
+        self._count("writes")
+        for tier in self.tiers:
+            try:
+                tier.set(key, value)
+            except Exception as e:
+                print(f"Error writing {tier.name} LLM cache: {e}")
+                self._count("errors")
+
+    def bypassed(self) -> None:
+        self._count("bypassed")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            stats: dict[str, Any] = dict(self._counters)
+        hits = sum(v for k, v in stats.items() if k.endswith("Hits"))
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hitRate"] = round(hits / lookups, 4) if lookups else 0.0
+        stats["tiers"] = [tier.name for tier in self.tiers]
+        return stats
+
+
+response_cache = ResponseCache([TIER_TYPES[name]() for name in LLM_CACHE_TIERS if name in TIER_TYPES])
+
+
+def _normalize_content(content: Any) -> Any:
+    # Prompts are indented f-strings; whitespace differences shouldn't miss the cache
+    if isinstance(content, str):
+        return " ".join(content.split())
+    if isinstance(content, list):
+        return [_normalize_content(part) for part in content]
+    if isinstance(content, dict):
+        return {k: _normalize_content(v) for k, v in content.items()}
+    return content
+
+
+def make_cache_key(system_prompt: str, messages: list[dict], model_params: dict, response_format: type[BaseModel]) -> str:
+    payload = {
+        "system": _normalize_content(system_prompt),
+        "messages": [
+            {"role": m.get("role"), "content": _normalize_content(m.get("content"))}
+            for m in messages
+        ],
+        "model": model_params,
+        "schema": response_format.model_json_schema(),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# =====================================================
+# AGENTS
+# =====================================================
+# Text delta carried by a streamed message chunk (plain content or structured-output tool args)
+def _chunk_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", "")
+    if isinstance(content, str) and content:
+        return content
+    return "".join(
+        tc.get("args") or "" for tc in (getattr(chunk, "tool_call_chunks", None) or [])
+    )
+
+
+# Wrap `on_token` to record whether anything was forwarded; the list is empty until then
+def _tracking(on_token: Callable[[str], None] | None) -> tuple[Callable[[str], None] | None, list]:
+    if on_token is None:
+        return None, []
+    streamed: list = []
+
+    def forward(text: str) -> None:
+        if not streamed:
+            streamed.append(True)
+        on_token(text)
+
+    return forward, streamed
+
+
+# Blocking cache tiers (Postgres via psycopg2) run in the default thread pool
+async def _maybe_in_thread(fn: Callable, *args: Any) -> Any:
+    if response_cache.blocking:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+# A `create_agent` agent whose structured responses are memoized in `response_cache`.
+# The agent graph is built on first use (`build`), so cache hits never build it.
+class CachedAgent:
+    def __init__(self, build: Callable[[], Any], model_params: dict, system_prompt: str, response_format: type[BaseModel], name: str):
+        self._agent = Lazy(name, build)
+        self.system_prompt = system_prompt
+        self.response_format = response_format
+        self.model_params = model_params
+
+    @property
+    def agent(self) -> Any:
+        return self._agent.get()
+
+    @agent.setter
+    def agent(self, agent: Any) -> None:
+        self._agent.set(agent)
+
+    def cache_key(self, agent_input: dict) -> str:
+        return make_cache_key(self.system_prompt, agent_input["messages"], self.model_params, self.response_format)
+
+    # Returns the structured response as a dict. A cache hit skips the model call
+    # entirely; `fresh=True` always calls the model (and refreshes the cache).
+    def invoke_structured(
+        self,
+        agent_input: dict,
+        fresh: bool = False,
+        on_token: Callable[[str], None] | None = None,
+    ) -> dict:
+        key = self.cache_key(agent_input)
+
+        if fresh:
+            response_cache.bypassed()
+        else:
+            cached = response_cache.get(key)
+            if cached is not None:
+                return clone(cached)
+
+        state = self._run(agent_input, on_token)
+        result = json_loads(state["structured_response"].model_dump_json())
+        response_cache.set(key, clone(result))
+        return result
+
+    # Async version of `invoke_structured` for the ASGI app
+    async def ainvoke_structured(
+        self,
+        agent_input: dict,
+        fresh: bool = False,
+        on_token: Callable[[str], None] | None = None,
+    ) -> dict:
+        key = self.cache_key(agent_input)
+
+        if fresh:
+            response_cache.bypassed()
+        else:
+            cached = await _maybe_in_thread(response_cache.get, key)
+            if cached is not None:
+                return clone(cached)
+
+        state = await self._arun(agent_input, on_token)
+        result = json_loads(state["structured_response"].model_dump_json())
+        await _maybe_in_thread(response_cache.set, key, clone(result))
+        return result
+
+    def _estimate_tokens(self, agent_input: dict) -> int:
+        return estimate_tokens(agent_input["messages"], self.system_prompt, self.model_params["max_tokens"])
+
+    # Invoke the agent within the model's rate limit budget. Once a token has
+    # been forwarded the call isn't retried, since a retry would stream it again.
+    def _run(self, agent_input: dict, on_token: Callable[[str], None] | None) -> dict:
+        on_token, streamed = _tracking(on_token)
+        return rate_limited(
+            self.model_params["model"],
+            self._estimate_tokens(agent_input),
+            lambda: self._call(agent_input, on_token),
+            usage=usage_tokens,
+            can_retry=lambda: not streamed,
+        )
+
+    async def _arun(self, agent_input: dict, on_token: Callable[[str], None] | None) -> dict:
+        on_token, streamed = _tracking(on_token)
+        return await arate_limited(
+            self.model_params["model"],
+            self._estimate_tokens(agent_input),
+            lambda: self._acall(agent_input, on_token),
+            usage=usage_tokens,
+            can_retry=lambda: not streamed,
+        )
+
+    # Invoke the agent, forwarding token deltas to `on_token` when given
+    def _call(self, agent_input: dict, on_token: Callable[[str], None] | None) -> dict:
+        if on_token is None:
+            return self.agent.invoke(agent_input)
+
+        state: dict = {}
+        for mode, data in self.agent.stream(agent_input, stream_mode=["messages", "values"]):
+            if mode == "messages":
+                text = _chunk_text(data[0])
+                if text:
+                    on_token(text)
+            elif mode == "values":
+                state = data
+        return state
+
+    async def _acall(self, agent_input: dict, on_token: Callable[[str], None] | None) -> dict:
+        if on_token is None:
+            return await self.agent.ainvoke(agent_input)
+
+        state: dict = {}
+        async for mode, data in self.agent.astream(agent_input, stream_mode=["messages", "values"]):
+            if mode == "messages":
+                text = _chunk_text(data[0])
+                if text:
+                    on_token(text)
+            elif mode == "values":
+                state = data
+        return state
+
+
+# `llm` is a LazyChatModel; neither it nor langchain is loaded until the agent is built
+def create_cached_agent(
+    llm: Any,
+    tools: list,
+    system_prompt: str,
+    response_format: type[BaseModel],
+    name: str | None = None,
+) -> CachedAgent:
+    def build() -> Any:
+        from langchain.agents import create_agent
+        return create_agent(
+            llm.get(),
+            tools=tools,
+            system_prompt=system_prompt,
+            response_format=response_format,
+        )
+
+    model_params = {
+        "model": llm.model_name,
+        "temperature": llm.temperature,
+        "max_tokens": llm.max_tokens,
+    }
+    return CachedAgent(build, model_params, system_prompt, response_format, name or response_format.__name__)
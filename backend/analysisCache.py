@@ -0,0 +1,167 @@
+import os
+import hashlib
+from typing import Any, IO
+
+from databaseConnection import db_connection
+from jsonCodec import dumps as json_dumps
+from metrics import count_cache
+
+
+# Cache settings
+IMAGE_ANALYSIS_CACHE_TTL_DAYS = int(os.getenv("IMAGE_ANALYSIS_CACHE_TTL_DAYS", "90"))
+IMAGE_ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("IMAGE_ANALYSIS_CACHE_MAX_ENTRIES", "50000"))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# Hash an uploaded file's bytes without loading it into memory, then rewind it
+def hash_file(stream: IO[bytes]) -> str:
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash: str, version: str) -> str:
+    return f"{content_hash}:{version}"
+
+
+# Remember which content hash each uploaded URL points at
+def record_uploads(company_id: int, uploads: list[tuple[str, str]]) -> None:
+    if not uploads:
+        return
+
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.executemany(
+                    """
+                    INSERT INTO image_uploads (url, content_hash, company_id)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (url) DO UPDATE SET content_hash = EXCLUDED.content_hash;
+                    """,
+                    [(url, content_hash, company_id) for url, content_hash in uploads],
+                )
+            conn.commit()
+    except Exception as e:
+        print(f"Error recording image uploads: {e}")
+
+
+# Map URLs to the content hashes recorded at upload time
+def lookup_upload_hashes(urls: list[str]) -> dict[str, str]:
+    if not urls:
+        return {}
+
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT url, content_hash FROM image_uploads WHERE url = ANY(%s);",
+                    (list(urls),),
+                )
+                return {r[0]: r[1] for r in cursor.fetchall() or []}
+    except Exception as e:
+        print(f"Error looking up image hashes: {e}")
+        return {}
+
+
+# Fetch fresh cached analyses, keyed by content hash
+def get_cached_analyses(content_hashes: list[str], version: str) -> dict[str, dict[str, Any]]:
+    if not content_hashes:
+        return {}
+
+    keys = [cache_key(h, version) for h in set(content_hashes)]
+
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE image_analysis_cache
+                    SET last_used_at = NOW(), hits = hits + 1
+                    WHERE cache_key = ANY(%s)
+                      AND created_at > NOW() - make_interval(days => %s)
+                    RETURNING content_hash, analysis;
+                    """,
+                    (keys, IMAGE_ANALYSIS_CACHE_TTL_DAYS),
+                )
+                rows = cursor.fetchall() or []
+            conn.commit()
+
+        count_cache("image_analysis", "hits", len(rows))
+        count_cache("image_analysis", "misses", len(keys) - len(rows))
+        return {r[0]: r[1] for r in rows}
+    except Exception as e:
+        print(f"Error reading image analysis cache: {e}")
+        return {}
+
+
+# The routes' side of the cache, without I/O. Images are keyed by content hash,
+# or by URL when the upload wasn't recorded (those are analyzed but never cached).
+#
+# Distinct images still to analyze, {key: URL}, each once
+def pending_analyses(urls: list[str], url_hashes: dict[str, str], cached: dict[str, dict]) -> dict[str, str]:
+    pending: dict[str, str] = {}
+    for url in urls:
+        content_hash = url_hashes.get(url)
+        if content_hash not in cached:
+            pending.setdefault(content_hash or url, url)
+    return pending
+
+
+# Successful fresh analyses of recorded uploads, for `store_analyses`
+def storable_analyses(url_hashes: dict[str, str], pending: dict[str, str], analyzed: dict[str, dict]) -> dict[str, dict]:
+    return {
+        key: analysis
+        for key, analysis in analyzed.items()
+        if key == url_hashes.get(pending[key]) and analysis.get("success") is not False
+    }
+
+
+# One analysis per URL, in request order
+def merge_analyses(urls: list[str], url_hashes: dict[str, str], cached: dict[str, dict], analyzed: dict[str, dict]) -> list[dict]:
+    return [
+        cached[url_hashes[url]] if url_hashes.get(url) in cached else analyzed[url_hashes.get(url) or url]
+        for url in urls
+    ]
+
+
+# Store successful analyses and evict expired / least recently used entries
+def store_analyses(analyses: dict[str, dict[str, Any]], version: str) -> None:
+    if not analyses:
+        return
+
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.executemany(
+                    """
+                    INSERT INTO image_analysis_cache (cache_key, content_hash, version, analysis)
+                    VALUES (%s, %s, %s, %s::jsonb)
+                    ON CONFLICT (cache_key) DO UPDATE SET
+                        analysis = EXCLUDED.analysis,
+                        created_at = NOW(),
+                        last_used_at = NOW();
+                    """,
+                    [
+                        (cache_key(h, version), h, version, json_dumps(analysis))
+                        for h, analysis in analyses.items()
+                    ],
+                )
+
+                cursor.execute(
+                    """
+                    DELETE FROM image_analysis_cache
+                    WHERE created_at <= NOW() - make_interval(days => %s)
+                       OR cache_key IN (
+                           SELECT cache_key FROM image_analysis_cache
+                           ORDER BY last_used_at DESC
+                           OFFSET %s
+                       );
+                    """,
+                    (IMAGE_ANALYSIS_CACHE_TTL_DAYS, IMAGE_ANALYSIS_CACHE_MAX_ENTRIES),
+                )
+            conn.commit()
+    except Exception as e:
+        print(f"Error writing image analysis cache: {e}")
@@ -0,0 +1,415 @@
+import os
+import time
+import asyncio
+import traceback
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route, compile_path
+
+import main
+from main import (
+    CORS_SETTINGS,
+    analyze_images_response,
+    caption_error,
+    format_caption,
+    parse_content_request,
+    sse_event,
+)
+from asyncDatabase import async_db_connection, async_pool_stats, get_listener, listener_stats
+from brandContext import BRAND_CONTEXT_QUERY, brand_context_cache, brand_context_from_row
+from analysisCache import (
+    record_uploads,
+    lookup_upload_hashes,
+    get_cached_analyses,
+    store_analyses,
+    pending_analyses,
+    storable_analyses,
+)
+from storage import aupload_files
+from agents.contentAgent import (
+    IMAGE_ANALYSIS_VERSION,
+    aanalyze_images_batch,
+    agenerate_caption,
+    agenerate_image_prompt,
+    agenerate_image,
+)
+from agents.fanOut import FanOutError, afan_out
+from imageJobs import IMAGE_JOB_CHANNEL, JOB_COLUMNS, TERMINAL_STATUSES, row_to_job, start_image_jobs
+from requestCoalescing import acoalesce_requests
+from metrics import record_request
+
+# Async serving mode. The LLM, DALL-E, Cloudinary and Postgres bound routes are
+# native coroutines, so one process holds hundreds of in-flight generations
+# without a thread each. Every other /api route is the Flask app from main.py,
+# mounted as WSGI and run on a small thread pool.
+#
+#   uvicorn asgiApp:app --host 0.0.0.0 --port 5000
+#   SERVER_MODE=async python main.py
+
+# Threads for the mounted Flask routes
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "10"))
+# Upper bound on concurrent platforms per content request
+ASGI_FAN_OUT_MAX_CONCURRENCY = int(os.getenv("ASGI_FAN_OUT_MAX_CONCURRENCY", "8"))
+# Image job streams re-read the job at least this often, in case a notification was missed
+IMAGE_JOB_EVENTS_RECHECK = float(os.getenv("IMAGE_JOB_EVENTS_RECHECK", "15"))
+
+
+async def read_json(request: Request) -> dict:
+    try:
+        data = await request.json()
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+# Same as brandContext.fetch_brand_context, sharing its cache
+async def afetch_brand_context(company_id: int) -> dict[str, str]:
+    cached = brand_context_cache.get(company_id)
+    if cached is not None:
+        return cached
+
+    async with async_db_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(BRAND_CONTEXT_QUERY, (company_id,))
+            context = brand_context_from_row(await cursor.fetchone())
+
+    brand_context_cache.set(company_id, context)
+    return context
+
+
+# =====================================================
+# CONTENT
+# =====================================================
+async def upload_images(request: Request) -> Response:
+    form = await request.form()
+    try:
+        company_id = int((form.get("companyId") or "").strip())
+    except ValueError:
+        return JSONResponse({"success": False, "message": "Invalid companyId"}, 400)
+
+    files = [f for f in form.getlist("referenceImages") if getattr(f, "filename", None)]
+    if not files:
+        return JSONResponse({"success": False, "message": "No images provided"}, 400)
+
+    # Upload images concurrently; each file reports its own result
+    results = await aupload_files(files, folder=f"reference-images/{company_id}")
+    uploaded = [r for r in results if r["success"]]
+
+    await asyncio.to_thread(record_uploads, company_id, [(r["url"], r["hash"]) for r in uploaded])
+
+    if not uploaded:
+        return JSONResponse({
+            "success": False,
+            "message": "Failed to upload images",
+            "results": results
+        }, 500)
+
+    return JSONResponse({
+        "success": True,
+        "message": "Images uploaded successfully" if len(uploaded) == len(results) else f"{len(results) - len(uploaded)} of {len(results)} images failed to upload",
+        "urls": [r["url"] for r in uploaded],
+        "hashes": [r["hash"] for r in uploaded],
+        "results": results
+    }, 200)
+
+
+async def analyze_images_route(request: Request) -> Response:
+    img_data = await read_json(request)
+    img_urls: list = img_data.get("urls") or []
+
+    if not img_urls:
+        return JSONResponse({"success": False, "message": "No image URLs provided"}, 400)
+
+    # Content hashes only come from the upload record (never the client), since they key the shared cache
+    url_hashes: dict[str, str] = await asyncio.to_thread(lookup_upload_hashes, img_urls)
+
+    # Serve repeat images from the cache; analyze each remaining distinct image once
+    cached = await asyncio.to_thread(get_cached_analyses, list(url_hashes.values()), IMAGE_ANALYSIS_VERSION)
+    pending = pending_analyses(img_urls, url_hashes, cached)
+
+    analyzed: dict[str, dict] = {}
+    if pending:
+        analyzed = dict(zip(pending, await aanalyze_images_batch(list(pending.values()))))
+    await asyncio.to_thread(store_analyses, storable_analyses(url_hashes, pending, analyzed), IMAGE_ANALYSIS_VERSION)
+
+    body, status = analyze_images_response(img_urls, url_hashes, cached, analyzed)
+    return JSONResponse(body, status)
+
+
+@acoalesce_requests
+async def create_content(request: Request) -> Response:
+    try:
+        params, error = parse_content_request(await read_json(request), request.query_params)
+        if error:
+            return JSONResponse({"success": False, "message": error}, 400)
+
+        topic: str = params["topic"]
+        analyses: list = params["analyses"]
+        fresh: bool = params["fresh"]
+
+        brand = await afetch_brand_context(params["company_id"])
+
+        # Generate a caption + prompt for every selected platform concurrently
+        async def generate_for_platform(platform: str) -> dict:
+            caption_data = await agenerate_caption(
+                brand_guidelines=brand["guidelines"],
+                post_topic=topic,
+                platform=platform,
+                image_analysis=analyses,
+                fresh=fresh,
+            )
+
+            error = caption_error(platform, caption_data)
+            if error:
+                raise FanOutError(platform, error)
+
+            prompt = await agenerate_image_prompt(
+                brand_guidelines=brand["guidelines"],
+                caption_data=caption_data,
+                image_analysis=analyses,
+                fresh=fresh,
+                industry=brand["industry"],
+            )
+
+            return {"platform": platform, "caption": format_caption(caption_data), "prompt": prompt}
+
+        try:
+            results = await afan_out(generate_for_platform, params["platforms"], ASGI_FAN_OUT_MAX_CONCURRENCY)
+        except FanOutError as e:
+            return JSONResponse({"success": False, "message": e.message}, 500)
+
+        return JSONResponse({"success": True, "results": results}, 200)
+
+    except Exception as e:
+        print(traceback.format_exc())
+        return JSONResponse({"success": False, "message": "Failed to create content", "error": str(e)}, 500)
+
+
+# Same events as main.create_content_stream
+async def create_content_stream(request: Request) -> Response:
+    params, error = parse_content_request(await read_json(request), request.query_params)
+    if error:
+        return JSONResponse({"success": False, "message": error}, 400)
+
+    topic: str = params["topic"]
+    platforms: list[str] = params["platforms"]
+    analyses: list = params["analyses"]
+    fresh: bool = params["fresh"]
+
+    try:
+        brand = await afetch_brand_context(params["company_id"])
+    except Exception as e:
+        print(traceback.format_exc())
+        return JSONResponse({"success": False, "message": "Failed to create content", "error": str(e)}, 500)
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def generate_for_platform(platform: str) -> dict | None:
+        def on_token(stage: str) -> Callable[[str], None]:
+            return lambda delta: events.put_nowait(("token", {"platform": platform, "stage": stage, "delta": delta}))
+
+        try:
+            caption_data = await agenerate_caption(
+                brand_guidelines=brand["guidelines"],
+                post_topic=topic,
+                platform=platform,
+                image_analysis=analyses,
+                on_token=on_token("caption"),
+                fresh=fresh,
+            )
+
+            error = caption_error(platform, caption_data)
+            if error:
+                events.put_nowait(("error", {"platform": platform, "message": error}))
+                return None
+
+            caption = format_caption(caption_data)
+            events.put_nowait(("caption", {"platform": platform, "caption": caption}))
+
+            prompt = await agenerate_image_prompt(
+                brand_guidelines=brand["guidelines"],
+                caption_data=caption_data,
+                image_analysis=analyses,
+                on_token=on_token("prompt"),
+                fresh=fresh,
+                industry=brand["industry"],
+            )
+            events.put_nowait(("prompt", {"platform": platform, "prompt": prompt}))
+
+            return {"platform": platform, "caption": caption, "prompt": prompt}
+        except Exception as e:
+            print(traceback.format_exc())
+            events.put_nowait(("error", {"platform": platform, "message": str(e)}))
+            return None
+        finally:
+            events.put_nowait(None)
+
+    async def stream():
+        tasks = [asyncio.ensure_future(generate_for_platform(p)) for p in platforms]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                item = await events.get()
+                if item is None:
+                    remaining -= 1
+                    continue
+                yield sse_event(*item)
+
+            results = [t.result() for t in tasks if t.result() is not None]
+            yield sse_event("done", {"success": len(results) == len(platforms), "results": results})
+        finally:
+            # Client disconnected: stop the model calls still in flight
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+# =====================================================
+# GENERATE IMAGE
+# =====================================================
+@acoalesce_requests
+async def generate_image_route(request: Request) -> Response:
+    try:
+        data = await read_json(request)
+        prompt = (data.get("prompt") or "").strip()
+        size = (data.get("size") or "1024x1024").strip()
+
+        if not prompt:
+            return JSONResponse({"success": False, "message": "Missing prompt"}, 400)
+
+        image_url = await agenerate_image(prompt, size)
+
+        if image_url.startswith("Error"):
+            return JSONResponse({"success": False, "message": image_url}, 500)
+
+        return JSONResponse({"success": True, "url": image_url}, 200)
+
+    except Exception as e:
+        print(traceback.format_exc())
+        return JSONResponse({"success": False, "message": "Failed to generate image", "error": str(e)}, 500)
+
+
+async def aget_job(job_id: str) -> dict[str, Any] | None:
+    async with async_db_connection() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(f"SELECT {JOB_COLUMNS} FROM image_jobs WHERE id = %s;", (job_id,))
+            row = await cursor.fetchone()
+    return row_to_job(row) if row else None
+
+
+# Server-Sent Events: one `status` event per state change, closed once the job
+# finishes. Changes are pushed by Postgres NOTIFY (imageJobs.IMAGE_JOB_CHANNEL), so
+# an open stream holds neither a thread nor a pooled connection between events.
+async def image_job_events(request: Request) -> Response:
+    job_id = request.path_params["job_id"]
+    job = await aget_job(job_id)
+    if not job:
+        return JSONResponse({"success": False, "message": "Job not found"}, 404)
+
+    async def stream():
+        with get_listener(IMAGE_JOB_CHANNEL).subscribe(job_id) as changed:
+            # Re-read once subscribed, in case the job changed in between
+            current = await aget_job(job_id) or job
+            last_state = None
+            while True:
+                state = (current["status"], current["attempts"])
+                if state != last_state:
+                    yield sse_event("status", current)
+                    last_state = state
+                if current["status"] in TERMINAL_STATUSES:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), IMAGE_JOB_EVENTS_RECHECK)
+                except asyncio.TimeoutError:
+                    pass
+                changed.clear()
+                current = await aget_job(job_id) or current
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+# =====================================================
+# HEALTH
+# =====================================================
+async def async_db_pool_stats(request: Request) -> Response:
+    return JSONResponse({"success": True, "pid": os.getpid(), "pool": async_pool_stats(), "listeners": listener_stats()}, 200)
+
+
+# Request latency for the native routes, labelled with the route's path template
+# (the mounted Flask app records its own)
+class RequestMetricsMiddleware:
+    def __init__(self, app: Any, paths: set[str]):
+        self.app = app
+        self.patterns = [(compile_path(path)[0], path) for path in paths]
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        route = None
+        if scope["type"] == "http":
+            route = next((path for pattern, path in self.patterns if pattern.match(scope["path"])), None)
+        if route is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+
+        async def send_with_metrics(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                record_request(route, scope["method"], message["status"], time.perf_counter() - started)
+            await send(message)
+
+        await self.app(scope, receive, send_with_metrics)
+
+
+routes = [
+    Route("/api/content/upload_images", upload_images, methods=["POST"]),
+    Route("/api/content/analyze_images", analyze_images_route, methods=["POST"]),
+    Route("/api/content/create", create_content, methods=["POST"]),
+    Route("/api/content/create/stream", create_content_stream, methods=["POST"]),
+    Route("/api/content/generate-image", generate_image_route, methods=["POST"]),
+    Route("/api/content/generate-image/jobs/{job_id}/events", image_job_events, methods=["GET"]),
+    Route("/api/health/async-db-pool", async_db_pool_stats, methods=["GET"]),
+    # Everything else is served by the Flask app
+    Mount("/", app=WSGIMiddleware(main.app, workers=ASGI_WSGI_THREADS)),
+]
+
+@asynccontextmanager
+async def lifespan(app: Starlette) -> AsyncIterator[None]:
+    start_image_jobs()
+    yield
+
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    middleware=[
+        Middleware(RequestMetricsMiddleware, paths={r.path for r in routes if isinstance(r, Route)}),
+        Middleware(
+            CORSMiddleware,
+            allow_origins=CORS_SETTINGS["origins"],
+            allow_methods=CORS_SETTINGS["methods"],
+            allow_headers=CORS_SETTINGS["allow_headers"],
+            expose_headers=CORS_SETTINGS["expose_headers"],
+            allow_credentials=CORS_SETTINGS["supports_credentials"],
+        ),
+    ],
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
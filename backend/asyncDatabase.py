@@ -0,0 +1,251 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterator
+
+import psycopg
+from psycopg import pq, sql
+from psycopg.types.json import set_json_dumps, set_json_loads
+
+from databaseConnection import (
+    POOL_MAX_SIZE,
+    POOL_MAX_LIFETIME,
+    POOL_TIMEOUT,
+    PoolExhaustedError,
+    connection_kwargs,
+)
+from jsonCodec import dumpb, loads
+from metrics import observe_stage
+
+# JSON/JSONB parameters and results go through orjson, as on the sync pool
+set_json_loads(loads)
+set_json_dumps(dumpb)
+
+
+async def _aconnect() -> psycopg.AsyncConnection:
+    return await psycopg.AsyncConnection.connect(**connection_kwargs())
+
+
+# asyncio counterpart of databaseConnection.ConnectionPool (psycopg3) for the
+# ASGI app. Bound to the event loop it was created on.
+class AsyncConnectionPool:
+    def __init__(
+        self,
+        max_size: int = POOL_MAX_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        max_lifetime: float = POOL_MAX_LIFETIME,
+        connect=_aconnect,
+    ):
+        if max_size < 1:
+            raise ValueError("Invalid pool size (need max_size >= 1)")
+
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self._connect = connect
+
+        self._slots = asyncio.Semaphore(max_size)
+        # Idle entries: (connection, created_at)
+        self._idle: deque = deque()
+        self._in_use = 0
+        self._waiting = 0
+
+        # Stats
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+
+    # `async with pool.connection() as conn: ...`, waiting up to `timeout` seconds for a free slot
+    @asynccontextmanager
+    async def connection(self, timeout: float | None = None) -> AsyncIterator[psycopg.AsyncConnection]:
+        timeout = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+
+        if self._slots.locked():
+            if timeout <= 0:
+                self._timeouts += 1
+                raise PoolExhaustedError(f"Connection pool exhausted ({self.max_size} connections in use)")
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self._timeouts += 1
+                raise PoolExhaustedError(f"Connection pool exhausted ({self.max_size} connections in use)")
+            finally:
+                self._waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        conn = None
+        created_at = 0.0
+        try:
+            conn, created_at = await self._checkout()
+            observe_stage("db_checkout", time.perf_counter() - started)
+            self._in_use += 1
+            self._checkouts += 1
+            try:
+                yield conn
+            finally:
+                self._in_use -= 1
+                await self._release(conn, created_at)
+        finally:
+            self._slots.release()
+
+    async def _checkout(self) -> tuple[psycopg.AsyncConnection, float]:
+        while self._idle:
+            conn, created_at = self._idle.pop()
+            if self._is_usable(conn, created_at):
+                return conn, created_at
+            await self._discard(conn)
+        return await self._connect(), time.monotonic()
+
+    def _is_usable(self, conn: psycopg.AsyncConnection, created_at: float) -> bool:
+        if conn.closed or conn.broken:
+            return False
+        return not (self.max_lifetime and time.monotonic() - created_at > self.max_lifetime)
+
+    async def _discard(self, conn: psycopg.AsyncConnection) -> None:
+        self._recycled += 1
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+    async def _release(self, conn: psycopg.AsyncConnection, created_at: float) -> None:
+        # Never hand out a connection with a half-finished transaction
+        if not (conn.closed or conn.broken):
+            try:
+                if conn.info.transaction_status != pq.TransactionStatus.IDLE:
+                    await conn.rollback()
+                self._idle.append((conn, created_at))
+                return
+            except Exception:
+                pass
+        await self._discard(conn)
+
+    async def closeall(self) -> None:
+        while self._idle:
+            conn, _ = self._idle.pop()
+            try:
+                await conn.close()
+            except Exception:
+                pass
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "maxSize": self.max_size,
+            "size": self._in_use + len(self._idle),
+            "inUse": self._in_use,
+            "idle": len(self._idle),
+            "waiting": self._waiting,
+            "checkouts": self._checkouts,
+            "timeouts": self._timeouts,
+            "recycled": self._recycled,
+        }
+
+
+# One pool per event loop
+_pool: AsyncConnectionPool | None = None
+_pool_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_async_pool() -> AsyncConnectionPool:
+    global _pool, _pool_loop
+
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool_loop is not loop:
+        _pool = AsyncConnectionPool()
+        _pool_loop = loop
+    return _pool
+
+
+def async_db_connection(timeout: float | None = None):
+    return get_async_pool().connection(timeout)
+
+
+def async_pool_stats() -> dict[str, Any]:
+    return _pool.stats() if _pool is not None else {}
+
+
+# Postgres LISTEN on one channel, shared by every subscriber of the event loop.
+# Holds a single dedicated connection (outside the pool) from the first
+# subscription on, reconnecting after errors. Subscribers are woken when a
+# notification carries their payload, and all of them on (re)connect, since
+# notifications sent while disconnected are lost.
+class NotificationListener:
+    def __init__(self, channel: str, reconnect_delay: float = 1.0, connect=_aconnect):
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._connect = connect
+        self._waiters: dict[str, set[asyncio.Event]] = {}
+        self._task: asyncio.Task | None = None
+
+    # `with listener.subscribe(payload) as changed: await changed.wait()`; clear it before re-reading state
+    @contextmanager
+    def subscribe(self, payload: str) -> Iterator[asyncio.Event]:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._listen())
+
+        event = asyncio.Event()
+        self._waiters.setdefault(payload, set()).add(event)
+        try:
+            yield event
+        finally:
+            waiters = self._waiters.get(payload)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[payload]
+
+    def _wake(self, payload: str | None = None) -> None:
+        groups = self._waiters.values() if payload is None else [self._waiters.get(payload, ())]
+        for waiters in groups:
+            for event in waiters:
+                event.set()
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                conn = await self._connect()
+                async with conn:
+                    await conn.set_autocommit(True)
+                    await conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                    self._wake()
+                    async for notify in conn.notifies():
+                        self._wake(notify.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"LISTEN {self.channel} failed, reconnecting: {e}")
+                self._wake()
+            await asyncio.sleep(self.reconnect_delay)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "channel": self.channel,
+            "listening": self._task is not None and not self._task.done(),
+            "subscribers": sum(len(waiters) for waiters in self._waiters.values()),
+        }
+
+
+# One listener per channel and event loop
+_listeners: dict[str, NotificationListener] = {}
+_listeners_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_listener(channel: str) -> NotificationListener:
+    global _listeners_loop
+
+    loop = asyncio.get_running_loop()
+    if _listeners_loop is not loop:
+        _listeners.clear()
+        _listeners_loop = loop
+    if channel not in _listeners:
+        _listeners[channel] = NotificationListener(channel)
+    return _listeners[channel]
+
+
+
+def listener_stats() -> list[dict[str, Any]]:
+    return [listener.stats() for listener in _listeners.values()]
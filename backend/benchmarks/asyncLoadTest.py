@@ -0,0 +1,301 @@
+"""
+Load test: sync (Flask on gunicorn) vs async (asgiApp on uvicorn) serving.
+
+Starts each server in its own process with a fake model (every LLM / DALL-E
+call sleeps --latency seconds), fake storage (uploads sleep --latency seconds)
+and no database, then keeps --concurrency requests in flight until
+--requests have completed. Reports throughput, p50/p99 latency, errors and the
+server's peak memory and thread count.
+
+Both modes run as one process; the sync server gets --sync-threads gunicorn
+threads (gthread worker), the async server a single event loop.
+
+Usage (from backend/):
+    python -m benchmarks.asyncLoadTest --requests 400 --concurrency 200
+    python -m benchmarks.asyncLoadTest --scenario upload --modes async
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ["LLM_CACHE_TIERS"] = "memory"
+# Measure serving, not the LLM rate limiter
+os.environ["LLM_RATE_LIMITS"] = "gpt-4o-mini=1000000/0,dall-e-3=1000000/0"
+
+import aiohttp
+
+SCENARIOS = ["create", "image", "upload"]
+FAKE_IMAGE = b"\x89PNG\r\n\x1a\n" + b"\x00" * 2048
+
+
+# =====================================================
+# SERVER SIDE (runs in the spawned process)
+# =====================================================
+class FakeAgent:
+    def __init__(self, response: object, latency: float):
+        self.response = response
+        self.latency = latency
+
+    def invoke(self, agent_input: dict) -> dict:
+        time.sleep(self.latency)
+        return {"structured_response": self.response}
+
+    async def ainvoke(self, agent_input: dict) -> dict:
+        await asyncio.sleep(self.latency)
+        return {"structured_response": self.response}
+
+
+class FakeStorage:
+    name = "fake"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def upload(self, stream, folder, filename=None, public_id=None, resource_type="image") -> str:
+        time.sleep(self.latency)
+        return f"https://storage.invalid/{folder}/{uuid.uuid4().hex}"
+
+    async def aupload(self, stream, folder, filename=None, public_id=None, resource_type="image") -> str:
+        await asyncio.sleep(self.latency)
+        return f"https://storage.invalid/{folder}/{uuid.uuid4().hex}"
+
+    def is_transient(self, error: Exception) -> bool:
+        return False
+
+
+def install_fakes(latency: float) -> None:
+    import main
+    import asgiApp
+    import storage
+    import brandContext
+    from agents import contentAgent
+
+    contentAgent.post_caption_gen_agent.agent = FakeAgent(
+        contentAgent.CaptionResponseFormat(caption="Caption", hashtags=["one", "two"], cta="Buy", hook="Hook"),
+        latency,
+    )
+    contentAgent.post_image_prompt_gen_agent.agent = FakeAgent(
+        contentAgent.ImagePromptResponseFormat(post_topic="Topic", prompt="A prompt", aspect_ratio="1:1"),
+        latency,
+    )
+
+    def generate_image(prompt: str, size: str) -> str:
+        time.sleep(latency)
+        return "https://images.invalid/generated.png"
+
+    async def agenerate_image(prompt: str, size: str) -> str:
+        await asyncio.sleep(latency)
+        return "https://images.invalid/generated.png"
+
+    async def afetch_brand_context(company_id: int) -> dict:
+        return brandContext.brand_context_from_row(None)
+
+    main.generate_image = generate_image
+    asgiApp.agenerate_image = agenerate_image
+    main.fetch_brand_context = lambda company_id: brandContext.brand_context_from_row(None)
+    asgiApp.afetch_brand_context = afetch_brand_context
+    main.record_uploads = asgiApp.record_uploads = lambda company_id, uploads: None
+    storage.set_storage(FakeStorage(latency))
+
+
+def serve(mode: str, port: int, latency: float, sync_threads: int) -> None:
+    install_fakes(latency)
+
+    if mode == "async":
+        import uvicorn
+        import asgiApp
+
+        uvicorn.run(asgiApp.app, host="127.0.0.1", port=port, log_level="warning")
+        return
+
+    from gunicorn.app.base import BaseApplication
+    import main
+
+    class SyncServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"127.0.0.1:{port}")
+            self.cfg.set("workers", 1)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", sync_threads)
+            self.cfg.set("timeout", 300)
+            self.cfg.set("loglevel", "warning")
+
+        def load(self):
+            return main.app
+
+    SyncServer().run()
+
+
+# =====================================================
+# CLIENT SIDE
+# =====================================================
+def process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for p in pids:
+        try:
+            for task in os.listdir(f"/proc/{p}/task"):
+                with open(f"/proc/{p}/task/{task}/children") as f:
+                    pids.extend(int(c) for c in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+# (RSS in MB, threads) summed over the server's process tree (Linux only)
+def resource_usage(pid: int) -> tuple[float, int]:
+    rss_kb = threads = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        rss_kb += int(line.split()[1])
+                    elif line.startswith("Threads:"):
+                        threads += int(line.split()[1])
+        except OSError:
+            pass
+    return rss_kb / 1024, threads
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def send(session: aiohttp.ClientSession, base_url: str, scenario: str) -> int:
+    if scenario == "image":
+        request = session.post(f"{base_url}/api/content/generate-image", json={"prompt": f"Prompt {uuid.uuid4().hex}"})
+    elif scenario == "upload":
+        form = aiohttp.FormData()
+        form.add_field("companyId", "1")
+        for i in range(2):
+            form.add_field("referenceImages", FAKE_IMAGE, filename=f"ref{i}.png", content_type="image/png")
+        request = session.post(f"{base_url}/api/content/upload_images", data=form)
+    else:
+        # fresh: the response cache must never short-circuit the model
+        request = session.post(f"{base_url}/api/content/create", json={
+            "companyId": 1,
+            "topic": f"Topic {uuid.uuid4().hex}",
+            "platforms": ["Instagram", "LinkedIn"],
+            "fresh": True,
+        })
+
+    async with request as res:
+        await res.read()
+        return res.status
+
+
+# aiohttp rather than httpx on the client side: it needs far less CPU per
+# request, so the client doesn't become the bottleneck on small machines
+async def load(port: int, pid: int, scenario: str, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    peak_rss, peak_threads = resource_usage(pid)
+    remaining = requests
+    base_url = f"http://127.0.0.1:{port}"
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def worker() -> None:
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    if await send(session, base_url, scenario) != 200:
+                        errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        async def sample() -> None:
+            nonlocal peak_rss, peak_threads
+            while True:
+                rss, threads = resource_usage(pid)
+                peak_rss, peak_threads = max(peak_rss, rss), max(peak_threads, threads)
+                await asyncio.sleep(0.1)
+
+        sampler = asyncio.ensure_future(sample())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    return {
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 99),
+        "errors": errors,
+        "rss": peak_rss,
+        "threads": peak_threads,
+    }
+
+
+def wait_until_ready(port: int, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/health/llm-cache", timeout=1) as res:
+                if res.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+def run(args: argparse.Namespace) -> None:
+    print(
+        f"scenario={args.scenario} requests={args.requests} concurrency={args.concurrency} "
+        f"latency={args.latency}s sync_threads={args.sync_threads}"
+    )
+
+    for offset, mode in enumerate(args.modes):
+        port = args.port + offset
+        process = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.asyncLoadTest",
+            "--serve", mode, "--port", str(port),
+            "--latency", str(args.latency), "--sync-threads", str(args.sync_threads),
+        ])
+        try:
+            wait_until_ready(port, process)
+            result = asyncio.run(load(port, process.pid, args.scenario, args.requests, args.concurrency))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+        print(
+            f"{mode:<6} {result['throughput']:8.1f} req/s  "
+            f"p50={result['p50'] * 1000:8.1f}ms  p99={result['p99'] * 1000:8.1f}ms  "
+            f"errors={result['errors']:<4} peak_rss={result['rss']:6.1f}MB  peak_threads={result['threads']}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="create")
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per fake model/storage call")
+    parser.add_argument("--sync-threads", type=int, default=32, help="gunicorn threads for the sync server")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--serve", choices=["sync", "async"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.latency, args.sync_threads)
+    else:
+        run(args)
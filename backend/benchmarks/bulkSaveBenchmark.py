@@ -0,0 +1,114 @@
+"""
+Save throughput: one post per /api/content/save request vs /api/content/save/bulk.
+
+Creates a throwaway company in the database configured by DATABASE_URL /
+DB_*, saves --rows posts through each path with the Flask test client and
+reports rows/sec. The bulk path sends --batch-size posts per request; with
+--retry every bulk batch is sent twice with the same client keys, and the
+benchmark checks that the retries updated the same rows instead of adding new
+ones. The company (and its posts) is deleted afterwards unless --keep is passed.
+
+Usage (from backend/, against a scratch database with schema.sql applied):
+    python -m benchmarks.bulkSaveBenchmark --rows 5000 --batch-size 250
+"""
+import argparse
+import os
+import time
+import uuid
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import main
+from databaseConnection import db_connection
+
+PLATFORMS = ["Instagram", "LinkedIn", "X", "Facebook"]
+
+
+def create_company() -> int:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO companies (name) VALUES (%s) RETURNING id;",
+                ("bulk-save-benchmark",),
+            )
+            company_id = cursor.fetchone()[0]
+        conn.commit()
+    return company_id
+
+
+def count_posts(company_id: int) -> int:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM content_posts WHERE company_id = %s;", (company_id,))
+            return cursor.fetchone()[0]
+
+
+def cleanup(company_id: int) -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM companies WHERE id = %s;", (company_id,))
+        conn.commit()
+
+
+def make_posts(rows: int, run_id: str) -> list[dict]:
+    return [
+        {
+            "topic": f"Topic {i}",
+            "platform": PLATFORMS[i % len(PLATFORMS)],
+            "prompt": f"Prompt {i} " + "x" * 200,
+            "caption": f"Caption {i} " + "y" * 400,
+            "referenceImageUrls": [f"https://images.invalid/{i}.png"],
+            "clientKey": f"{run_id}-{i}",
+        }
+        for i in range(rows)
+    ]
+
+
+def save_single(client, company_id: int, posts: list[dict]) -> float:
+    started = time.perf_counter()
+    for post in posts:
+        res = client.post("/api/content/save", json={"companyId": company_id, **post})
+        assert res.status_code == 201, res.get_json()
+    return time.perf_counter() - started
+
+
+def save_bulk(client, company_id: int, posts: list[dict], batch_size: int, retry: bool) -> float:
+    started = time.perf_counter()
+    for i in range(0, len(posts), batch_size):
+        batch = posts[i:i + batch_size]
+        for _ in range(2 if retry else 1):
+            res = client.post("/api/content/save/bulk", json={"companyId": company_id, "posts": batch})
+            assert res.status_code == 201, res.get_json()
+            saved = res.get_json()["posts"]
+            assert [p["topic"] for p in saved] == [p["topic"] for p in batch], "rows out of order"
+    return time.perf_counter() - started
+
+
+def run(rows: int, batch_size: int, retry: bool, keep: bool) -> None:
+    company_id = create_company()
+    client = main.app.test_client()
+    try:
+        single_posts = make_posts(rows, uuid.uuid4().hex)
+        elapsed = save_single(client, company_id, single_posts)
+        print(f"{'single-row':<12} rows={rows:<7} {elapsed:7.2f}s  {rows / elapsed:9.0f} rows/s")
+
+        bulk_posts = make_posts(rows, uuid.uuid4().hex)
+        elapsed = save_bulk(client, company_id, bulk_posts, batch_size, retry)
+        label = f"bulk x{batch_size}"
+        print(f"{label:<12} rows={rows:<7} {elapsed:7.2f}s  {rows / elapsed:9.0f} rows/s" + ("  (each batch sent twice)" if retry else ""))
+
+        saved = count_posts(company_id)
+        assert saved == 2 * rows, f"expected {2 * rows} posts, found {saved}"
+    finally:
+        if not keep:
+            cleanup(company_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=250)
+    parser.add_argument("--retry", action="store_true", help="Send every bulk batch twice (upsert by client key)")
+    parser.add_argument("--keep", action="store_true", help="Keep the company and its posts")
+    args = parser.parse_args()
+    run(args.rows, args.batch_size, args.retry, args.keep)
@@ -0,0 +1,133 @@
+"""
+Page latency of /api/content/list on a large content history.
+
+Seeds a throwaway company with N content posts (default 1,000,000) in the
+database configured by DATABASE_URL / DB_*, walks the history page by page
+through the cursor, and reports p50/p99 latency for the first page, deep
+pages, a platform-filtered walk and a revalidated (If-None-Match, 304)
+first page. The company (and its posts) is deleted
+afterwards unless --keep is passed.
+
+Usage (from backend/, against a scratch database with schema.sql applied):
+    python -m benchmarks.contentListBenchmark --rows 1000000 --pages 200
+"""
+import argparse
+import os
+import statistics
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import main
+from databaseConnection import db_connection
+
+PLATFORMS = ["Instagram", "LinkedIn", "X", "Facebook"]
+
+
+def seed(rows: int) -> int:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO companies (name) VALUES (%s) RETURNING id;",
+                ("content-list-benchmark",),
+            )
+            company_id = cursor.fetchone()[0]
+
+            # Spread posts over ~5 years, a few posts per hour
+            cursor.execute(
+                """
+                INSERT INTO content_posts (company_id, topic, platform, reference_image_urls,
+                                           prompt, caption, created_at)
+                SELECT %s, 'Topic ' || g, (%s::text[])[1 + g %% 4], '[]'::jsonb,
+                       'Prompt ' || g, 'Caption ' || g,
+                       NOW() - (g * INTERVAL '150 seconds')
+                FROM generate_series(1, %s) AS g;
+                """,
+                (company_id, PLATFORMS, rows),
+            )
+            cursor.execute("ANALYZE content_posts;")
+        conn.commit()
+    return company_id
+
+
+def cleanup(company_id: int) -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM companies WHERE id = %s;", (company_id,))
+        conn.commit()
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def walk(client, company_id: int, pages: int, limit: int, extra: str = "") -> list[float]:
+    latencies: list[float] = []
+    cursor = None
+    for _ in range(pages):
+        url = f"/api/content/list?companyId={company_id}&limit={limit}{extra}"
+        if cursor:
+            url += f"&cursor={cursor}"
+
+        started = time.perf_counter()
+        res = client.get(url)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        body = res.get_json()
+        assert res.status_code == 200, body
+        cursor = body.get("nextCursor")
+        if not cursor:
+            break
+    return latencies
+
+
+# Conditional GETs of an unchanged first page, as a polling client sends them
+def revalidate(client, company_id: int, requests: int, limit: int) -> list[float]:
+    url = f"/api/content/list?companyId={company_id}&limit={limit}"
+    etag = client.get(url).headers["ETag"]
+    latencies: list[float] = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        res = client.get(url, headers={"If-None-Match": etag})
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert res.status_code == 304, res.status_code
+    return latencies
+
+
+def report(label: str, latencies: list[float]) -> None:
+    print(
+        f"{label:<28} pages={len(latencies):<5} "
+        f"p50={statistics.median(latencies):7.2f}ms "
+        f"p99={percentile(latencies, 99):7.2f}ms "
+        f"max={max(latencies):7.2f}ms"
+    )
+
+
+def run(rows: int, pages: int, limit: int, keep: bool) -> None:
+    print(f"Seeding {rows:,} posts...")
+    started = time.perf_counter()
+    company_id = seed(rows)
+    print(f"Seeded company {company_id} in {time.perf_counter() - started:.1f}s")
+
+    client = main.app.test_client()
+    try:
+        first_page = [walk(client, company_id, 1, limit)[0] for _ in range(pages)]
+        report("first page", first_page)
+        report("cursor walk", walk(client, company_id, pages, limit))
+        report("cursor walk (platform=X)", walk(client, company_id, pages, limit, "&platform=X"))
+        report("first page, not modified", revalidate(client, company_id, pages, limit))
+    finally:
+        if not keep:
+            cleanup(company_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="Keep the seeded company and posts")
+    args = parser.parse_args()
+    run(args.rows, args.pages, args.limit, args.keep)
@@ -0,0 +1,60 @@
+"""
+Wall time of /api/content/create as the platform count grows.
+
+Caption and image prompt generation are replaced by a fake model that
+sleeps for a fixed latency, and the brand context lookup by an empty stub
+(no database), so the numbers only reflect request orchestration.
+
+Usage (from backend/):
+    python -m benchmarks.fanOutBenchmark --latency 0.5 --max-platforms 6
+"""
+import argparse
+import os
+import time
+from unittest import mock
+
+# Agents build OpenAI clients at import time; no request is ever sent
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+import main
+import brandContext
+
+PLATFORMS = ["Instagram", "LinkedIn", "X", "Facebook", "TikTok", "Pinterest", "Threads", "YouTube"]
+
+
+def run(latency: float, max_platforms: int) -> None:
+    def fake_caption(**kwargs):
+        time.sleep(latency)
+        return {"caption": f"Caption for {kwargs['platform']}", "hashtags": ["bench"], "cta": "", "hook": ""}
+
+    def fake_prompt(**kwargs):
+        time.sleep(latency)
+        return "Fake image prompt"
+
+    client = main.app.test_client()
+    sequential = 2 * latency
+
+    with mock.patch.object(main, "generate_caption", fake_caption), \
+         mock.patch.object(main, "generate_image_prompt", fake_prompt), \
+         mock.patch.object(main, "fetch_brand_context", lambda company_id: brandContext.brand_context_from_row(None)):
+        print(f"{'platforms':>9} {'wall (s)':>9} {'sequential (s)':>15}")
+        for n in range(1, max_platforms + 1):
+            started = time.perf_counter()
+            res = client.post("/api/content/create", json={
+                "companyId": 1,
+                "topic": "Benchmark topic",
+                "platforms": PLATFORMS[:n],
+            })
+            elapsed = time.perf_counter() - started
+
+            assert res.status_code == 200, res.get_json()
+            assert [r["platform"] for r in res.get_json()["results"]] == PLATFORMS[:n]
+            print(f"{n:>9} {elapsed:>9.3f} {sequential * n:>15.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake model latency per call (seconds)")
+    parser.add_argument("--max-platforms", type=int, default=4)
+    args = parser.parse_args()
+    run(args.latency, min(args.max_platforms, len(PLATFORMS)))
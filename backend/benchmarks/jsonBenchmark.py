@@ -0,0 +1,114 @@
+"""
+JSON encode/decode cost on large image-analysis payloads: stdlib json and
+Flask's default provider vs orjson (jsonCodec.py).
+
+Payloads are ImageAnalysisResponseFormat instances with every field filled
+in (strings of --text-length characters, lists of --list-items entries), so
+they are about the size of a detailed analysis. Each row is the median time
+per operation over --iterations runs, for one analysis and for a response
+holding --batch of them (e.g. a calendar run or an analysis cache lookup).
+
+Usage (from backend/):
+    python -m benchmarks.jsonBenchmark --iterations 200 --batch 20
+"""
+import argparse
+import copy
+import json
+import statistics
+import time
+import types
+import typing
+from typing import Any, Callable
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from pydantic import BaseModel
+
+from agents.responseModels import ImageAnalysisResponseFormat
+from jsonCodec import OrjsonProvider, clone, dumps, loads
+
+
+# Fill every field of a pydantic model from its annotations
+def synthesize(annotation: Any, text_length: int, list_items: int, path: str = "") -> Any:
+    origin = typing.get_origin(annotation)
+    if origin in (typing.Union, types.UnionType):
+        annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+        return synthesize(annotation, text_length, list_items, path)
+    if origin is list:
+        (item,) = typing.get_args(annotation)
+        return [synthesize(item, text_length, list_items, f"{path}[{i}]") for i in range(list_items)]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation(**{
+            name: synthesize(field.annotation, text_length, list_items, f"{path}.{name}")
+            for name, field in annotation.model_fields.items()
+        })
+    if annotation is bool:
+        return True
+    if annotation is int:
+        return len(path)
+    if annotation is float:
+        return len(path) / 7
+    return (f"{path} " * (text_length // (len(path) + 1) + 1))[:text_length]
+
+
+def timeit(fn: Callable[[], Any], iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def run(iterations: int, batch: int, text_length: int, list_items: int) -> None:
+    model = synthesize(ImageAnalysisResponseFormat, text_length, list_items)
+    analysis = model.model_dump()
+    batched = {"analyses": [copy.deepcopy(analysis) for _ in range(batch)]}
+    payloads = {"1 analysis": analysis, f"{batch} analyses": batched}
+
+    default_app = Flask("default")
+    default_app.json = DefaultJSONProvider(default_app)
+    orjson_app = Flask("orjson")
+    orjson_app.json = OrjsonProvider(orjson_app)
+
+    def jsonify_with(app: Flask, payload: Any) -> Callable[[], Any]:
+        def call():
+            with app.app_context():
+                return app.json.response(payload).get_data()
+        return call
+
+    for label, payload in payloads.items():
+        encoded = json.dumps(payload)
+        print(f"\n{label}: {len(encoded) / 1024:.0f} KiB")
+        print(f"{'operation':<34} {'json (ms)':>10} {'orjson (ms)':>12} {'speed-up':>9}")
+
+        rows = [
+            ("dumps (JSONB parameter)", lambda: json.dumps(payload), lambda: dumps(payload)),
+            ("loads (JSONB result)", lambda: json.loads(encoded), lambda: loads(encoded)),
+            ("jsonify (API response)", jsonify_with(default_app, payload), jsonify_with(orjson_app, payload)),
+            ("deep copy (cache hit)", lambda: copy.deepcopy(payload), lambda: clone(payload)),
+        ]
+        if payload is analysis:
+            rows += [
+                ("agent output to JSON", lambda: json.dumps(model.model_dump()), lambda: model.model_dump_json()),
+                (
+                    "agent output to dict + cache copy",
+                    lambda: copy.deepcopy(model.model_dump()),
+                    lambda: clone(loads(model.model_dump_json())),
+                ),
+            ]
+
+        for name, baseline, fast in rows:
+            before = timeit(baseline, iterations)
+            after = timeit(fast, iterations)
+            print(f"{name:<34} {before * 1000:>10.3f} {after * 1000:>12.3f} {before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--batch", type=int, default=20, help="Analyses per batched payload")
+    parser.add_argument("--text-length", type=int, default=200, help="Characters per string field")
+    parser.add_argument("--list-items", type=int, default=5, help="Entries per list field")
+    args = parser.parse_args()
+    run(args.iterations, args.batch, args.text_length, args.list_items)
@@ -0,0 +1,91 @@
+"""
+Brand guideline PDF text extraction: sequential vs process pool, and cache hits.
+
+Builds synthetic text-heavy PDFs (no external tools needed) with the given
+page counts and times `extract_pdf_pages` with 1 and N workers, then the
+cached `extract_pdf_text` path.
+
+Usage (from backend/):
+    python -m benchmarks.pdfExtractionBenchmark --pages 20 100 200 --workers 4
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("LLM_CACHE_TIERS", "memory")
+os.environ["PDF_MAX_PAGES"] = os.getenv("PDF_MAX_PAGES", "100000")
+
+from agents import pdfExtraction
+
+LINES_PER_PAGE = 45
+
+
+def build_pdf(page_count: int) -> bytes:
+    objects: list[bytes] = []
+    page_ids = [3 + 2 * i for i in range(page_count)]
+    font_id = 3 + 2 * page_count
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode())
+
+    for i, pid in enumerate(page_ids):
+        lines = ["Brand Book - Confidential"] + [
+            f"Section {i + 1}.{n}: our voice is warm, confident and clear; palette #1A2B3C #F4F1EA #D94F30."
+            for n in range(LINES_PER_PAGE)
+        ]
+        stream = "BT /F1 9 Tf 11 TL 36 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {pid + 1} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{n} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{o:010d} 00000 n \n".encode() for o in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def timed(fn, *args, **kwargs) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def run(page_counts: list[int], workers: int) -> None:
+    # Start the pool before timing so worker spawn cost isn't counted
+    pdfExtraction.PDF_EXTRACT_WORKERS = workers
+    if workers > 1:
+        list(pdfExtraction._get_pool().map(abs, range(workers)))
+
+    print(f"{'pages':>6} {'size (KB)':>10} {'1 worker (s)':>13} {f'{workers} workers (s)':>15} {'cached (ms)':>12} {'chars sent':>11}")
+    for page_count in page_counts:
+        pdf = build_pdf(page_count)
+        sequential, (pages, _) = timed(pdfExtraction.extract_pdf_pages, pdf, workers=1)
+        parallel, (parallel_pages, _) = timed(pdfExtraction.extract_pdf_pages, pdf, workers=workers)
+        assert pages == parallel_pages
+
+        pdfExtraction.extract_pdf_text(pdf)
+        cached, result = timed(pdfExtraction.extract_pdf_text, pdf)
+
+        print(
+            f"{page_count:>6} {len(pdf) / 1024:>10.0f} {sequential:>13.3f} {parallel:>15.3f} "
+            f"{cached * 1000:>12.2f} {len(result['text']):>11}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[20, 100, 200])
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    run(args.pages, args.workers)
@@ -0,0 +1,97 @@
+"""
+Startup cost: import time and resident memory per module.
+
+Every module is imported in a fresh interpreter (so shared dependencies are
+counted for each module that pulls them in) and reported as the median of
+--repeat runs: seconds to import it and the RSS it adds over the bare
+interpreter. The last rows import main/asgiApp and then build everything
+the app defers to first use (agents/lazyLoading.py `warm_up`), which is the
+work GUNICORN_WARM_UP=1 moves into the gunicorn master.
+
+Usage (from backend/):
+    python -m benchmarks.startupBenchmark --repeat 5
+    python -m benchmarks.startupBenchmark --modules main pdfplumber
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = [
+    "openai",
+    "langchain_openai",
+    "langchain.agents",
+    "langchain_community.utilities.dalle_image_generator",
+    "pdfplumber",
+    "cloudinary.uploader",
+    "tiktoken",
+    "flask",
+    "psycopg2.extras",
+    "main",
+    "asgiApp",
+]
+WARM_MODULES = ["main", "asgiApp"]
+
+# Runs in the child interpreter: argv is (module, "warm" | "cold"); prints one JSON line
+CHILD = """
+import importlib, json, os, sys, time
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+module, mode = sys.argv[1], sys.argv[2]
+before = rss()
+started = time.perf_counter()
+importlib.import_module(module)
+result = {"importSeconds": time.perf_counter() - started, "importRss": rss() - before}
+if mode == "warm":
+    from agents.lazyLoading import warm_up
+    started = time.perf_counter()
+    warm_up()
+    result["warmSeconds"] = time.perf_counter() - started
+    result["warmRss"] = rss() - before
+print(json.dumps(result))
+"""
+
+
+def measure(module: str, warm: bool) -> dict:
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "sk-benchmark")}
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, module, "warm" if warm else "cold"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def median(runs: list[dict], field: str) -> float:
+    return statistics.median(run[field] for run in runs)
+
+
+def run(modules: list[str], repeat: int) -> None:
+    print(f"{'module':<54} {'import':>9} {'RSS':>9}")
+    for module in modules:
+        runs = [measure(module, False) for _ in range(repeat)]
+        print(f"{module:<54} {median(runs, 'importSeconds'):8.3f}s {median(runs, 'importRss') / 2**20:7.1f}MB")
+
+    for module in [m for m in WARM_MODULES if m in modules]:
+        runs = [measure(module, True) for _ in range(repeat)]
+        label = f"{module} + warm_up()"
+        seconds = median(runs, "importSeconds") + median(runs, "warmSeconds")
+        print(f"{label:<54} {seconds:8.3f}s {median(runs, 'warmRss') / 2**20:7.1f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    args = parser.parse_args()
+    run(args.modules, args.repeat)
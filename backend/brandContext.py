@@ -0,0 +1,72 @@
+import os
+from typing import Any
+
+from databaseConnection import db_connection
+from ttlCache import TTLCache
+from agents.brandAgent import parse_brand_guidelines, render_prompt_context
+
+# Prompt-ready brand context per company, read on every content request.
+# Writes in this process invalidate it; other workers pick changes up within the TTL.
+BRAND_CONTEXT_CACHE_TTL = float(os.getenv("BRAND_CONTEXT_CACHE_TTL", "60"))
+
+DEFAULT_BRAND_GUIDELINES = "Modern, professional brand with clean aesthetics"
+DEFAULT_INDUSTRY = "general business"
+
+BRAND_CONTEXT_QUERY = """
+    SELECT prompt_context, profile->>'industry', content
+    FROM brand_guidelines
+    WHERE company_id = %s;
+"""
+
+brand_context_cache = TTLCache(ttl=BRAND_CONTEXT_CACHE_TTL, max_entries=1024)
+
+
+# Build the brand context from a BRAND_CONTEXT_QUERY row
+def brand_context_from_row(row: tuple | None) -> dict[str, str]:
+    prompt_context, industry, content = row or (None, None, None)
+
+    # Rows saved before profiles were stored: derive the context once here
+    if not prompt_context and content and content.strip():
+        profile = parse_brand_guidelines(content)
+        if profile:
+            prompt_context = render_prompt_context(profile)
+            industry = profile.get("industry")
+        else:
+            prompt_context = content.strip()
+
+    return {
+        "guidelines": prompt_context or DEFAULT_BRAND_GUIDELINES,
+        "industry": industry or DEFAULT_INDUSTRY,
+    }
+
+
+# Prompt context and industry for a company (or the defaults)
+def fetch_brand_context(company_id: int) -> dict[str, str]:
+    cached = brand_context_cache.get(company_id)
+    if cached is not None:
+        return cached
+
+    conn = cursor = None
+    try:
+        conn = db_connection()
+        cursor = conn.cursor()
+        cursor.execute(BRAND_CONTEXT_QUERY, (company_id,))
+        context = brand_context_from_row(cursor.fetchone())
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+    brand_context_cache.set(company_id, context)
+    return context
+
+
+def invalidate_brand_context(company_id: Any) -> None:
+    brand_context_cache.delete(company_id)
+
+
+# Columns stored alongside the markdown guidelines when they are written
+def brand_profile_columns(content: str, profile: dict | None = None) -> tuple[dict | None, str]:
+    if profile is None:
+        profile = parse_brand_guidelines(content)
+    prompt_context = render_prompt_context(profile) if profile else content.strip()
+    return profile, prompt_context
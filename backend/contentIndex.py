@@ -0,0 +1,195 @@
+import os
+import re
+import math
+import zlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any
+
+from agents.lazyLoading import lazy_import
+from databaseConnection import db_connection
+from metrics import count_cache, timed
+
+numpy = lazy_import("numpy")
+
+# "Similar posts" lookup: every post's topic and caption is embedded locally as
+# a hashed bag of words and hashtags (signed feature hashing, unigrams and bigrams,
+# L2-normalized), and similarity is the cosine over a per-company matrix
+# searched brute force. No model calls, so saving a post stays cheap.
+#
+# Each process keeps the matrices of the CONTENT_INDEX_MAX_COMPANIES most recently
+# searched companies. Saves in this process are added right away (`add_posts`). Before
+# each search, the posts written since the last one (by any worker) are read from
+# Postgres and folded in. The look-back covers writes committed late by
+# transactions that started earlier (NOW() is the transaction start); posts
+# already indexed at the same write timestamp are skipped.
+CONTENT_INDEX_DIM = int(os.getenv("CONTENT_INDEX_DIM", "512"))
+CONTENT_INDEX_MAX_COMPANIES = int(os.getenv("CONTENT_INDEX_MAX_COMPANIES", "32"))
+CONTENT_INDEX_LOOKBACK = timedelta(seconds=int(os.getenv("CONTENT_INDEX_LOOKBACK_SECONDS", "60")))
+
+TOKEN_PATTERN = re.compile(r"#?\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+# One row per text; rows are unit length (all zeros for texts without words)
+def embed(texts: list[str]) -> Any:
+    np = numpy.get()
+    vectors = np.zeros((len(texts), CONTENT_INDEX_DIM), dtype=np.float32)
+    for row, text in enumerate(texts):
+        counts: dict[int, float] = {}
+        for token in tokenize(text):
+            h = zlib.crc32(token.encode())
+            column = h % CONTENT_INDEX_DIM
+            counts[column] = counts.get(column, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+        for column, count in counts.items():
+            # Sublinear term frequency, keeping the hash sign
+            if count:
+                vectors[row, column] = math.copysign(1.0 + math.log(abs(count)), count)
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def post_text(topic: str | None, caption: str | None) -> str:
+    return f"{topic or ''}\n{caption or ''}"
+
+
+class CompanyIndex:
+    def __init__(self, company_id: int):
+        self.company_id = company_id
+        self.lock = threading.Lock()
+        self.ids: list[int] = []
+        self.positions: dict[int, int] = {}
+        self.versions: dict[int, datetime] = {}
+        self.vectors = numpy.get().zeros((0, CONTENT_INDEX_DIM), dtype=numpy.get().float32)
+        self.synced_until: datetime | None = None
+
+    # Insert or replace posts' vectors (versions are their last write timestamps); call with `lock` held
+    def upsert(self, ids: list[int], texts: list[str], versions: list[datetime]) -> None:
+        if not ids:
+            return
+        np = numpy.get()
+        self.versions.update(zip(ids, versions))
+        size = len(self.ids)
+        new_ids: list[int] = []
+        new_rows: list[Any] = []
+        for post_id, vector in zip(ids, embed(texts)):
+            position = self.positions.get(post_id)
+            if position is None:
+                self.positions[post_id] = size + len(new_ids)
+                new_ids.append(post_id)
+                new_rows.append(vector)
+            elif position >= size:
+                new_rows[position - size] = vector
+            else:
+                self.vectors[position] = vector
+        if new_ids:
+            self.ids.extend(new_ids)
+            self.vectors = np.vstack([self.vectors, np.asarray(new_rows)])
+
+    # Fold in posts written since the last sync (all of them on the first call)
+    def sync(self) -> None:
+        since = self.synced_until - CONTENT_INDEX_LOOKBACK if self.synced_until else None
+        rows: list[tuple] = []
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    """
+                    SELECT id, COALESCE(updated_at, created_at)
+                    FROM content_posts
+                    WHERE company_id = %s
+                      AND (%s::timestamptz IS NULL OR COALESCE(updated_at, created_at) > %s);
+                    """,
+                    (self.company_id, since, since),
+                )
+                written = cursor.fetchall()
+
+                changed = [post_id for post_id, version in written if self.versions.get(post_id) != version]
+                if changed:
+                    cursor.execute(
+                        """
+                        SELECT id, topic, caption, COALESCE(updated_at, created_at)
+                        FROM content_posts
+                        WHERE id = ANY(%s);
+                        """,
+                        (changed,),
+                    )
+                    rows = cursor.fetchall()
+
+        self.upsert([r[0] for r in rows], [post_text(r[1], r[2]) for r in rows], [r[3] for r in rows])
+        if written:
+            self.synced_until = max(version for _, version in written)
+        count_cache("content_index", "synced", len(rows))
+
+    def search(self, vector: Any, limit: int, exclude: int | None = None) -> list[tuple[int, float]]:
+        np = numpy.get()
+        if not self.ids:
+            return []
+        scores = self.vectors @ vector
+        if exclude is not None and exclude in self.positions:
+            scores[self.positions[exclude]] = -np.inf
+
+        top = min(limit, len(scores))
+        candidates = np.argpartition(-scores, top - 1)[:top]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in ranked if scores[i] > 0]
+
+
+_companies: OrderedDict[int, CompanyIndex] = OrderedDict()
+_companies_lock = threading.Lock()
+
+
+def _company_index(company_id: int) -> CompanyIndex:
+    with _companies_lock:
+        index = _companies.get(company_id)
+        if index is None:
+            index = _companies[company_id] = CompanyIndex(company_id)
+        _companies.move_to_end(company_id)
+        while len(_companies) > CONTENT_INDEX_MAX_COMPANIES:
+            _companies.popitem(last=False)
+        return index
+
+
+# Add just-saved posts (dicts with id/topic/caption) to a company's index, if it is loaded
+def add_posts(company_id: int, posts: list[dict]) -> None:
+    with _companies_lock:
+        index = _companies.get(company_id)
+    if index is None:
+        return
+    with index.lock:
+        index.upsert(
+            [p["id"] for p in posts],
+            [post_text(p.get("topic"), p.get("caption")) for p in posts],
+            [datetime.fromisoformat(p.get("updatedAt") or p["createdAt"]) for p in posts],
+        )
+
+
+# Posts most similar to `post_id` (or to `text`), best first: [(id, cosine similarity)]
+@timed("similar_posts")
+def similar_posts(company_id: int, limit: int, post_id: int | None = None, text: str | None = None) -> list[tuple[int, float]]:
+    index = _company_index(company_id)
+    with index.lock:
+        index.sync()
+        if post_id is not None:
+            position = index.positions.get(post_id)
+            if position is None:
+                return []
+            vector = index.vectors[position]
+        else:
+            vector = embed([text or ""])[0]
+        return index.search(vector, limit, exclude=post_id)
+
+
+def content_index_stats() -> dict[str, Any]:
+    with _companies_lock:
+        indexes = list(_companies.values())
+    return {
+        "companies": len(indexes),
+        "posts": sum(len(index.ids) for index in indexes),
+        "dim": CONTENT_INDEX_DIM,
+    }
@@ -1,37 +1,325 @@
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
 import os
+import threading
+import time
+from collections import deque
+from typing import Any
 from dotenv import load_dotenv
 from urllib.parse import urlparse
 
+from jsonCodec import loads as json_loads
+from metrics import observe_stage
+
 load_dotenv()
 
-def db_connection():
+# JSON/JSONB columns come back parsed by orjson (writes use jsonCodec.jsonb)
+psycopg2.extras.register_default_json(loads=json_loads, globally=True)
+psycopg2.extras.register_default_jsonb(loads=json_loads, globally=True)
+
+
+# Pool settings (per process, so per gunicorn worker)
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Seconds to wait for a free connection; 0 fails fast when the pool is exhausted
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Idle connections older than this are pinged with `SELECT 1` before checkout
+POOL_HEALTHCHECK_AFTER = float(os.getenv("DB_POOL_HEALTHCHECK_AFTER", "30"))
+# Connections are recycled after this many seconds (0 disables)
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+# Connection parameters shared by the sync pool and the async pool (asyncDatabase.py)
+def connection_kwargs() -> dict[str, Any]:
     # Railway provides DATABASE_URL
     database_url = os.getenv("DATABASE_URL")
-    
+
     if database_url:
         # Parse the URL
         result = urlparse(database_url)
-        
-        return psycopg2.connect(
-            host=result.hostname,
-            dbname=result.path[1:],
-            user=result.username,
-            password=result.password,
-            port=result.port
-        )
+
+        return {
+            "host": result.hostname,
+            "dbname": result.path[1:],
+            "user": result.username,
+            "password": result.password,
+            "port": result.port,
+        }
     else:
         # Fallback to individual variables (for local development)
-        host = os.getenv("DB_HOST")
-        dbname = os.getenv("DB_NAME")
-        user = os.getenv("DB_USER")
-        password = os.getenv("DB_PASSWORD")
-        port = os.getenv("DB_PORT")
-        
-        return psycopg2.connect(
-            host=host,
-            dbname=dbname,
-            user=user,
-            password=password,
-            port=port,
-        )
+        return {
+            "host": os.getenv("DB_HOST"),
+            "dbname": os.getenv("DB_NAME"),
+            "user": os.getenv("DB_USER"),
+            "password": os.getenv("DB_PASSWORD"),
+            "port": os.getenv("DB_PORT"),
+        }
+
+
+# Cursor that times every statement (the `db_query` stage)
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            observe_stage("db_query", time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            observe_stage("db_query", time.perf_counter() - started)
+
+
+def _connect():
+    return psycopg2.connect(cursor_factory=TimedCursor, **connection_kwargs())
+
+
+# Thin proxy around a psycopg2 connection checked out from the pool.
+# `close()` returns the connection to the pool instead of closing it, so
+# existing `conn.close()` calls keep working. It can also be used as a
+# context manager: `with db_connection() as conn: ...`
+class PooledConnection:
+    def __init__(self, pool: "ConnectionPool", raw, created_at: float):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+
+    def __getattr__(self, name: str) -> Any:
+        if self._raw is None:
+            raise psycopg2.InterfaceError("connection already returned to pool")
+        return getattr(self._raw, name)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def released(self) -> bool:
+        return self._raw is None
+
+    def close(self) -> None:
+        if self._raw is None:
+            return
+        raw, self._raw = self._raw, None
+        self._pool._release(raw, self._created_at)
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        healthcheck_after: float = POOL_HEALTHCHECK_AFTER,
+        max_lifetime: float = POOL_MAX_LIFETIME,
+        connect=_connect,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError("Invalid pool size (need 0 <= min_size <= max_size, max_size >= 1)")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self.max_lifetime = max_lifetime
+        self._connect = connect
+
+        self._cond = threading.Condition()
+        # Idle entries: (raw_connection, created_at, returned_at)
+        self._idle: deque = deque()
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+
+        # Stats
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(min_size):
+            try:
+                self._idle.append((self._connect(), time.monotonic(), time.monotonic()))
+                self._size += 1
+            except Exception as e:
+                # Database may not be up yet; connections are opened lazily instead
+                print(f"Error pre-filling connection pool: {e}")
+                break
+
+    # Check out a connection, waiting up to `timeout` seconds if the pool is full
+    def getconn(self, timeout: float | None = None) -> PooledConnection:
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            idle = self._take_idle_or_slot(deadline)
+            if idle is None:
+                break
+
+            # Ping connections that have been idle for a while. The connection is
+            # off the idle list but still counted in the pool size, so the ping
+            # runs outside the lock and a slow one doesn't block other checkouts.
+            raw, created_at, returned_at = idle
+            if time.monotonic() - returned_at < self.healthcheck_after or self._ping(raw):
+                with self._cond:
+                    self._checked_out(started)
+                return PooledConnection(self, raw, created_at)
+
+            with self._cond:
+                self._discard(raw)
+                self._cond.notify()
+
+        # Connect outside the lock so slow handshakes don't block other checkouts
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._checked_out(started)
+        return PooledConnection(self, raw, time.monotonic())
+
+    # Pop a reusable idle entry, or reserve room for a new connection (returns None)
+    def _take_idle_or_slot(self, deadline: float) -> tuple | None:
+        with self._cond:
+            while True:
+                while self._idle:
+                    raw, created_at, returned_at = self._idle.pop()
+                    if self._is_usable(raw, created_at):
+                        return raw, created_at, returned_at
+                    self._discard(raw)
+
+                # Open a new connection if there is room
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolExhaustedError(
+                        f"Connection pool exhausted ({self.max_size} connections in use)"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+    def _checked_out(self, started: float) -> None:
+        waited = time.monotonic() - started
+        observe_stage("db_checkout", waited)
+        self._in_use += 1
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    # Cheap checks, done under the lock
+    def _is_usable(self, raw, created_at: float) -> bool:
+        if raw.closed:
+            return False
+        return not (self.max_lifetime and time.monotonic() - created_at > self.max_lifetime)
+
+    # Round trip to the server; called without the lock held
+    def _ping(self, raw) -> bool:
+        try:
+            with raw.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            raw.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, raw) -> None:
+        self._size -= 1
+        self._recycled += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _release(self, raw, created_at: float) -> None:
+        # Never hand out a connection with a half-finished transaction
+        healthy = not raw.closed
+        if healthy:
+            try:
+                if raw.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    raw.rollback()
+            except Exception:
+                healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy:
+                self._idle.append((raw, created_at, time.monotonic()))
+            else:
+                self._discard(raw)
+            self._cond.notify()
+
+    def closeall(self) -> None:
+        with self._cond:
+            while self._idle:
+                raw, _, _ = self._idle.pop()
+                self._size -= 1
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            return {
+                "minSize": self.min_size,
+                "maxSize": self.max_size,
+                "size": self._size,
+                "inUse": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "waitTotalMs": round(self._wait_total * 1000, 3),
+                "waitAvgMs": round(self._wait_total * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+                "waitMaxMs": round(self._wait_max * 1000, 3),
+            }
+
+
+# One pool per process; rebuilt after fork so workers never share sockets
+_pool: ConnectionPool | None = None
+_pool_pid: int | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool, _pool_pid
+
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool()
+                _pool_pid = pid
+    return _pool
+
+
+def db_connection(timeout: float | None = None) -> PooledConnection:
+    return get_pool().getconn(timeout)
+
+
+def pool_stats() -> dict[str, Any]:
+    return get_pool().stats()
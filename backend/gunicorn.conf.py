@@ -0,0 +1,36 @@
+import os
+
+# gunicorn settings, picked up automatically when gunicorn starts from backend/:
+#   gunicorn main:app --workers 4 --threads 8
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# GUNICORN_WARM_UP=1 loads the app in the master and builds the agents and heavy
+# SDKs there (agents/lazyLoading.py) before forking, so workers boot with them
+# loaded and share the pages copy-on-write. Otherwise each worker builds them
+# on first use. Database pools, executors and async clients are never built
+# before the fork, so workers don't share connections.
+GUNICORN_WARM_UP = os.getenv("GUNICORN_WARM_UP", "0") == "1"
+preload_app = GUNICORN_WARM_UP
+
+
+def when_ready(server) -> None:
+    if not GUNICORN_WARM_UP:
+        return
+
+    from agents.lazyLoading import warm_up
+
+    timings = warm_up()
+    server.log.info(
+        "Warmed up %d values in %.2fs: %s",
+        len(timings),
+        sum(timings.values()),
+        ", ".join(f"{name}={seconds:.2f}s" for name, seconds in timings.items()),
+    )
+
+
+# Start the image job executor in each worker, so in-process mode resumes jobs
+# left over from a restart (imageJobs.InProcessExecutor.sweep)
+def post_worker_init(worker) -> None:
+    from imageJobs import start_image_jobs
+
+    start_image_jobs()
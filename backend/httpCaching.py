@@ -0,0 +1,58 @@
+import hashlib
+from datetime import datetime
+from typing import Any
+
+from flask import Response, request
+
+from metrics import count_cache
+
+# Conditional GETs for the read routes. A resource's version is its row ids and
+# timestamps (created_at/updated_at, generated_at/saved_at, ...), read by a query
+# that selects only those columns. The version gives a strong ETag and a
+# Last-Modified; when the client already holds it the route answers 304
+# without loading or serializing the resource.
+#
+# Bump when a response body changes shape, so clients don't keep stale bodies
+ETAG_FORMAT_VERSION = "1"
+
+
+# ETag of the current URL (path and query string) at the given version
+def resource_etag(*version: Any) -> str:
+    raw = "|".join([ETAG_FORMAT_VERSION, request.full_path, *(str(part) for part in version)])
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def last_modified(*timestamps: datetime | None) -> datetime | None:
+    present = [t for t in timestamps if t is not None]
+    return max(present) if present else None
+
+
+# Only conditional requests need the version up front; others get it from the full row
+def is_conditional() -> bool:
+    return bool(request.if_none_match or request.if_modified_since)
+
+
+# If-None-Match takes precedence over If-Modified-Since (RFC 9110, 13.2.2)
+def is_not_modified(etag: str, modified: datetime | None) -> bool:
+    if request.if_none_match:
+        fresh = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and modified is not None:
+        # HTTP dates have whole seconds
+        fresh = modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        return False
+
+    count_cache("http", "hit" if fresh else "miss")
+    return fresh
+
+
+def cacheable(response: Response, etag: str, modified: datetime | None, cache_control: str) -> Response:
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = modified
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified(etag: str, modified: datetime | None, cache_control: str) -> Response:
+    return cacheable(Response(status=304), etag, modified, cache_control)
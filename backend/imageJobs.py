@@ -0,0 +1,397 @@
+# Background DALL-E image generation jobs.
+#
+# Jobs are stored in the `image_jobs` table and run by a pluggable executor:
+# - `InProcessExecutor` (default) runs jobs on a bounded thread pool inside the API process
+# - `WorkerProcessExecutor` only queues jobs; a separate `python imageJobs.py` process runs them
+#
+# Pick one with IMAGE_JOB_EXECUTOR=inprocess|worker.
+#
+# Every status change is announced on the IMAGE_JOB_CHANNEL Postgres channel
+# (a trigger in schema.sql, payload: job id), so subscribers don't poll.
+import os
+import time
+import uuid
+import random
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator
+
+from databaseConnection import db_connection
+from agents.rateLimiter import BATCH, llm_priority
+
+
+IMAGE_JOB_EXECUTOR = os.getenv("IMAGE_JOB_EXECUTOR", "inprocess")
+IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", "4"))
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv("IMAGE_JOB_MAX_ATTEMPTS", "3"))
+# Retry delay is IMAGE_JOB_BACKOFF * 2^(attempt - 1) seconds, plus jitter
+IMAGE_JOB_BACKOFF = float(os.getenv("IMAGE_JOB_BACKOFF", "2"))
+# How often a worker process polls for queued jobs
+IMAGE_JOB_POLL_INTERVAL = float(os.getenv("IMAGE_JOB_POLL_INTERVAL", "1"))
+# Running jobs without a heartbeat for this long are assumed lost (worker crash) and re-queued
+IMAGE_JOB_STALE_AFTER = int(os.getenv("IMAGE_JOB_STALE_AFTER", "300"))
+# Running jobs refresh updated_at this often, also while they wait in the rate limiter
+IMAGE_JOB_HEARTBEAT_INTERVAL = float(os.getenv("IMAGE_JOB_HEARTBEAT_INTERVAL", str(IMAGE_JOB_STALE_AFTER / 5)))
+# How often the in-process executor re-queues stale jobs and picks up due ones
+# (retries scheduled before a restart, jobs of a crashed process)
+IMAGE_JOB_SWEEP_INTERVAL = float(os.getenv("IMAGE_JOB_SWEEP_INTERVAL", str(IMAGE_JOB_STALE_AFTER / 2)))
+# Sync-mode SSE clients reconnect this often (async mode streams changes instead)
+IMAGE_JOB_EVENTS_RECONNECT = float(os.getenv("IMAGE_JOB_EVENTS_RECONNECT", "2"))
+
+IMAGE_JOB_CHANNEL = "image_jobs"
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+JOB_COLUMNS = """id, status, prompt, size, result_url, error, attempts, max_attempts,
+                 created_at, started_at, finished_at"""
+
+
+def row_to_job(row) -> dict[str, Any]:
+    return {
+        "jobId": row[0],
+        "status": row[1],
+        "prompt": row[2],
+        "size": row[3],
+        "url": row[4],
+        "error": row[5],
+        "attempts": row[6],
+        "maxAttempts": row[7],
+        "createdAt": row[8].isoformat() if row[8] else None,
+        "startedAt": row[9].isoformat() if row[9] else None,
+        "finishedAt": row[10].isoformat() if row[10] else None,
+    }
+
+
+def _backoff(attempt: int) -> float:
+    delay = IMAGE_JOB_BACKOFF * (2 ** (attempt - 1))
+    return delay + random.uniform(0, delay / 2)
+
+
+def _default_runner(prompt: str, size: str) -> str:
+    # Imported lazily so worker processes and tests can swap the runner
+    from agents.contentAgent import generate_image
+    return generate_image(prompt, size)
+
+
+# =====================================================
+# JOB STATE
+# =====================================================
+def create_job(prompt: str, size: str, max_attempts: int = IMAGE_JOB_MAX_ATTEMPTS) -> dict[str, Any]:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO image_jobs (id, prompt, size, max_attempts)
+                VALUES (%s, %s, %s, %s)
+                RETURNING {JOB_COLUMNS};
+                """,
+                (str(uuid.uuid4()), prompt, size, max_attempts),
+            )
+            row = cursor.fetchone()
+        conn.commit()
+    return row_to_job(row)
+
+
+def get_job(job_id: str) -> dict[str, Any] | None:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {JOB_COLUMNS} FROM image_jobs WHERE id = %s;", (job_id,))
+            row = cursor.fetchone()
+    return row_to_job(row) if row else None
+
+
+# Atomically move one due job (or a specific one, whose retry timing the
+# in-process executor already handles) from queued to running
+def claim_job(job_id: str | None = None) -> dict[str, Any] | None:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE image_jobs
+                SET status = 'running', attempts = attempts + 1,
+                    started_at = NOW(), updated_at = NOW()
+                WHERE id = (
+                    SELECT id FROM image_jobs
+                    WHERE status = 'queued'
+                      AND (id = %s OR (%s::text IS NULL AND run_after <= NOW()))
+                    ORDER BY created_at
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING {JOB_COLUMNS};
+                """,
+                (job_id, job_id),
+            )
+            row = cursor.fetchone()
+        conn.commit()
+    return row_to_job(row) if row else None
+
+
+# Finishing and retrying only apply while the job is still on this claim (same
+# attempt), so a run whose job was re-queued as stale can't overwrite its successor
+def _finish_job(job: dict[str, Any], url: str | None, error: str | None) -> bool:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE image_jobs
+                SET status = %s, result_url = %s, error = %s,
+                    finished_at = NOW(), updated_at = NOW()
+                WHERE id = %s AND status = 'running' AND attempts = %s;
+                """,
+                ("succeeded" if url else "failed", url, error, job["jobId"], job["attempts"]),
+            )
+            updated = cursor.rowcount == 1
+        conn.commit()
+    return updated
+
+
+def _retry_job(job: dict[str, Any], error: str, delay: float) -> bool:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE image_jobs
+                SET status = 'queued', error = %s,
+                    run_after = NOW() + make_interval(secs => %s), updated_at = NOW()
+                WHERE id = %s AND status = 'running' AND attempts = %s;
+                """,
+                (error, delay, job["jobId"], job["attempts"]),
+            )
+            updated = cursor.rowcount == 1
+        conn.commit()
+    return updated
+
+
+def _heartbeat(job: dict[str, Any]) -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE image_jobs SET updated_at = NOW()
+                WHERE id = %s AND status = 'running' AND attempts = %s;
+                """,
+                (job["jobId"], job["attempts"]),
+            )
+        conn.commit()
+
+
+# Refresh the job's heartbeat in the background until the block exits
+@contextmanager
+def heartbeat(job: dict[str, Any], interval: float = IMAGE_JOB_HEARTBEAT_INTERVAL) -> Iterator[None]:
+    stopped = threading.Event()
+
+    def beat() -> None:
+        while not stopped.wait(interval):
+            try:
+                _heartbeat(job)
+            except Exception as e:
+                print(f"Image job {job['jobId']} heartbeat error: {e}")
+
+    thread = threading.Thread(target=beat, name="image-job-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+
+
+def due_job_ids() -> list[str]:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id FROM image_jobs
+                WHERE status = 'queued' AND run_after <= NOW()
+                ORDER BY created_at;
+                """
+            )
+            rows = cursor.fetchall()
+    return [row[0] for row in rows]
+
+
+def requeue_stale_jobs() -> int:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE image_jobs
+                SET status = 'queued', updated_at = NOW()
+                WHERE status = 'running'
+                  AND updated_at < NOW() - make_interval(secs => %s);
+                """,
+                (IMAGE_JOB_STALE_AFTER,),
+            )
+            count = cursor.rowcount
+        conn.commit()
+    return count
+
+
+# Run a claimed job; returns the retry delay if it should run again
+def run_job(job: dict[str, Any], runner: Callable[[str, str], str] = _default_runner) -> float | None:
+    try:
+        # Background work yields the DALL-E budget to interactive requests
+        with heartbeat(job), llm_priority(BATCH):
+            url = runner(job["prompt"], job["size"])
+        error = url if not url or url.startswith("Error") else None
+    except Exception as e:
+        error = f"Error generating image: {e}"
+
+    if error is None:
+        settled = _finish_job(job, url, None)
+    elif job["attempts"] < job["maxAttempts"]:
+        delay = _backoff(job["attempts"])
+        if _retry_job(job, error, delay):
+            return delay
+        settled = False
+    else:
+        settled = _finish_job(job, None, error)
+
+    if not settled:
+        print(f"Image job {job['jobId']} attempt {job['attempts']} was superseded; result dropped")
+    return None
+
+
+# =====================================================
+# EXECUTORS
+# =====================================================
+class InProcessExecutor:
+    def __init__(
+        self,
+        max_workers: int = IMAGE_JOB_WORKERS,
+        runner: Callable[[str, str], str] = _default_runner,
+        sweep_interval: float = IMAGE_JOB_SWEEP_INTERVAL,
+    ):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-job")
+        self._runner = runner
+        # Retry timers live in memory, so a restart would leave their jobs queued
+        # forever; the sweeper (first run at startup) resubmits them
+        self._stopped = threading.Event()
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop, args=(sweep_interval,), name="image-job-sweeper", daemon=True
+        )
+        self._sweeper.start()
+
+    def submit(self, job_id: str) -> None:
+        self._pool.submit(self._run, job_id)
+
+    def _run(self, job_id: str) -> None:
+        try:
+            job = claim_job(job_id)
+            if not job:
+                return
+            delay = run_job(job, self._runner)
+            if delay is not None:
+                timer = threading.Timer(delay, self.submit, args=(job_id,))
+                timer.daemon = True
+                timer.start()
+        except Exception as e:
+            print(f"Error running image job {job_id}: {e}")
+
+    # Claiming is atomic, so a job submitted twice (or by several processes) runs once
+    def sweep(self) -> None:
+        requeued = requeue_stale_jobs()
+        if requeued:
+            print(f"Re-queued {requeued} stale image jobs")
+        for job_id in due_job_ids():
+            self.submit(job_id)
+
+    def _sweep_loop(self, interval: float) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Image job sweep error: {e}")
+            self._stopped.wait(interval)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._stopped.set()
+        self._pool.shutdown(wait=wait)
+
+
+class WorkerProcessExecutor:
+    # Jobs are already queued in the table; a worker process picks them up
+    def submit(self, job_id: str) -> None:
+        pass
+
+    def shutdown(self, wait: bool = True) -> None:
+        pass
+
+
+_executor: Any = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if IMAGE_JOB_EXECUTOR == "worker":
+                    _executor = WorkerProcessExecutor()
+                else:
+                    _executor = InProcessExecutor()
+    return _executor
+
+
+def set_executor(executor) -> None:
+    global _executor
+    with _executor_lock:
+        _executor = executor
+
+
+# Start the executor with the server, so in-process mode picks up leftover jobs
+# without waiting for the first submission
+def start_image_jobs() -> None:
+    get_executor()
+
+
+def submit_image_job(prompt: str, size: str) -> dict[str, Any]:
+    job = create_job(prompt, size)
+    get_executor().submit(job["jobId"])
+    return job
+
+
+# =====================================================
+# WORKER PROCESS
+# =====================================================
+def run_worker(max_workers: int = IMAGE_JOB_WORKERS, runner: Callable[[str, str], str] = _default_runner) -> None:
+    print(f"Image job worker started ({max_workers} workers)")
+    slots = threading.BoundedSemaphore(max_workers)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-job")
+    last_stale_check = 0.0
+
+    def process(job: dict[str, Any]) -> None:
+        try:
+            run_job(job, runner)
+        except Exception as e:
+            print(f"Error running image job {job['jobId']}: {e}")
+        finally:
+            slots.release()
+
+    while True:
+        try:
+            if time.monotonic() - last_stale_check > IMAGE_JOB_STALE_AFTER / 2:
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    print(f"Re-queued {requeued} stale image jobs")
+                last_stale_check = time.monotonic()
+
+            slots.acquire()
+            try:
+                job = claim_job()
+            except Exception:
+                slots.release()
+                raise
+
+            if job:
+                pool.submit(process, job)
+                continue
+            slots.release()
+        except Exception as e:
+            print(f"Image job worker error: {e}")
+        time.sleep(IMAGE_JOB_POLL_INTERVAL)
+
+
+if __name__ == "__main__":
+    run_worker()
@@ -0,0 +1,66 @@
+import decimal
+from datetime import date
+from typing import Any
+
+import orjson
+from flask import Response
+from flask.json.provider import JSONProvider
+from psycopg2.extras import Json
+from werkzeug.http import http_date
+
+# JSON on the hot paths goes through orjson: API responses (Flask provider
+# below), JSONB parameters and JSONB results (psycopg2/psycopg typecasters
+# registered in databaseConnection.py / asyncDatabase.py). Hashes used as
+# cache keys keep using json.dumps, so their keys don't change.
+# Responses keep Flask's sorted keys so identical data gives identical bytes.
+RESPONSE_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+STORAGE_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+loads = orjson.loads
+
+
+# Types orjson doesn't serialize natively, handled like Flask's default provider
+def _default(value: Any) -> Any:
+    if isinstance(value, date):
+        return http_date(value)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> str:
+    return orjson.dumps(value, default=_default, option=STORAGE_OPTIONS).decode()
+
+
+def dumpb(value: Any) -> bytes:
+    return orjson.dumps(value, default=_default, option=STORAGE_OPTIONS)
+
+
+# JSONB query parameter, serialized with orjson
+def jsonb(value: Any) -> Json:
+    return Json(value, dumps=dumps)
+
+
+# Deep copy of JSON data; much faster than copy.deepcopy for nested dicts/lists
+def clone(value: Any) -> Any:
+    return orjson.loads(orjson.dumps(value, default=_default, option=STORAGE_OPTIONS))
+
+
+class OrjsonProvider(JSONProvider):
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=_default, option=RESPONSE_OPTIONS).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    # jsonify() without the str round-trip: the body is orjson's bytes as-is
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=RESPONSE_OPTIONS),
+            mimetype="application/json",
+        )
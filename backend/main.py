@@ -1,89 +1,240 @@
-from typing import Any
-from flask import Flask, Response, request, jsonify
+from typing import Any, Callable, Iterable
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from databaseConnection import db_connection
+from psycopg2.extras import execute_values
+from databaseConnection import db_connection, pool_stats
+from imageJobs import IMAGE_JOB_EVENTS_RECONNECT, start_image_jobs, submit_image_job, get_job
+from ttlCache import TTLCache
+from storage import upload_files, upload_with_retry
+from analysisCache import (
+    record_uploads,
+    lookup_upload_hashes,
+    get_cached_analyses,
+    store_analyses,
+    pending_analyses,
+    storable_analyses,
+    merge_analyses,
+)
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 import os
+import io
 import json
+import base64
+import queue
+import time
 import traceback
-import cloudinary
-import cloudinary.uploader
-
-from agents.brandAgent import analyze_brand, analyze_guidelines, generate_brand_guidelines
-from agents.contentAgent import analyze_images, generate_caption, generate_image_prompt, generate_image
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from agents.brandAgent import PDF_ANALYSIS_STAGE, QUESTIONNAIRE_STAGE, run_guidelines_pipeline
+from brandContext import fetch_brand_context, invalidate_brand_context, brand_profile_columns
+from agents.contentAgent import IMAGE_ANALYSIS_VERSION, analyze_images_batch, generate_caption, generate_image_prompt, generate_image, shared_caption_prefix_tokens
+from agents.responseCache import response_cache
+from agents.rateLimiter import BATCH, llm_priority, rate_limiter
+from agents.analysisCompaction import compaction_stats
+from requestCoalescing import coalesce_requests, coalescing_stats
+from metrics import record_request, render_metrics
+from jsonCodec import OrjsonProvider, dumps as json_dumps, jsonb
+from httpCaching import cacheable, is_conditional, is_not_modified, last_modified, not_modified, resource_etag
+from contentIndex import add_posts, similar_posts, content_index_stats
+from agents.fanOut import FAN_OUT_MAX_WORKERS, fan_out, CancelToken, FanOutCancelled, FanOutError
 
 # Load environment variables
 load_dotenv()
 
 # Define `app`
 app = Flask(__name__)
-
-# Setup CORS
-CORS(app, resources={
-        r"/api/*": {
-            "origins": [
-            "http://localhost:3000", # Local
-            "https://topbox-mvp-git-dev-dev-gaitanos-projects.vercel.app", # dev
-            "https://topbox-mvp-git-api-integration-dev-gaitanos-projects.vercel.app",
-            "https://topbox-agency.vercel.app" # Prod
-            ],
-            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
-            "supports_credentials": True,
-        }
-    },
-)
-
-# Configure cloudinary
-cloudinary.config(
-    cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
-    api_key=os.getenv("CLOUDINARY_API_KEY"),
-    api_secret=os.getenv("CLOUDINARY_API_SECRET")
-)
+app.json = OrjsonProvider(app)
+
+# Setup CORS (shared with the ASGI app in asgiApp.py)
+CORS_SETTINGS: dict[str, Any] = {
+    "origins": [
+        "http://localhost:3000", # Local
+        "https://topbox-mvp-git-dev-dev-gaitanos-projects.vercel.app", # dev
+        "https://topbox-mvp-git-api-integration-dev-gaitanos-projects.vercel.app",
+        "https://topbox-agency.vercel.app" # Prod
+    ],
+    "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+    "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key", "If-None-Match", "If-Modified-Since"],
+    "expose_headers": ["X-Next-Cursor", "Idempotent-Replayed", "X-Request-Coalesced", "ETag", "Last-Modified"],
+    "supports_credentials": True,
+}
+CORS(app, resources={r"/api/*": CORS_SETTINGS})
+
+# Request latency per route template (streamed responses: until the first byte)
+@app.before_request
+def start_request_timer() -> None:
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_latency(response: Response) -> Response:
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        record_request(route, request.method, response.status_code, time.perf_counter() - started)
+    return response
+
+
+# Callers opt out of cached LLM responses with `fresh=true` (body, form or query string)
+def wants_fresh(payload: Any = None, query_args: Any = None) -> bool:
+    value = payload.get("fresh") if payload else None
+    if value is None:
+        value = (request.args if query_args is None else query_args).get("fresh")
+    return value is True or str(value).strip().lower() in ("true", "1")
+
+
+# Cache-Control of the read routes (ETag/Last-Modified are set from row timestamps, see
+# httpCaching.py). Companies are never edited, so clients may reuse them for a while;
+# guidelines and content change from the frontend and are revalidated on every request.
+CACHE_CONTROL: dict[str, str] = {
+    "company": f"private, max-age={int(os.getenv('COMPANY_CACHE_MAX_AGE', '60'))}",
+    "brandGuidelines": "private, no-cache",
+    "latestContent": "private, no-cache",
+    "contentList": "private, no-cache",
+}
+
+
+# Opaque pagination cursors: url-safe base64 of a JSON array of sort keys
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Malformed cursor")
+    if not isinstance(values, list):
+        raise ValueError("Malformed cursor")
+    return values
 
 
 # =====================================================
 # COMPANIES
 # =====================================================
+# API field -> companies column
+COMPANY_FIELDS: dict[str, str] = {
+    "id": "id",
+    "name": "name",
+    "logo": "logo",
+    "industry": "industry",
+    "email": "email",
+    "description": "description",
+    "target_audience": "target_audience",
+    "color_palette": "color_palette",
+    "unique_value": "unique_value",
+    "main_competitors": "main_competitors",
+    "personality": "personality",
+    "tone": "tone",
+    "createdAt": "created_at",
+}
+COMPANIES_DEFAULT_LIMIT = 100
+COMPANIES_MAX_LIMIT = 500
+
+
+# API fields of a company from its row, keyed by column
+def company_from_row(fields: list[str], row: dict[str, Any]) -> dict[str, Any]:
+    company: dict[str, Any] = {}
+    for f in fields:
+        value = row[COMPANY_FIELDS[f]]
+        company[f] = value.isoformat() if f == "createdAt" and value else value
+    return company
+
+
+# Short-lived per-process cache of company pages. Creating a company clears it in
+# this process only; other workers list the new company within COMPANIES_CACHE_TTL.
+companies_cache = TTLCache(ttl=float(os.getenv("COMPANIES_CACHE_TTL", "30")), max_entries=256)
+
+
+# Escape LIKE wildcards so user input is matched literally
+def like_prefix(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+# Paged company directory:
+#   ?fields=id,name,logo   only return these fields (default: all)
+#   ?q=acme                case-insensitive name prefix search
+#   ?limit=100&cursor=...  page size and the X-Next-Cursor value from the previous page
 @app.route("/api/companies", methods=["GET"])
 def get_companies() -> tuple[Response, int]:
     conn = cursor = None
 
     try:
-        conn = db_connection()
-        cursor = conn.cursor()
+        fields_raw = (request.args.get("fields") or "").strip()
+        fields = [f.strip() for f in fields_raw.split(",") if f.strip()] or list(COMPANY_FIELDS)
+        unknown = [f for f in fields if f not in COMPANY_FIELDS]
+        if unknown:
+            return jsonify({
+                "success": False,
+                "message": f"Unknown fields: {', '.join(unknown)}"
+            }), 400
 
-        # Get all companies from database
-        cursor.execute("""
-                       SELECT id, name, logo, industry, email, description,
-                       target_audience, color_palette, unique_value,
-                       main_competitors, personality, tone, created_at
-                       FROM companies ORDER BY created_at;
-                       """)
-        rows = cursor.fetchall() or []
+        limit_raw = (request.args.get("limit") or "").strip()
+        limit = int(limit_raw) if limit_raw.isdigit() else COMPANIES_DEFAULT_LIMIT
+        limit = max(1, min(limit, COMPANIES_MAX_LIMIT))
+        search = (request.args.get("q") or "").strip()
+        cursor_raw = (request.args.get("cursor") or "").strip()
+
+        cache_key = (tuple(fields), search.lower(), limit, cursor_raw)
+        cached = companies_cache.get(cache_key)
+        if cached is None:
+            conditions: list[str] = []
+            params: list[Any] = []
+
+            # Served by the lower(name) text_pattern_ops index
+            if search:
+                conditions.append("lower(name) LIKE %s")
+                params.append(like_prefix(search.lower()))
+
+            # Resume after the last row of the previous page
+            if cursor_raw:
+                try:
+                    after_created_at, after_id = decode_cursor(cursor_raw)
+                    params.extend([datetime.fromisoformat(after_created_at), int(after_id)])
+                except (ValueError, TypeError):
+                    return jsonify({"success": False, "message": "Invalid cursor"}), 400
+                conditions.append("(created_at, id) > (%s, %s)")
+
+            # id and created_at are always selected for the cursor
+            columns = ["id", "created_at"] + [COMPANY_FIELDS[f] for f in fields if f not in ("id", "createdAt")]
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
 
-        # Store companies in a list of dicts
-        companies: list[dict[str, Any]] = [
-            {
-                "id": r[0],
-                "name": r[1],
-                "logo": r[2],
-                "industry": r[3],
-                "email": r[4],
-                "description": r[5],
-                "target_audience": r[6],
-                "color_palette": r[7],
-                "unique_value": r[8],
-                "main_competitors": r[9],
-                "personality": r[10],
-                "tone": r[11],
-                "createdAt": r[12].isoformat() if r[12] else None,
-            }
-            for r in rows
-        ]
+            conn = db_connection()
+            cursor = conn.cursor()
+
+            # Get a page of companies from database (one extra row to detect the next page)
+            cursor.execute(
+                f"""
+                SELECT {", ".join(columns)}
+                FROM companies
+                {where}
+                ORDER BY created_at, id
+                LIMIT %s;
+                """,
+                (*params, limit + 1),
+            )
+            rows = cursor.fetchall() or []
+
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = encode_cursor([rows[-1][1].isoformat(), rows[-1][0]])
+
+            # Store companies in a list of dicts
+            companies = [company_from_row(fields, dict(zip(columns, r))) for r in rows]
+
+            cached = (companies, next_cursor)
+            companies_cache.set(cache_key, cached)
+
+        companies, next_cursor = cached
+        response = jsonify(companies)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
 
-        return jsonify(companies), 200
+        return response, 200
 
     except Exception as e:
         print(f"Error fetching companies: {e}")
@@ -161,11 +312,12 @@ def create_company() -> tuple[Response, int]:
             RETURNING id, name, created_at;
             """,
             (name, industry, email, monthly_budget, description, target_audience,
-            unique_value, json.dumps(competitors_list), json.dumps(brand_personality),
+            unique_value, jsonb(competitors_list), jsonb(brand_personality),
             brand_tone),
         )
         row = cursor.fetchone()
         conn.commit()
+        companies_cache.clear()
 
         # Check if row was returned
         if not row:
@@ -209,17 +361,17 @@ def get_company(company_id) -> tuple[Response, int]:
         conn = db_connection()
         cursor = conn.cursor()
 
-        # Get company from database
-        cursor.execute(
-            """
-            SELECT id, name, industry, email, monthly_budget,
-                   description, target_audience, unique_value,
-                   main_competitors, brand_personality, brand_tone, created_at
-            FROM companies
-            WHERE id = %s;
-            """,
-            (company_id,),
-        )
+        # Answer conditional requests from the company's version alone
+        if is_conditional():
+            cursor.execute("SELECT created_at FROM companies WHERE id = %s;", (company_id,))
+            version = cursor.fetchone()
+            etag = resource_etag(*version) if version else None
+            if etag and is_not_modified(etag, version[0]):
+                return not_modified(etag, version[0], CACHE_CONTROL["company"]), 304
+
+        # Get company from database (every field of the list route)
+        columns = list(COMPANY_FIELDS.values())
+        cursor.execute(f"SELECT {', '.join(columns)} FROM companies WHERE id = %s;", (company_id,))
         row = cursor.fetchone()
 
         if not row:
@@ -228,23 +380,11 @@ def get_company(company_id) -> tuple[Response, int]:
                 "message": "Company not found"
             }), 404
 
-        # Store company data in a dict
-        company: dict[str, Any] = {
-            "id": row[0],
-            "name": row[1],
-            "industry": row[2],
-            "email": row[3],
-            "monthly_budget": row[4],
-            "description": row[5],
-            "target_audience": row[6],
-            "unique_value": row[7],
-            "main_competitors": row[8],
-            "brand_personality": row[9],
-            "brand_tone": row[10],
-            "createdAt": row[11].isoformat() if row[11] else None,
-        }
-
-        return jsonify(company), 200
+        row_by_column = dict(zip(columns, row))
+        company = company_from_row(list(COMPANY_FIELDS), row_by_column)
+        created_at = row_by_column["created_at"]
+
+        return cacheable(jsonify(company), resource_etag(created_at), created_at, CACHE_CONTROL["company"]), 200
 
     except Exception as e:
         print(f"Error fetching company: {e}")
@@ -264,6 +404,113 @@ def get_company(company_id) -> tuple[Response, int]:
 # =====================================================
 # BRAND GUIDELINES
 # =====================================================
+# Stored guidelines pipeline artifacts, {stage: {"inputHash", "inputs", "output"}}. Guidelines
+# uploaded before artifacts were stored seed the PDF analysis from file_analysis.
+def load_guideline_artifacts(cursor: Any, company_id: int) -> dict[str, dict]:
+    cursor.execute(
+        """
+        SELECT stage, input_hash, inputs, output FROM brand_guideline_artifacts WHERE company_id = %s
+        UNION ALL
+        SELECT 'file_analysis', NULL, NULL, file_analysis FROM brand_guidelines
+        WHERE company_id = %s AND file_analysis IS NOT NULL;
+        """,
+        (company_id, company_id),
+    )
+    artifacts: dict[str, dict] = {}
+    file_analysis = None
+    for stage, input_hash, inputs, output in cursor.fetchall():
+        if stage == "file_analysis":
+            file_analysis = output
+        else:
+            artifacts[stage] = {"inputHash": input_hash, "inputs": inputs, "output": output}
+
+    if PDF_ANALYSIS_STAGE not in artifacts and file_analysis:
+        artifacts[PDF_ANALYSIS_STAGE] = {"inputHash": None, "inputs": None, "output": file_analysis}
+    return artifacts
+
+
+# The pipeline runs for seconds to minutes, so the routes load artifacts on a
+# connection that is returned before it starts, and check out another to save
+def fetch_guideline_artifacts(company_id: int) -> dict[str, dict]:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            return load_guideline_artifacts(cursor, company_id)
+
+
+def save_guideline_artifacts(cursor: Any, company_id: int, artifacts: dict[str, dict]) -> None:
+    if not artifacts:
+        return
+    execute_values(
+        cursor,
+        """
+        INSERT INTO brand_guideline_artifacts (company_id, stage, input_hash, inputs, output, updated_at)
+        VALUES %s
+        ON CONFLICT (company_id, stage)
+        DO UPDATE SET
+            input_hash = EXCLUDED.input_hash,
+            inputs = EXCLUDED.inputs,
+            output = EXCLUDED.output,
+            updated_at = EXCLUDED.updated_at;
+        """,
+        [
+            (company_id, stage, artifact["inputHash"], jsonb(artifact["inputs"]), jsonb(artifact["output"]))
+            for stage, artifact in artifacts.items()
+        ],
+        template="(%s, %s, %s, %s, %s, NOW())",
+    )
+
+
+def save_uploaded_guidelines(cursor: Any, company_id: int, filename: str, file_url: str, analysis: dict) -> None:
+    cursor.execute(
+        """
+        INSERT INTO brand_guidelines (company_id, file_filename, file_path,
+                                      file_analysis, uploaded_at)
+        VALUES (%s, %s, %s, %s, NOW())
+        ON CONFLICT (company_id)
+        DO UPDATE SET
+            file_filename = EXCLUDED.file_filename,
+            file_path = EXCLUDED.file_path,
+            file_analysis = EXCLUDED.file_analysis,
+            uploaded_at = EXCLUDED.uploaded_at;
+        """,
+        (company_id, filename, file_url, jsonb(analysis)),
+    )
+
+
+# Store generated guidelines with the structured profile and the prompt-ready
+# context used by content generation
+def save_generated_guidelines(cursor: Any, company_id: int, guidelines: dict) -> None:
+    cursor.execute(
+        """
+        INSERT INTO brand_guidelines (company_id, content, profile, prompt_context, generated_at)
+        VALUES (%s, %s, %s, %s, NOW())
+        ON CONFLICT (company_id)
+        DO UPDATE SET
+            content = EXCLUDED.content,
+            profile = EXCLUDED.profile,
+            prompt_context = EXCLUDED.prompt_context,
+            generated_at = EXCLUDED.generated_at;
+        """,
+        (company_id, guidelines["content"], jsonb(guidelines["profile"]), guidelines["promptContext"]),
+    )
+
+
+# Upload callback for the pipeline: stores the PDF while it is being analyzed
+def guidelines_pdf_store(company_id: int, filename: str, file_bytes: bytes) -> Callable[[], str]:
+    return lambda: upload_with_retry(
+        io.BytesIO(file_bytes),
+        folder=f"uploaded-brand-guidelines/{company_id}",
+        filename=filename,
+        public_id=filename.rsplit(".", 1)[0],
+        resource_type="auto"
+    )
+
+
+# Status for a failed pipeline run: bad input (questionnaire/PDF) vs our failure
+def pipeline_error_status(pipeline: dict) -> int:
+    return 400 if pipeline.get("stage") in (QUESTIONNAIRE_STAGE, PDF_ANALYSIS_STAGE) else 500
+
+
 @app.route("/api/brand-guidelines/upload", methods=["POST"])
 def upload_brand_guidelines() -> tuple[Response, int]:
     conn = cursor = None
@@ -295,52 +542,43 @@ def upload_brand_guidelines() -> tuple[Response, int]:
             }), 400
 
         filename = secure_filename(file.filename)
-        uploaded_analysis = analyze_guidelines(file)
-
-        if uploaded_analysis.get("success") is False:
-            return jsonify({
-                "success": False,
-                "message": "Guidelines analysis failed",
-                "error": uploaded_analysis.get("error")
-            }), 400
-
-        # Seek back to start of file
-        file.stream.seek(0)
-
-        # Save uploaded file to cloudinary
-        upload_result = cloudinary.uploader.upload(
-            file,
-            folder=f"uploaded-brand-guidelines/{company_id}",
-            public_id=filename.rsplit(".", 1)[0],
-            resource_type="auto"
+        file_bytes = file.read()
+
+        artifacts = fetch_guideline_artifacts(company_id)
+
+        # Analyze the PDF and store it (cloudinary) concurrently
+        pipeline = run_guidelines_pipeline(
+            None,
+            pdf_bytes=file_bytes,
+            store_pdf=guidelines_pdf_store(company_id, filename, file_bytes),
+            pdf_filename=filename,
+            artifacts=artifacts,
+            fresh=wants_fresh(request.form),
         )
 
-        file_url = upload_result["secure_url"]
-
         conn = db_connection()
         cursor = conn.cursor()
+        save_guideline_artifacts(cursor, company_id, pipeline["artifacts"])
+
+        if pipeline.get("success") is False:
+            conn.commit()
+            status = pipeline_error_status(pipeline)
+            return jsonify({
+                "success": False,
+                "message": "Guidelines analysis failed" if status == 400 else "Failed to upload guidelines",
+                "error": pipeline.get("error")
+            }), status
 
         # Save uploaded file data to database
-        cursor.execute(
-            """
-            INSERT INTO brand_guidelines (company_id, file_filename, file_path,
-                                          file_analysis, uploaded_at)
-            VALUES (%s, %s, %s, %s, NOW())
-            ON CONFLICT (company_id)
-            DO UPDATE SET
-                file_filename = EXCLUDED.file_filename,
-                file_path = EXCLUDED.file_path,
-                uploaded_at = EXCLUDED.uploaded_at;
-            """,
-            (company_id, filename, file_url, json.dumps(uploaded_analysis)),
-        )
+        save_uploaded_guidelines(cursor, company_id, filename, pipeline["fileUrl"], pipeline["uploadedAnalysis"])
         conn.commit()
 
         return jsonify(
             {
                 "success": True,
                 "message": "Guidelines uploaded successfully",
-                "fileUrl": file_url,
+                "fileUrl": pipeline["fileUrl"],
+                "stages": pipeline["stages"],
             }
         ), 201
 
@@ -361,65 +599,143 @@ def upload_brand_guidelines() -> tuple[Response, int]:
 
 
 @app.route("/api/brand-guidelines/generate", methods=["POST"])
+@coalesce_requests
 def generate_guidelines() -> tuple[Response, int]:
     conn = cursor = None
 
     try:
-        conn = db_connection()
-        cursor = conn.cursor()
-
         # Get company data from questionare
         data = request.get_json()
         company_id = data.get('companyId')
         questionnaire = data.get('questionnaire', {})
-        
-        # Analyze brand and generate guidelines
-        brand_profile = analyze_brand(questionnaire)
-        print(f"Brand profile result: {brand_profile}")
+        fresh = wants_fresh(data)
+
+        # Analyze the questionnaire and merge with the analysis of any uploaded
+        # guidelines; stages whose inputs are unchanged are reused
+        artifacts = fetch_guideline_artifacts(company_id)
+        guidelines = run_guidelines_pipeline(questionnaire, artifacts=artifacts, fresh=fresh)
+        print(f"Guidelines pipeline stages: {guidelines['stages']}")
+
+        conn = db_connection()
+        cursor = conn.cursor()
+        save_guideline_artifacts(cursor, company_id, guidelines["artifacts"])
 
-        # Check if analyze_brand returned an error
-        if brand_profile.get("success") is False:
+        if guidelines.get("success") is False:
+            conn.commit()
+            status = pipeline_error_status(guidelines)
             return jsonify({
                 "success": False,
-                "message": "Failed to analyze brand",
-                "error": brand_profile.get("error", "Unknown error")
+                "message": "Failed to analyze brand" if status == 400 else "Failed to generate guidelines",
+                "error": guidelines.get("error", "Unknown error")
+            }), status
+
+        save_generated_guidelines(cursor, company_id, guidelines)
+        conn.commit()
+        invalidate_brand_context(company_id)
+
+        return jsonify({
+            "success": True,
+            "message": "Guidelines generated successfully",
+            "content": guidelines["content"],
+            "profile": guidelines["brandProfile"],
+            "stages": guidelines["stages"],
+            "regeneratedSections": guidelines["regeneratedSections"],
+        }), 201
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+        print(f"Failed to generate guidelines: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": "Failed to generate guidelines",
+            "error": str(e)
+        }), 500
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+# Upload and generate in one request: questionnaire analysis, PDF analysis and
+# the PDF upload run concurrently, then the profiles are merged
+@app.route("/api/brand-guidelines/pipeline", methods=["POST"])
+def run_guidelines_pipeline_route() -> tuple[Response, int]:
+    conn = cursor = None
+
+    try:
+        company_id_raw = (request.form.get("companyId") or "").strip()
+        if not company_id_raw.isdigit():
+            return jsonify({
+                "success": False,
+                "message": "Invalid companyId"
             }), 400
+        company_id = int(company_id_raw)
 
-        # Fetch uploaded file analysis if it exists
-        cursor.execute(
-            "SELECT file_analysis FROM brand_guidelines WHERE company_id = %s;",
-            (company_id,)
+        try:
+            questionnaire = app.json.loads(request.form.get("questionnaire") or "{}")
+        except ValueError:
+            questionnaire = None
+        if not isinstance(questionnaire, dict):
+            return jsonify({
+                "success": False,
+                "message": "questionnaire must be a JSON object"
+            }), 400
+
+        # The PDF is optional; without one the last uploaded analysis is merged
+        file = request.files.get("file")
+        filename = file_bytes = store_pdf = None
+        if file and file.filename:
+            filename = secure_filename(file.filename)
+            file_bytes = file.read()
+            store_pdf = guidelines_pdf_store(company_id, filename, file_bytes)
+
+        artifacts = fetch_guideline_artifacts(company_id)
+
+        guidelines = run_guidelines_pipeline(
+            questionnaire,
+            pdf_bytes=file_bytes,
+            store_pdf=store_pdf,
+            pdf_filename=filename,
+            artifacts=artifacts,
+            fresh=wants_fresh(request.form),
         )
-        row = cursor.fetchone()
-        uploaded_analysis = row[0] if row and row[0] else None
 
-        brand_guidelines = generate_brand_guidelines(brand_profile, uploaded_analysis)
+        conn = db_connection()
+        cursor = conn.cursor()
+        save_guideline_artifacts(cursor, company_id, guidelines["artifacts"])
 
-        # Insert generated guidelines into database (also store analysis JSON)
-        cursor.execute(
-            """
-            INSERT INTO brand_guidelines (company_id, content, generated_at)
-            VALUES (%s, %s, NOW())
-            ON CONFLICT (company_id)
-            DO UPDATE SET
-                content = EXCLUDED.content,
-                generated_at = EXCLUDED.generated_at;
-            """,
-            (company_id, brand_guidelines),
-        )
+        if guidelines.get("success") is False:
+            conn.commit()
+            return jsonify({
+                "success": False,
+                "message": guidelines.get("message", "Failed to generate guidelines"),
+                "error": guidelines.get("error", "Unknown error"),
+                "stage": guidelines.get("stage"),
+            }), pipeline_error_status(guidelines)
+
+        if file_bytes is not None:
+            save_uploaded_guidelines(cursor, company_id, filename, guidelines["fileUrl"], guidelines["uploadedAnalysis"])
+        save_generated_guidelines(cursor, company_id, guidelines)
         conn.commit()
+        invalidate_brand_context(company_id)
 
         return jsonify({
             "success": True,
             "message": "Guidelines generated successfully",
-            "content": brand_guidelines,
-            "profile": brand_profile,
+            "content": guidelines["content"],
+            "profile": guidelines["profile"],
+            "fileUrl": guidelines["fileUrl"],
+            "stages": guidelines["stages"],
+            "regeneratedSections": guidelines["regeneratedSections"],
         }), 201
 
     except Exception as e:
         if conn:
             conn.rollback()
-        print(f"Failed to generate guidelines: {str(e)}")
+        print(f"Failed to run guidelines pipeline: {str(e)}")
         return jsonify({
             "success": False,
             "message": "Failed to generate guidelines",
@@ -459,19 +775,25 @@ def save_brand_guidelines() -> tuple[Response, int]:
                 "message": "Missing content"
             }), 400
 
+        # Re-read the profile from the edited text (NULL if it no longer follows the layout)
+        profile, prompt_context = brand_profile_columns(content)
+
         # Insert company guidelines into database
         cursor.execute(
             """
-            INSERT INTO brand_guidelines (company_id, content, saved_at)
-            VALUES (%s, %s, NOW())
+            INSERT INTO brand_guidelines (company_id, content, profile, prompt_context, saved_at)
+            VALUES (%s, %s, %s, %s, NOW())
             ON CONFLICT (company_id)
             DO UPDATE SET
                 content = EXCLUDED.content,
+                profile = EXCLUDED.profile,
+                prompt_context = EXCLUDED.prompt_context,
                 saved_at = EXCLUDED.saved_at;
             """,
-            (company_id, content),
+            (company_id, content, jsonb(profile) if profile else None, prompt_context),
         )
         conn.commit()
+        invalidate_brand_context(company_id)
 
         return jsonify({
             "success": True,
@@ -502,29 +824,46 @@ def get_brand_guidelines(company_id: int) -> tuple[Response, int]:
         conn = db_connection()
         cursor = conn.cursor()
 
+        # Answer conditional requests from the guidelines' write timestamps alone
+        if is_conditional():
+            cursor.execute(
+                "SELECT uploaded_at, generated_at, saved_at FROM brand_guidelines WHERE company_id = %s;",
+                (company_id,),
+            )
+            version = cursor.fetchone() or (None, None, None)
+            etag, modified = resource_etag(*version), last_modified(*version)
+            if is_not_modified(etag, modified):
+                return not_modified(etag, modified, CACHE_CONTROL["brandGuidelines"]), 304
+
         # Get brand guidelines and any stored analysis/profile for selected company
         cursor.execute(
-            "SELECT content, file_analysis FROM brand_guidelines WHERE company_id = %s;",
+            """
+            SELECT content, file_analysis, profile, uploaded_at, generated_at, saved_at
+            FROM brand_guidelines
+            WHERE company_id = %s;
+            """,
             (company_id,),
         )
         row = cursor.fetchone()
+        version = row[3:6] if row else (None, None, None)
+        etag, modified = resource_etag(*version), last_modified(*version)
 
         # Check if guidelines exist
         if not row or not row[0]:
-            return jsonify({
+            return cacheable(jsonify({
                 "success": False,
                 "message": "Company guidelines/content not found",
                 "content": None,
                 "profile": None
-            }), 200
+            }), etag, modified, CACHE_CONTROL["brandGuidelines"]), 200
 
         content = row[0]
         file_analysis_raw = row[1]
-        profile = None
+        profile = row[2]
 
         # Try to extract a structured profile from file_analysis if present
         try:
-            if file_analysis_raw:
+            if not profile and file_analysis_raw:
                 if isinstance(file_analysis_raw, str):
                     fa = json.loads(file_analysis_raw)
                 else:
@@ -539,12 +878,12 @@ def get_brand_guidelines(company_id: int) -> tuple[Response, int]:
         except Exception:
             profile = None
 
-        return jsonify({
+        return cacheable(jsonify({
             "success": True,
             "message": "Company guidelines fetched successfully",
             "content": content,
             "profile": profile,
-        }), 200
+        }), etag, modified, CACHE_CONTROL["brandGuidelines"]), 200
 
     except Exception as e:
         return jsonify({
@@ -563,7 +902,7 @@ def get_brand_guidelines(company_id: int) -> tuple[Response, int]:
 # =====================================================
 # CONTENT
 # =====================================================
-# Save uploaded images to cloudinary
+# Save uploaded images to storage (cloudinary)
 @app.route("/api/content/upload_images", methods=["POST"])
 def upload_images() -> tuple[Response, int]:
     company_id = int((request.form.get("companyId") or "").strip())
@@ -574,21 +913,26 @@ def upload_images() -> tuple[Response, int]:
     if not ref_imgs or all(not f.filename for f in ref_imgs):
         return jsonify({"success": False, "message": "No images provided"}), 400
 
-    # Iterate over each image uploading each
-    uploaded_urls = []
-    for f in ref_imgs:
-        if not f or not f.filename:
-            continue
-        result = cloudinary.uploader.upload(
-            f,
-            folder=f"reference-images/{company_id}"
-        )
-        uploaded_urls.append(result["secure_url"])
+    # Upload images concurrently; each file reports its own result
+    files = [f for f in ref_imgs if f and f.filename]
+    results = upload_files(files, folder=f"reference-images/{company_id}")
+    uploaded = [r for r in results if r["success"]]
+
+    record_uploads(company_id, [(r["url"], r["hash"]) for r in uploaded])
+
+    if not uploaded:
+        return jsonify({
+            "success": False,
+            "message": "Failed to upload images",
+            "results": results
+        }), 500
 
     return jsonify({
         "success": True,
-        "message": "Images uploaded successfully",
-        "urls": uploaded_urls
+        "message": "Images uploaded successfully" if len(uploaded) == len(results) else f"{len(results) - len(uploaded)} of {len(results)} images failed to upload",
+        "urls": [r["url"] for r in uploaded],
+        "hashes": [r["hash"] for r in uploaded],
+        "results": results
     }), 200
 
 
@@ -602,89 +946,145 @@ def analyze_images_route() -> tuple[Response, int]:
     if not img_urls:
         return jsonify({"success": False, "message": "No image URLs provided"}), 400
 
-    # Analyze each image individually so we return one analysis per URL
-    analyses: list[dict] = []
-    for url in img_urls:
-        single_analysis: dict = analyze_images([url])
-        analyses.append(single_analysis)
+    # Content hashes only come from the upload record (never the client), since they key the shared cache
+    url_hashes: dict[str, str] = lookup_upload_hashes(img_urls)
 
-    return jsonify({
+    # Serve repeat images from the cache; analyze each remaining distinct image once
+    cached = get_cached_analyses(list(url_hashes.values()), IMAGE_ANALYSIS_VERSION)
+    pending = pending_analyses(img_urls, url_hashes, cached)
+
+    # Analyze each image individually (concurrently) so we return one analysis per URL
+    analyzed: dict[str, dict] = {}
+    if pending:
+        analyzed = dict(zip(pending, analyze_images_batch(list(pending.values()))))
+    store_analyses(storable_analyses(url_hashes, pending, analyzed), IMAGE_ANALYSIS_VERSION)
+
+    body, status = analyze_images_response(img_urls, url_hashes, cached, analyzed)
+    return jsonify(body), status
+
+
+# Response body and status of an analyze_images request (shared with asgiApp.py)
+def analyze_images_response(
+    img_urls: list[str],
+    url_hashes: dict[str, str],
+    cached: dict[str, dict],
+    analyzed: dict[str, dict],
+) -> tuple[dict[str, Any], int]:
+    analyses = merge_analyses(img_urls, url_hashes, cached, analyzed)
+    failed = sum(1 for a in analyses if a.get("success") is False)
+
+    if failed == len(analyses):
+        return {
+            "success": False,
+            "message": "Failed to analyze images",
+            "analyses": analyses
+        }, 500
+
+    return {
         "success": True,
-        "message": "Images analyzed successfully",
-        "analyses": analyses
-    }), 200
+        "message": "Images analyzed successfully" if not failed else f"{failed} of {len(analyses)} images failed to analyze",
+        "analyses": analyses,
+        "cached": sum(1 for url in img_urls if url_hashes.get(url) in cached)
+    }, 200
+
+
+# Validate a content creation payload; returns (params, error message).
+# `query_args` defaults to the current Flask request's query string.
+def parse_content_request(content_data: dict, query_args: Any = None) -> tuple[dict[str, Any], str | None]:
+    company_id = content_data.get("companyId")
+    topic = (content_data.get("topic") or "").strip()
+    # Accept a list of platforms; fall back to the legacy single-platform field
+    platforms: list[str] = content_data.get("platforms") or []
+    if not platforms:
+        single = (content_data.get("platform") or "").strip()
+        if single:
+            platforms = [single]
+    platforms = [p.strip() for p in platforms if p.strip()]
+    analyses = content_data.get("analyses") or []
+
+    params = {
+        "company_id": company_id,
+        "topic": topic,
+        "platforms": platforms,
+        "analyses": analyses,
+        "fresh": wants_fresh(content_data, query_args),
+    }
+
+    if not isinstance(company_id, int) or company_id <= 0:
+        return params, "Invalid companyId"
+    if not topic:
+        return params, "Missing topic"
+    if not platforms:
+        return params, "Missing platform(s)"
+    return params, None
+
+
+# Append hashtags to the generated caption
+def format_caption(caption_data: dict) -> str:
+    hashtags = caption_data.get("hashtags") or []
+    caption = caption_data["caption"]
+    if hashtags:
+        caption = f"{caption}\n\n{' '.join(['#' + tag for tag in hashtags])}"
+    return caption
+
+
+# Check a caption result; returns an error message if it can't be used
+def caption_error(platform: str, caption_data: dict) -> str | None:
+    if caption_data.get("success") is False:
+        return f"Failed to generate caption for {platform}: {caption_data.get('error', 'Unknown error')}"
+    if not caption_data.get("caption"):
+        return f"Caption generation returned empty result for {platform}"
+    return None
 
 
 # Create new content
 @app.route("/api/content/create", methods=["POST"])
+@coalesce_requests
 def create_content() -> tuple[Response, int]:
     try:
         # Get content data
-        content_data = request.get_json(silent=True) or {}
-        company_id = content_data.get("companyId")
-        topic = (content_data.get("topic") or "").strip()
-        # Accept a list of platforms; fall back to the legacy single-platform field
-        platforms: list[str] = content_data.get("platforms") or []
-        if not platforms:
-            single = (content_data.get("platform") or "").strip()
-            if single:
-                platforms = [single]
-        platforms = [p.strip() for p in platforms if p.strip()]
-        analyses = content_data.get("analyses") or []
+        params, error = parse_content_request(request.get_json(silent=True) or {})
+        if error:
+            return jsonify({"success": False, "message": error}), 400
 
-        if not isinstance(company_id, int) or company_id <= 0:
-            return jsonify({"success": False, "message": "Invalid companyId"}), 400
-        if not topic:
-            return jsonify({"success": False, "message": "Missing topic"}), 400
-        if not platforms:
-            return jsonify({"success": False, "message": "Missing platform(s)"}), 400
-
-        # Fetch brand guidelines
-        brand_guidelines = "Modern, professional brand with clean aesthetics"
-        conn = cursor = None
-        try:
-            conn = db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT content FROM brand_guidelines WHERE company_id = %s;", (company_id,))
-            row = cursor.fetchone()
-            if row and row[0]:
-                brand_guidelines = row[0].strip()
-        finally:
-            if cursor: cursor.close()
-            if conn: conn.close()
-            conn = cursor = None
+        topic: str = params["topic"]
+        analyses: list = params["analyses"]
+        fresh: bool = params["fresh"]
 
-        # Generate a caption + prompt for every selected platform
-        results: list[dict] = []
-        for platform in platforms:
+        # Fetch the prepared brand context (prompt text + industry)
+        brand = fetch_brand_context(params["company_id"])
+
+        # Generate a caption + prompt for every selected platform concurrently
+        def generate_for_platform(platform: str, token: CancelToken) -> dict:
             caption_data = generate_caption(
-                brand_guidelines=brand_guidelines,
+                brand_guidelines=brand["guidelines"],
                 post_topic=topic,
                 platform=platform,
                 image_analysis=analyses,
+                fresh=fresh,
             )
 
-            if caption_data.get("success") is False:
-                return jsonify({
-                    "success": False,
-                    "message": f"Failed to generate caption for {platform}: {caption_data.get('error', 'Unknown error')}"
-                }), 500
+            error = caption_error(platform, caption_data)
+            if error:
+                raise FanOutError(platform, error)
 
-            if not caption_data.get("caption"):
-                return jsonify({"success": False, "message": f"Caption generation returned empty result for {platform}"}), 500
+            # A sibling platform failed, skip the prompt call
+            token.check()
 
             prompt = generate_image_prompt(
-                brand_guidelines=brand_guidelines,
+                brand_guidelines=brand["guidelines"],
                 caption_data=caption_data,
                 image_analysis=analyses,
+                fresh=fresh,
+                industry=brand["industry"],
             )
 
-            hashtags = caption_data.get("hashtags") or []
-            caption = caption_data["caption"]
-            if hashtags:
-                caption = f"{caption}\n\n{' '.join(['#' + tag for tag in hashtags])}"
+            return {"platform": platform, "caption": format_caption(caption_data), "prompt": prompt}
 
-            results.append({"platform": platform, "caption": caption, "prompt": prompt})
+        try:
+            results: list[dict] = fan_out(generate_for_platform, params["platforms"])
+        except FanOutError as e:
+            return jsonify({"success": False, "message": e.message}), 500
 
         # Return to frontend for user review — not saved yet
         return jsonify({
@@ -697,6 +1097,363 @@ def create_content() -> tuple[Response, int]:
         return jsonify({"success": False, "message": "Failed to create content", "error": str(e)}), 500
 
 
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
+
+
+# Create new content, streaming Server-Sent Events as each platform progresses:
+#   token   {platform, stage, delta}     raw model output as it is generated
+#   caption {platform, caption}          caption finished
+#   prompt  {platform, prompt}           image prompt finished
+#   error   {platform, message}          this platform failed (others continue)
+#   done    {success, results}           all platforms finished
+@app.route("/api/content/create/stream", methods=["POST"])
+def create_content_stream() -> Response | tuple[Response, int]:
+    params, error = parse_content_request(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+
+    topic: str = params["topic"]
+    platforms: list[str] = params["platforms"]
+    analyses: list = params["analyses"]
+    fresh: bool = params["fresh"]
+
+    try:
+        brand = fetch_brand_context(params["company_id"])
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({"success": False, "message": "Failed to create content", "error": str(e)}), 500
+
+    events: queue.Queue = queue.Queue()
+
+    def generate_for_platform(platform: str) -> dict | None:
+        def on_token(stage: str) -> Callable[[str], None]:
+            return lambda delta: events.put(("token", {"platform": platform, "stage": stage, "delta": delta}))
+
+        try:
+            caption_data = generate_caption(
+                brand_guidelines=brand["guidelines"],
+                post_topic=topic,
+                platform=platform,
+                image_analysis=analyses,
+                on_token=on_token("caption"),
+                fresh=fresh,
+            )
+
+            error = caption_error(platform, caption_data)
+            if error:
+                events.put(("error", {"platform": platform, "message": error}))
+                return None
+
+            caption = format_caption(caption_data)
+            events.put(("caption", {"platform": platform, "caption": caption}))
+
+            prompt = generate_image_prompt(
+                brand_guidelines=brand["guidelines"],
+                caption_data=caption_data,
+                image_analysis=analyses,
+                on_token=on_token("prompt"),
+                fresh=fresh,
+                industry=brand["industry"],
+            )
+            events.put(("prompt", {"platform": platform, "prompt": prompt}))
+
+            return {"platform": platform, "caption": caption, "prompt": prompt}
+        except Exception as e:
+            print(traceback.format_exc())
+            events.put(("error", {"platform": platform, "message": str(e)}))
+            return None
+
+    def stream():
+        executor = ThreadPoolExecutor(max_workers=max(1, min(FAN_OUT_MAX_WORKERS, len(platforms))))
+        try:
+            futures = [executor.submit(generate_for_platform, p) for p in platforms]
+            for future in futures:
+                future.add_done_callback(lambda _: events.put(None))
+
+            remaining = len(futures)
+            while remaining:
+                item = events.get()
+                if item is None:
+                    remaining -= 1
+                    continue
+                yield sse_event(*item)
+
+            results = [f.result() for f in futures if f.result() is not None]
+            yield sse_event("done", {"success": len(results) == len(platforms), "results": results})
+        finally:
+            # Client disconnected: drop queued platforms, let running calls finish
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+# =====================================================
+# CONTENT CALENDAR
+# =====================================================
+# Upper bounds on topics x platforms per request and on concurrent generations
+CALENDAR_MAX_ITEMS = int(os.getenv("CALENDAR_MAX_ITEMS", "200"))
+CALENDAR_MAX_WORKERS = int(os.getenv("CALENDAR_MAX_WORKERS", "8"))
+# Providers only cache prompt prefixes of at least this many tokens
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+
+CONTENT_POST_RETURNING = "id, company_id, topic, platform, reference_image_urls, prompt, caption, created_at, updated_at"
+
+
+def content_post_from_row(row: tuple) -> dict[str, Any]:
+    return {
+        "id": row[0],
+        "companyId": row[1],
+        "topic": row[2],
+        "platform": row[3],
+        "referenceImageUrls": row[4] or [],
+        "prompt": row[5] or "",
+        "caption": row[6] or "",
+        "createdAt": row[7].isoformat() if row[7] else None,
+        "updatedAt": row[8].isoformat() if row[8] else None,
+    }
+
+
+# Write posts with a single multi-row INSERT and return the saved rows in input order.
+# Posts with a `clientKey` the company already used update that post instead.
+def upsert_content_posts(cursor: Any, company_id: int, posts: list[dict]) -> list[dict]:
+    # One row per client key (the last one wins), or ON CONFLICT would hit a row twice
+    slots: dict[Any, int] = {}
+    unique_posts: list[dict] = []
+    positions: list[int] = []
+    for i, post in enumerate(posts):
+        slot_key = post.get("clientKey") or ("position", i)
+        if slot_key in slots:
+            unique_posts[slots[slot_key]] = post
+        else:
+            slots[slot_key] = len(unique_posts)
+            unique_posts.append(post)
+        positions.append(slots[slot_key])
+
+    # RETURNING order isn't guaranteed, so each row is matched back to its ordinal:
+    # by client key, or by the id drawn up front for it (an update keeps the post's id)
+    rows = execute_values(
+        cursor,
+        f"""
+        WITH input AS (
+            SELECT v.*, nextval(pg_get_serial_sequence('content_posts', 'id')) AS new_id
+            FROM (VALUES %s) AS v (ordinal, company_id, client_key, topic, platform, reference_image_urls, prompt, caption)
+        ),
+        saved AS (
+            INSERT INTO content_posts (id, company_id, client_key, topic, platform, reference_image_urls, prompt, caption)
+            SELECT new_id, company_id, client_key, topic, platform, reference_image_urls, prompt, caption
+            FROM input
+            ON CONFLICT (company_id, client_key) DO UPDATE SET
+                topic = EXCLUDED.topic,
+                platform = EXCLUDED.platform,
+                reference_image_urls = EXCLUDED.reference_image_urls,
+                prompt = EXCLUDED.prompt,
+                caption = EXCLUDED.caption,
+                updated_at = NOW()
+            RETURNING client_key, {CONTENT_POST_RETURNING}
+        )
+        SELECT saved.*
+        FROM saved
+        JOIN input ON saved.client_key = input.client_key OR saved.id = input.new_id
+        ORDER BY input.ordinal;
+        """,
+        [
+            (
+                ordinal,
+                company_id,
+                p.get("clientKey"),
+                p["topic"],
+                p["platform"],
+                jsonb(p.get("referenceImageUrls") or []),
+                p["prompt"],
+                p.get("caption") or "",
+            )
+            for ordinal, p in enumerate(unique_posts)
+        ],
+        template="(%s::integer, %s::integer, %s::text, %s::text, %s::text, %s::jsonb, %s::text, %s::text)",
+        page_size=max(1, len(unique_posts)),
+        fetch=True,
+    )
+    saved = [content_post_from_row(r[1:]) for r in rows]
+    return [saved[slot] for slot in positions]
+
+
+# Validate a calendar payload; returns (params, error message)
+def parse_calendar_request(calendar_data: dict) -> tuple[dict[str, Any], str | None]:
+    company_id = calendar_data.get("companyId")
+    topics = list(dict.fromkeys(t.strip() for t in calendar_data.get("topics") or [] if isinstance(t, str) and t.strip()))
+    platforms = list(dict.fromkeys(p.strip() for p in calendar_data.get("platforms") or [] if isinstance(p, str) and p.strip()))
+
+    params = {
+        "company_id": company_id,
+        "items": [(topic, platform) for topic in topics for platform in platforms],
+        "analyses": calendar_data.get("analyses") or [],
+        "reference_image_urls": calendar_data.get("referenceImageUrls") or [],
+        "save": calendar_data.get("save") is True,
+        "fresh": wants_fresh(calendar_data),
+    }
+
+    if not isinstance(company_id, int) or company_id <= 0:
+        return params, "Invalid companyId"
+    if not topics:
+        return params, "Missing topics"
+    if not platforms:
+        return params, "Missing platform(s)"
+    if len(params["items"]) > CALENDAR_MAX_ITEMS:
+        return params, f"Too many posts requested (max {CALENDAR_MAX_ITEMS} topics x platforms)"
+    return params, None
+
+
+def save_calendar_posts(company_id: int, posts: list[dict]) -> list[dict]:
+    conn = cursor = None
+    try:
+        conn = db_connection()
+        cursor = conn.cursor()
+        saved = upsert_content_posts(cursor, company_id, posts)
+        conn.commit()
+        add_posts(company_id, saved)
+        return saved
+    except Exception:
+        if conn: conn.rollback()
+        raise
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+
+# Generate a batch of posts (every topic x platform), streaming Server-Sent Events:
+#   start    {total}
+#   item     {index, topic, platform, caption, prompt}    one post finished
+#   error    {index, topic, platform, message}            one post failed (others continue)
+#   progress {completed, total}
+#   saved    {posts}                                      rows written (when `save` is true)
+#   done     {success, results, failed, saved}
+@app.route("/api/content/calendar/stream", methods=["POST"])
+def create_content_calendar() -> Response | tuple[Response, int]:
+    params, error = parse_calendar_request(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({"success": False, "message": error}), 400
+
+    company_id: int = params["company_id"]
+    items: list[tuple[str, str]] = params["items"]
+    analyses: list = params["analyses"]
+    fresh: bool = params["fresh"]
+
+    # Brand context is loaded once for the whole batch
+    try:
+        brand = fetch_brand_context(company_id)
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({"success": False, "message": "Failed to create content calendar", "error": str(e)}), 500
+
+    events: queue.Queue = queue.Queue()
+    token = CancelToken()
+
+    def generate_item(index: int) -> dict | None:
+        topic, platform = items[index]
+        try:
+            token.check()
+
+            # Bulk work: leave rate limit headroom for interactive requests
+            with llm_priority(BATCH):
+                caption_data = generate_caption(
+                    brand_guidelines=brand["guidelines"],
+                    post_topic=topic,
+                    platform=platform,
+                    image_analysis=analyses,
+                    fresh=fresh,
+                )
+
+                error = caption_error(platform, caption_data)
+                if error:
+                    events.put(("error", {"index": index, "topic": topic, "platform": platform, "message": error}))
+                    return None
+
+                token.check()
+
+                prompt = generate_image_prompt(
+                    brand_guidelines=brand["guidelines"],
+                    caption_data=caption_data,
+                    image_analysis=analyses,
+                    fresh=fresh,
+                    industry=brand["industry"],
+                )
+
+            if prompt.startswith("Error generating image prompt"):
+                events.put(("error", {"index": index, "topic": topic, "platform": platform, "message": prompt}))
+                return None
+
+            result = {"index": index, "topic": topic, "platform": platform, "caption": format_caption(caption_data), "prompt": prompt}
+            events.put(("item", result))
+            return result
+        except FanOutCancelled:
+            return None
+        except Exception as e:
+            print(traceback.format_exc())
+            events.put(("error", {"index": index, "topic": topic, "platform": platform, "message": str(e)}))
+            return None
+
+    def stream():
+        executor = ThreadPoolExecutor(max_workers=max(1, min(CALENDAR_MAX_WORKERS, len(items))))
+        futures: list = []
+
+        def submit(indexes: Iterable[int]) -> None:
+            for index in indexes:
+                future = executor.submit(generate_item, index)
+                future.add_done_callback(lambda _: events.put(None))
+                futures.append(future)
+
+        try:
+            yield sse_event("start", {"total": len(items)})
+
+            # Concurrent first requests would all miss the provider's prompt cache:
+            # when the shared prefix is long enough to be cached, run one post first
+            prime = len(items) > 1 and shared_caption_prefix_tokens(brand["guidelines"], analyses) >= PROMPT_CACHE_MIN_TOKENS
+            submit([0] if prime else range(len(items)))
+
+            completed = 0
+            while completed < len(items):
+                item = events.get()
+                if item is None:
+                    completed += 1
+                    if prime and completed == 1:
+                        submit(range(1, len(items)))
+                    yield sse_event("progress", {"completed": completed, "total": len(items)})
+                    continue
+                yield sse_event(*item)
+
+            results = [f.result() for f in futures if f.result() is not None]
+
+            saved: list[dict] = []
+            if params["save"] and results:
+                try:
+                    saved = save_calendar_posts(company_id, [
+                        {**r, "referenceImageUrls": params["reference_image_urls"]} for r in results
+                    ])
+                    yield sse_event("saved", {"posts": saved})
+                except Exception as e:
+                    print(traceback.format_exc())
+                    yield sse_event("error", {"message": "Failed to save content calendar", "error": str(e)})
+
+            yield sse_event("done", {
+                "success": len(results) == len(items),
+                "results": results,
+                "failed": len(items) - len(results),
+                "saved": len(saved),
+            })
+        finally:
+            # Client disconnected: skip queued posts and stop running ones between steps
+            token.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(stream(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
 # GET latest content
 @app.route("/api/content/latest", methods=["GET"])
 def latest_content() -> Response:
@@ -714,22 +1471,41 @@ def latest_content() -> Response:
         conn = db_connection()
         cursor = conn.cursor()
 
+        # Answer conditional requests from the latest post's id and timestamps alone
+        if is_conditional():
+            cursor.execute(
+                """
+                SELECT id, created_at, updated_at
+                FROM content_posts
+                WHERE company_id = %s
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1;
+                """,
+                (company_id,),
+            )
+            version = cursor.fetchone() or (None, None, None)
+            etag, modified = resource_etag(*version), last_modified(*version[1:])
+            if is_not_modified(etag, modified):
+                return not_modified(etag, modified, CACHE_CONTROL["latestContent"])
+
         # Get all content from selected company (Descending order)
         cursor.execute(
-            """
-            SELECT id, company_id, topic, platform, reference_image_urls::text, prompt, caption, created_at, updated_at
+            f"""
+            SELECT {CONTENT_POST_RETURNING}
             FROM content_posts
             WHERE company_id = %s
-            ORDER BY created_at DESC
+            ORDER BY created_at DESC, id DESC
             LIMIT 1;
             """,
             (company_id,),
         )
         row = cursor.fetchone()
+        version = (row[0], row[7], row[8]) if row else (None, None, None)
+        etag, modified = resource_etag(*version), last_modified(*version[1:])
 
         # Check if row was returned
         if not row:
-            return jsonify(
+            return cacheable(jsonify(
                 {
                     "companyId": company_id,
                     "topic": "",
@@ -738,21 +1514,9 @@ def latest_content() -> Response:
                     "caption": "",
                     "referenceImageUrls": [],
                 }
-            )
+            ), etag, modified, CACHE_CONTROL["latestContent"])
 
-        return jsonify(
-            {
-                "id": row[0],
-                "companyId": row[1],
-                "topic": row[2],
-                "platform": row[3],
-                "referenceImageUrls": json.loads(row[4] or "[]"),
-                "prompt": row[5] or "",
-                "caption": row[6] or "",
-                "createdAt": row[7].isoformat() if row[7] else None,
-                "updatedAt": row[8].isoformat() if row[8] else None,
-            }
-        )
+        return cacheable(jsonify(content_post_from_row(row)), etag, modified, CACHE_CONTROL["latestContent"])
 
     except Exception as e:
         return jsonify({
@@ -771,6 +1535,9 @@ def latest_content() -> Response:
 # =====================================================
 # CONTENT LIST
 # =====================================================
+CONTENT_LIST_MAX_LIMIT = 100
+
+
 @app.route("/api/content/list", methods=["GET"])
 def list_content() -> tuple[Response, int]:
     conn = cursor = None
@@ -786,44 +1553,237 @@ def list_content() -> tuple[Response, int]:
         # Get limit
         limit_raw = (request.args.get("limit") or "20").strip()
         limit = int(limit_raw) if limit_raw.isdigit() else 20
+        limit = max(1, min(limit, CONTENT_LIST_MAX_LIMIT))
+
+        # Optional filters; all of them keep the query on the (company_id, ...) indexes
+        conditions = ["company_id = %s"]
+        params: list[Any] = [company_id]
+
+        platform = (request.args.get("platform") or "").strip()
+        if platform:
+            conditions.append("platform = %s")
+            params.append(platform)
+
+        for arg, op in (("from", ">="), ("to", "<")):
+            raw = (request.args.get(arg) or "").strip()
+            if raw:
+                try:
+                    params.append(datetime.fromisoformat(raw))
+                except ValueError:
+                    return jsonify({"success": False, "message": f"Invalid '{arg}' date"}), 400
+                conditions.append(f"created_at {op} %s")
+
+        # Resume after the last row of the previous page
+        cursor_raw = (request.args.get("cursor") or "").strip()
+        if cursor_raw:
+            try:
+                after_created_at, after_id = decode_cursor(cursor_raw)
+                params.extend([datetime.fromisoformat(after_created_at), int(after_id)])
+            except (ValueError, TypeError):
+                return jsonify({"success": False, "message": "Invalid cursor"}), 400
+            conditions.append("(created_at, id) < (%s, %s)")
 
         conn = db_connection()
         cursor = conn.cursor()
 
-        # Fetch content from DB
+        # Answer conditional requests from the page's ids and timestamps alone
+        if is_conditional():
+            cursor.execute(
+                f"""
+                SELECT id, created_at, updated_at
+                FROM content_posts
+                WHERE {" AND ".join(conditions)}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s;
+                """,
+                (*params, limit + 1),
+            )
+            version = cursor.fetchall() or []
+            etag = resource_etag(*version)
+            modified = last_modified(*(t for row_version in version for t in row_version[1:]))
+            if is_not_modified(etag, modified):
+                return not_modified(etag, modified, CACHE_CONTROL["contentList"]), 304
+
+        # Fetch one extra row to know whether another page exists
         cursor.execute(
-            """
-            SELECT id, company_id, topic, platform, reference_image_urls::text,
-                   prompt, caption, created_at, updated_at
+            f"""
+            SELECT {CONTENT_POST_RETURNING}
             FROM content_posts
-            WHERE company_id = %s
-            ORDER BY created_at DESC
+            WHERE {" AND ".join(conditions)}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s;
+            """,
+            (*params, limit + 1),
+        )
+        rows = cursor.fetchall() or []
+
+        # The extra row is part of the page's version: it decides nextCursor
+        version = [(r[0], r[7], r[8]) for r in rows]
+        etag = resource_etag(*version)
+        modified = last_modified(*(t for row_version in version for t in row_version[1:]))
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][7].isoformat(), rows[-1][0]])
+
+        posts = [content_post_from_row(r) for r in rows]
+
+        response = jsonify({"success": True, "posts": posts, "nextCursor": next_cursor})
+        return cacheable(response, etag, modified, CACHE_CONTROL["contentList"]), 200
+
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({"success": False, "message": "Failed to fetch content list", "error": str(e)}), 500
+
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+
+# =====================================================
+# CONTENT SEARCH
+# =====================================================
+# Full-text search over topic, caption and prompt (content_posts.search_vector), best match first:
+#   ?companyId=1&q=summer sale      websearch syntax: "quoted phrase", -excluded, or
+#   &platform=Instagram             optional platform filter
+#   &limit=20&cursor=...            page size and the nextCursor value from the previous page
+@app.route("/api/content/search", methods=["GET"])
+def search_content() -> tuple[Response, int]:
+    conn = cursor = None
+
+    try:
+        company_id_raw = (request.args.get("companyId") or "").strip()
+        if not company_id_raw.isdigit():
+            return jsonify({"success": False, "message": "Invalid companyId"}), 400
+        company_id = int(company_id_raw)
+
+        query = (request.args.get("q") or "").strip()
+        if not query:
+            return jsonify({"success": False, "message": "Missing search query"}), 400
+
+        limit_raw = (request.args.get("limit") or "20").strip()
+        limit = int(limit_raw) if limit_raw.isdigit() else 20
+        limit = max(1, min(limit, CONTENT_LIST_MAX_LIMIT))
+
+        conditions = ["company_id = %s", "search_vector @@ query"]
+        params: list[Any] = [query, company_id]
+
+        platform = (request.args.get("platform") or "").strip()
+        if platform:
+            conditions.append("platform = %s")
+            params.append(platform)
+
+        # Resume after the last match of the previous page (rank, then newest first)
+        after = "TRUE"
+        cursor_raw = (request.args.get("cursor") or "").strip()
+        if cursor_raw:
+            try:
+                after_rank, after_created_at, after_id = decode_cursor(cursor_raw)
+                params.extend([float(after_rank), datetime.fromisoformat(after_created_at), int(after_id)])
+            except (ValueError, TypeError):
+                return jsonify({"success": False, "message": "Invalid cursor"}), 400
+            after = "(rank, created_at, id) < (%s::real, %s, %s)"
+
+        conn = db_connection()
+        cursor = conn.cursor()
+
+        # Rank normalization 1 divides by the document length (log), so long prompts don't dominate
+        cursor.execute(
+            f"""
+            SELECT *
+            FROM (
+                SELECT {CONTENT_POST_RETURNING}, ts_rank_cd(search_vector, query, 1) AS rank
+                FROM content_posts, websearch_to_tsquery('english', %s) AS query
+                WHERE {" AND ".join(conditions)}
+            ) AS matches
+            WHERE {after}
+            ORDER BY rank DESC, created_at DESC, id DESC
             LIMIT %s;
             """,
-            (company_id, limit),
+            (*params, limit + 1),
         )
         rows = cursor.fetchall() or []
 
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor([rows[-1][9], rows[-1][7].isoformat(), rows[-1][0]])
+
+        posts = [{**content_post_from_row(r), "rank": r[9]} for r in rows]
+
+        return jsonify({"success": True, "posts": posts, "nextCursor": next_cursor}), 200
+
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({"success": False, "message": "Failed to search content", "error": str(e)}), 500
+
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+
+# Posts similar to one post (?postId=) or to some text (?text=), most similar first (see contentIndex.py)
+@app.route("/api/content/similar", methods=["GET"])
+def similar_content() -> tuple[Response, int]:
+    conn = cursor = None
+
+    try:
+        company_id_raw = (request.args.get("companyId") or "").strip()
+        if not company_id_raw.isdigit():
+            return jsonify({"success": False, "message": "Invalid companyId"}), 400
+        company_id = int(company_id_raw)
+
+        post_id_raw = (request.args.get("postId") or "").strip()
+        text = (request.args.get("text") or "").strip()
+        if post_id_raw and not post_id_raw.isdigit():
+            return jsonify({"success": False, "message": "Invalid postId"}), 400
+        if not post_id_raw and not text:
+            return jsonify({"success": False, "message": "Missing postId or text"}), 400
+        post_id = int(post_id_raw) if post_id_raw else None
+
+        limit_raw = (request.args.get("limit") or "10").strip()
+        limit = int(limit_raw) if limit_raw.isdigit() else 10
+        limit = max(1, min(limit, CONTENT_LIST_MAX_LIMIT))
+
+        matches = similar_posts(company_id, limit, post_id=post_id, text=text)
+        if post_id is not None and not matches:
+            # Either the post has no similar posts, or it isn't one of this company's
+            conn = db_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT 1 FROM content_posts WHERE id = %s AND company_id = %s;",
+                (post_id, company_id),
+            )
+            if not cursor.fetchone():
+                return jsonify({"success": False, "message": "Post not found"}), 404
+            return jsonify({"success": True, "posts": []}), 200
+        if not matches:
+            return jsonify({"success": True, "posts": []}), 200
+
+        conn = db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            f"""
+            SELECT {CONTENT_POST_RETURNING}
+            FROM content_posts
+            WHERE company_id = %s AND id = ANY(%s);
+            """,
+            (company_id, [match_id for match_id, _ in matches]),
+        )
+        rows_by_id = {r[0]: r for r in cursor.fetchall()}
+
         posts = [
-            {
-                "id": r[0],
-                "companyId": r[1],
-                "topic": r[2],
-                "platform": r[3],
-                "referenceImageUrls": json.loads(r[4] or "[]"),
-                "prompt": r[5] or "",
-                "caption": r[6] or "",
-                "createdAt": r[7].isoformat() if r[7] else None,
-                "updatedAt": r[8].isoformat() if r[8] else None,
-            }
-            for r in rows
+            {**content_post_from_row(rows_by_id[match_id]), "similarity": round(score, 4)}
+            for match_id, score in matches
+            if match_id in rows_by_id
         ]
 
         return jsonify({"success": True, "posts": posts}), 200
 
     except Exception as e:
         print(traceback.format_exc())
-        return jsonify({"success": False, "message": "Failed to fetch content list", "error": str(e)}), 500
+        return jsonify({"success": False, "message": "Failed to find similar content", "error": str(e)}), 500
 
     finally:
         if cursor: cursor.close()
@@ -833,6 +1793,29 @@ def list_content() -> tuple[Response, int]:
 # =====================================================
 # CONTENT SAVE
 # =====================================================
+# Upper bound on posts per bulk save
+CONTENT_BULK_SAVE_MAX_POSTS = int(os.getenv("CONTENT_BULK_SAVE_MAX_POSTS", "500"))
+
+
+# Validate one post to save; returns (post, error message)
+def parse_content_post(post_data: dict) -> tuple[dict[str, Any], str | None]:
+    client_key = post_data.get("clientKey")
+    post = {
+        "topic": (post_data.get("topic") or "").strip(),
+        "platform": (post_data.get("platform") or "").strip(),
+        "prompt": (post_data.get("prompt") or "").strip(),
+        "caption": (post_data.get("caption") or "").strip(),
+        "referenceImageUrls": post_data.get("referenceImageUrls") or [],
+        "clientKey": client_key.strip() if isinstance(client_key, str) and client_key.strip() else None,
+    }
+
+    if not post["topic"] or not post["platform"]:
+        return post, "Missing topic or platform"
+    if not post["prompt"]:
+        return post, "Missing prompt"
+    return post, None
+
+
 @app.route("/api/content/save", methods=["POST"])
 def save_content() -> tuple[Response, int]:
     conn = cursor = None
@@ -841,47 +1824,67 @@ def save_content() -> tuple[Response, int]:
         # Get content data to save
         content_saving_data = request.get_json(silent=True) or {}
         company_id = content_saving_data.get("companyId")
-        topic = (content_saving_data.get("topic") or "").strip()
-        platform = (content_saving_data.get("platform") or "").strip()
-        prompt = (content_saving_data.get("prompt") or "").strip()
-        caption = (content_saving_data.get("caption") or "").strip()
-        reference_image_urls = content_saving_data.get("referenceImageUrls") or []
 
         if not isinstance(company_id, int) or company_id <= 0:
             return jsonify({"success": False, "message": "Invalid companyId"}), 400
-        if not topic or not platform:
-            return jsonify({"success": False, "message": "Missing topic or platform"}), 400
-        if not prompt:
-            return jsonify({"success": False, "message": "Missing prompt"}), 400
+
+        post, error = parse_content_post(content_saving_data)
+        if error:
+            return jsonify({"success": False, "message": error}), 400
 
         # Save to content data to database
         conn = db_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO content_posts (company_id, topic, platform, reference_image_urls, prompt, caption)
-            VALUES (%s, %s, %s, %s::jsonb, %s, %s)
-            RETURNING id, company_id, topic, platform, reference_image_urls::text, prompt, caption, created_at, updated_at;
-            """,
-            (company_id, topic, platform, json.dumps(reference_image_urls), prompt, caption),
-        )
-        saved = cursor.fetchone()
+        saved = upsert_content_posts(cursor, company_id, [post])
         conn.commit()
 
         if not saved:
             return jsonify({"success": False, "message": "Failed to save content"}), 500
+        add_posts(company_id, saved)
 
-        return jsonify({
-            "id": saved[0],
-            "companyId": saved[1],
-            "topic": saved[2],
-            "platform": saved[3],
-            "referenceImageUrls": json.loads(saved[4] or "[]"),
-            "prompt": saved[5] or "",
-            "caption": saved[6] or "",
-            "createdAt": saved[7].isoformat() if saved[7] else None,
-            "updatedAt": saved[8].isoformat() if saved[8] else None,
-        }), 201
+        return jsonify(saved[0]), 201
+
+    except Exception as e:
+        if conn: conn.rollback()
+        print(traceback.format_exc())
+        return jsonify({"success": False, "message": "Failed to save content", "error": str(e)}), 500
+
+    finally:
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+
+# Save many posts in one transaction; the saved rows come back in request order
+@app.route("/api/content/save/bulk", methods=["POST"])
+def save_content_bulk() -> tuple[Response, int]:
+    conn = cursor = None
+
+    try:
+        bulk_data = request.get_json(silent=True) or {}
+        company_id = bulk_data.get("companyId")
+        posts_data = bulk_data.get("posts")
+
+        if not isinstance(company_id, int) or company_id <= 0:
+            return jsonify({"success": False, "message": "Invalid companyId"}), 400
+        if not isinstance(posts_data, list) or not posts_data:
+            return jsonify({"success": False, "message": "Missing posts"}), 400
+        if len(posts_data) > CONTENT_BULK_SAVE_MAX_POSTS:
+            return jsonify({"success": False, "message": f"Too many posts (max {CONTENT_BULK_SAVE_MAX_POSTS})"}), 400
+
+        posts: list[dict] = []
+        for index, post_data in enumerate(posts_data):
+            post, error = parse_content_post(post_data if isinstance(post_data, dict) else {})
+            if error:
+                return jsonify({"success": False, "message": f"Post {index}: {error}", "index": index}), 400
+            posts.append(post)
+
+        conn = db_connection()
+        cursor = conn.cursor()
+        saved = upsert_content_posts(cursor, company_id, posts)
+        conn.commit()
+        add_posts(company_id, saved)
+
+        return jsonify({"success": True, "posts": saved}), 201
 
     except Exception as e:
         if conn: conn.rollback()
@@ -897,6 +1900,7 @@ def save_content() -> tuple[Response, int]:
 # GENERATE IMAGE
 # =====================================================
 @app.route("/api/content/generate-image", methods=["POST"])
+@coalesce_requests
 def generate_image_route() -> tuple[Response, int]:
     try:
         data = request.get_json(silent=True) or {}
@@ -918,6 +1922,110 @@ def generate_image_route() -> tuple[Response, int]:
         return jsonify({"success": False, "message": "Failed to generate image", "error": str(e)}), 500
 
 
+# Queue image generation in the background; poll or subscribe for the result
+@app.route("/api/content/generate-image/jobs", methods=["POST"])
+def submit_image_job_route() -> tuple[Response, int]:
+    try:
+        data = request.get_json(silent=True) or {}
+        prompt = (data.get("prompt") or "").strip()
+        size = (data.get("size") or "1024x1024").strip()
+
+        if not prompt:
+            return jsonify({"success": False, "message": "Missing prompt"}), 400
+
+        job = submit_image_job(prompt, size)
+
+        return jsonify({"success": True, **job}), 202
+
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({"success": False, "message": "Failed to queue image generation", "error": str(e)}), 500
+
+
+@app.route("/api/content/generate-image/jobs/<job_id>", methods=["GET"])
+def get_image_job_route(job_id: str) -> tuple[Response, int]:
+    try:
+        job = get_job(job_id)
+
+        if not job:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+
+        return jsonify({"success": True, **job}), 200
+
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({"success": False, "message": "Failed to fetch image job", "error": str(e)}), 500
+
+
+# Server-Sent Events, sync mode: sends the job's current status and closes, asking
+# the client to reconnect after IMAGE_JOB_EVENTS_RECONNECT seconds, so a subscriber
+# never holds a worker thread. Async mode (asgiApp.py) serves this path natively
+# and streams every change as it happens.
+@app.route("/api/content/generate-image/jobs/<job_id>/events", methods=["GET"])
+def image_job_events_route(job_id: str) -> Response | tuple[Response, int]:
+    try:
+        job = get_job(job_id)
+
+        if not job:
+            return jsonify({"success": False, "message": "Job not found"}), 404
+
+        body = f"retry: {int(IMAGE_JOB_EVENTS_RECONNECT * 1000)}\n" + sse_event("status", job)
+        return Response(body, mimetype="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        })
+
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({"success": False, "message": "Failed to fetch image job", "error": str(e)}), 500
+
+
+# =====================================================
+# HEALTH
+# =====================================================
+@app.route("/api/health/db-pool", methods=["GET"])
+def db_pool_stats() -> tuple[Response, int]:
+    return jsonify({"success": True, "pid": os.getpid(), "pool": pool_stats()}), 200
+
+
+@app.route("/api/health/llm-cache", methods=["GET"])
+def llm_cache_stats() -> tuple[Response, int]:
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "cache": response_cache.stats(),
+        "analysisCompaction": compaction_stats()
+    }), 200
+
+
+@app.route("/api/health/llm-rate-limits", methods=["GET"])
+def llm_rate_limit_stats() -> tuple[Response, int]:
+    return jsonify({"success": True, "pid": os.getpid(), "limits": rate_limiter.stats()}), 200
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics() -> Response:
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
+@app.route("/api/health/content-index", methods=["GET"])
+def content_index_health() -> tuple[Response, int]:
+    return jsonify({"success": True, "pid": os.getpid(), "contentIndex": content_index_stats()}), 200
+
+
+@app.route("/api/health/request-coalescing", methods=["GET"])
+def request_coalescing_stats() -> tuple[Response, int]:
+    return jsonify({"success": True, "pid": os.getpid(), "coalescing": coalescing_stats()}), 200
+
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "5000"))
-    app.run(host="0.0.0.0", port=port, debug=False)
+
+    # SERVER_MODE=async serves the same routes from asgiApp.py on uvicorn
+    if os.getenv("SERVER_MODE", "sync") == "async":
+        import uvicorn
+        uvicorn.run("asgiApp:app", host="0.0.0.0", port=port)
+    else:
+        start_image_jobs()
+        app.run(host="0.0.0.0", port=port, debug=False)
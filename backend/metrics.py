@@ -0,0 +1,106 @@
+import os
+import time
+import asyncio
+import functools
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Prometheus metrics served on /metrics. Every observation is a lock plus a
+# few float adds, so they stay on in production. With several gunicorn
+# workers, point PROMETHEUS_MULTIPROC_DIR at an empty directory (cleared on
+# deploy) so /metrics aggregates every worker instead of the one answering.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Time to produce a response (to the first byte for streamed responses)",
+    ["route", "method", "status"],
+    buckets=HTTP_BUCKETS,
+)
+stage_duration = Histogram(
+    "stage_duration_seconds",
+    "Time spent in one stage of a request (DB, PDF extraction, agents, uploads)",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+stage_errors = Counter("stage_errors_total", "Stages that raised", ["stage"])
+llm_requests = Counter("llm_requests_total", "Model calls by outcome (ok, rate_limited, error)", ["model", "outcome"])
+llm_tokens = Counter(
+    "llm_tokens_total",
+    "Tokens used by model calls; `reported` by the provider, `estimated` when it reports none",
+    ["model", "source"],
+)
+cache_events = Counter("cache_events_total", "Cache lookups and writes by cache and event", ["cache", "event"])
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    stage_duration.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.labels(stage).inc()
+        raise
+    finally:
+        stage_duration.labels(stage).observe(time.perf_counter() - started)
+
+
+# Decorator form of stage_timer for sync and async functions
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    def decorator(fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with stage_timer(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage_timer(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def record_request(route: str, method: str, status: int, seconds: float) -> None:
+    http_request_duration.labels(route, method, str(status)).observe(seconds)
+
+
+def count_llm_call(model: str | None, outcome: str, tokens: int | None = None, reported: bool = False) -> None:
+    model = model or "unknown"
+    llm_requests.labels(model, outcome).inc()
+    if tokens:
+        llm_tokens.labels(model, "reported" if reported else "estimated").inc(tokens)
+
+
+def count_cache(cache: str, event: str, amount: int = 1) -> None:
+    if amount:
+        cache_events.labels(cache, event).inc(amount)
+
+
+# Body and content type for the /metrics endpoint
+def render_metrics() -> tuple[bytes, str]:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from functools import wraps
+from typing import Any, Awaitable, Callable
+
+from flask import Response, request, jsonify
+from starlette.responses import JSONResponse, Response as StarletteResponse
+
+from agents.responseCache import ResponseCache, MemoryTier, PostgresTier, LLM_CACHE_TIERS
+
+# Identical requests to the expensive routes (double clicks, client retries)
+# share one execution: callers that arrive while the first is still running
+# wait for its response instead of paying for their own LLM/DALL-E calls.
+# With an Idempotency-Key header the response is also kept for
+# IDEMPOTENCY_TTL_HOURS and replayed to later requests with the same key.
+IDEMPOTENCY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+COALESCED_HEADER = "X-Request-Coalesced"
+
+idempotency_cache = ResponseCache(
+    [MemoryTier(max_entries=1024)]
+    + ([PostgresTier(ttl_hours=IDEMPOTENCY_TTL_HOURS, table="idempotency_results")] if "postgres" in LLM_CACHE_TIERS else []),
+    name="idempotency",
+)
+
+_stats_lock = threading.Lock()
+_stats: dict[str, int] = {"leaders": 0, "coalesced": 0, "replayed": 0, "keyConflicts": 0}
+
+
+def _count(counter: str) -> None:
+    with _stats_lock:
+        _stats[counter] += 1
+
+
+# Canonical hash of (route, company, payload, query string); key order and
+# form/JSON encoding don't matter. The query string counts because routes read
+# flags such as `fresh` from it.
+def request_key(route: str, payload: dict, query: list[tuple[str, str]] | None = None) -> str:
+    canonical = json.dumps(
+        {"route": route, "company": payload.get("companyId"), "payload": payload, "query": sorted(query or [])},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+# Response parts that can be safely handed to every waiting caller
+def _snapshot(body: bytes, status: int, mimetype: str | None) -> dict[str, Any]:
+    return {"body": body.decode(), "status": status, "mimetype": mimetype or "application/json"}
+
+
+def _stored_replay(idempotency_key: str | None, key: str) -> tuple[dict | None, str | None]:
+    if not idempotency_key:
+        return None, None
+
+    stored = idempotency_cache.get(f"idem:{idempotency_key}")
+    if stored is None or time.time() - stored["storedAt"] > IDEMPOTENCY_TTL_HOURS * 3600:
+        return None, None
+    if stored["requestKey"] != key:
+        _count("keyConflicts")
+        return None, f"{IDEMPOTENCY_HEADER} was already used for a different request"
+    _count("replayed")
+    return stored["response"], None
+
+
+# Keep the response for the idempotency window (server errors stay retryable)
+def _store(idempotency_key: str | None, key: str, snapshot: dict) -> None:
+    if idempotency_key and snapshot["status"] < 500:
+        idempotency_cache.set(f"idem:{idempotency_key}", {
+            "requestKey": key,
+            "response": snapshot,
+            "storedAt": time.time(),
+        })
+
+
+# =====================================================
+# SYNC (Flask)
+# =====================================================
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot: dict | None = None
+        self.error: BaseException | None = None
+
+
+_flights: dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def single_flight(key: str, fn: Callable[[], dict]) -> tuple[dict, bool]:
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        _count("coalesced")
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.snapshot, True
+
+    _count("leaders")
+    try:
+        flight.snapshot = fn()
+        return flight.snapshot, False
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+def _flask_response(snapshot: dict, **headers: str) -> Response:
+    response = Response(snapshot["body"], status=snapshot["status"], mimetype=snapshot["mimetype"])
+    response.headers.update(headers)
+    return response
+
+
+# Route decorator: coalesce identical in-flight requests and honour Idempotency-Key
+def coalesce_requests(route_fn: Callable[..., Any]) -> Callable[..., Any]:
+    @wraps(route_fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        payload = request.get_json(silent=True) if request.is_json else request.form.to_dict()
+        key = request_key(request.path, payload or {}, list(request.args.items(multi=True)))
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+
+        replay, conflict = _stored_replay(idempotency_key, key)
+        if conflict:
+            return jsonify({"success": False, "message": conflict}), 422
+        if replay:
+            return _flask_response(replay, **{REPLAYED_HEADER: "true"})
+
+        def run() -> dict:
+            response = route_fn(*args, **kwargs)
+            if isinstance(response, tuple):
+                response, status = response
+                response.status_code = status
+            snapshot = _snapshot(response.get_data(), response.status_code, response.mimetype)
+            _store(idempotency_key, key, snapshot)
+            return snapshot
+
+        snapshot, shared = single_flight(key, run)
+        return _flask_response(snapshot, **({COALESCED_HEADER: "true"} if shared else {}))
+
+    return wrapper
+
+
+# =====================================================
+# ASYNC (asgiApp)
+# =====================================================
+_async_flights: dict[str, asyncio.Task] = {}
+
+
+async def asingle_flight(key: str, fn: Callable[[], Awaitable[dict]]) -> tuple[dict, bool]:
+    task = _async_flights.get(key)
+    shared = task is not None
+    if shared:
+        _count("coalesced")
+    else:
+        _count("leaders")
+        task = _async_flights[key] = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda _: _async_flights.pop(key, None))
+
+    # Shielded so a caller that disconnects doesn't cancel the shared work
+    return await asyncio.shield(task), shared
+
+
+def _starlette_response(snapshot: dict, headers: dict[str, str] | None = None) -> StarletteResponse:
+    return StarletteResponse(snapshot["body"], status_code=snapshot["status"], media_type=snapshot["mimetype"], headers=headers)
+
+
+def acoalesce_requests(route_fn: Callable[[Any], Awaitable[Any]]) -> Callable[[Any], Awaitable[Any]]:
+    @wraps(route_fn)
+    async def wrapper(req: Any) -> Any:
+        try:
+            payload = await req.json()
+        except Exception:
+            payload = {}
+        key = request_key(req.url.path, payload if isinstance(payload, dict) else {}, req.query_params.multi_items())
+        idempotency_key = req.headers.get(IDEMPOTENCY_HEADER)
+
+        if idempotency_key:
+            replay, conflict = await asyncio.to_thread(_stored_replay, idempotency_key, key)
+            if conflict:
+                return JSONResponse({"success": False, "message": conflict}, 422)
+            if replay:
+                return _starlette_response(replay, {REPLAYED_HEADER: "true"})
+
+        async def run() -> dict:
+            response = await route_fn(req)
+            snapshot = _snapshot(bytes(response.body), response.status_code, response.media_type)
+            if idempotency_key:
+                await asyncio.to_thread(_store, idempotency_key, key, snapshot)
+            return snapshot
+
+        snapshot, shared = await asingle_flight(key, run)
+        return _starlette_response(snapshot, {COALESCED_HEADER: "true"} if shared else None)
+
+    return wrapper
+
+
+def coalescing_stats() -> dict[str, Any]:
+    with _stats_lock:
+        stats: dict[str, Any] = dict(_stats)
+    with _flights_lock:
+        stats["inFlight"] = len(_flights) + len(_async_flights)
+    stats["idempotencyCache"] = idempotency_cache.stats()
+    return stats
@@ -2,6 +2,14 @@ DROP TABLE IF EXISTS companies CASCADE;
 DROP TABLE IF EXISTS brand_guidelines CASCADE;
 DROP TABLE IF EXISTS content_posts CASCADE;
 DROP TABLE IF EXISTS form_responses CASCADE;
+DROP TABLE IF EXISTS image_uploads CASCADE;
+DROP TABLE IF EXISTS image_analysis_cache CASCADE;
+DROP TABLE IF EXISTS image_jobs CASCADE;
+DROP TABLE IF EXISTS llm_response_cache CASCADE;
+DROP TABLE IF EXISTS pdf_text_cache CASCADE;
+DROP TABLE IF EXISTS llm_rate_buckets CASCADE;
+DROP TABLE IF EXISTS idempotency_results CASCADE;
+DROP TABLE IF EXISTS brand_guideline_artifacts CASCADE;
 
 CREATE TABLE IF NOT EXISTS companies (
 	id SERIAL PRIMARY KEY,
@@ -26,6 +34,8 @@ CREATE TABLE IF NOT EXISTS brand_guidelines (
 	file_filename TEXT,
 	file_path TEXT,
 	file_analysis JSONB,
+	profile JSONB,
+	prompt_context TEXT,
 	uploaded_at TIMESTAMPTZ,
 	generated_at TIMESTAMPTZ,
 	saved_at TIMESTAMPTZ,
@@ -40,8 +50,17 @@ CREATE TABLE IF NOT EXISTS content_posts (
 	reference_image_urls JSONB,
 	prompt TEXT,
 	caption TEXT,
+	-- Client-provided key; saving the same key again updates the post (safe retries)
+	client_key TEXT,
 	created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-	updated_at TIMESTAMPTZ
+	updated_at TIMESTAMPTZ,
+	-- Full-text search document: topic ranks above caption, caption above prompt
+	search_vector TSVECTOR GENERATED ALWAYS AS (
+		setweight(to_tsvector('english', COALESCE(topic, '')), 'A') ||
+		setweight(to_tsvector('english', COALESCE(caption, '')), 'B') ||
+		setweight(to_tsvector('english', COALESCE(prompt, '')), 'C')
+	) STORED,
+	UNIQUE (company_id, client_key)
 );
 
 CREATE TABLE IF NOT EXISTS form_responses (
@@ -57,6 +76,26 @@ CREATE TABLE IF NOT EXISTS form_responses (
 	submitted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Company directory ordering (keyset pagination)
+CREATE INDEX IF NOT EXISTS idx_companies_created
+    ON companies (created_at, id);
+
+-- Company name prefix search: lower(name) LIKE 'acme%'
+CREATE INDEX IF NOT EXISTS idx_companies_name_prefix
+    ON companies (lower(name) text_pattern_ops);
+
+-- Content history per company, newest first (keyset pagination)
+CREATE INDEX IF NOT EXISTS idx_content_posts_company_created
+    ON content_posts (company_id, created_at DESC, id DESC);
+
+-- Content history filtered by platform
+CREATE INDEX IF NOT EXISTS idx_content_posts_company_platform_created
+    ON content_posts (company_id, platform, created_at DESC, id DESC);
+
+-- Content search: search_vector @@ websearch_to_tsquery(...)
+CREATE INDEX IF NOT EXISTS idx_content_posts_search
+    ON content_posts USING GIN (search_vector);
+
 -- Fast lookups by email (e.g. deduplication, profile fetch)
 CREATE INDEX IF NOT EXISTS idx_form_responses_email
     ON form_responses (email);
@@ -64,3 +103,119 @@ CREATE INDEX IF NOT EXISTS idx_form_responses_email
 -- Fast sorting by submission time
 CREATE INDEX IF NOT EXISTS idx_form_responses_submitted_at
     ON form_responses (submitted_at DESC);
+
+-- Content hash of every uploaded reference image (computed at upload time)
+CREATE TABLE IF NOT EXISTS image_uploads (
+	url TEXT PRIMARY KEY,
+	content_hash TEXT NOT NULL,
+	company_id INTEGER REFERENCES companies(id) ON DELETE CASCADE,
+	uploaded_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Image analyses keyed by content hash + prompt/model version
+CREATE TABLE IF NOT EXISTS image_analysis_cache (
+	cache_key TEXT PRIMARY KEY,
+	content_hash TEXT NOT NULL,
+	version TEXT NOT NULL,
+	analysis JSONB NOT NULL,
+	hits INTEGER NOT NULL DEFAULT 0,
+	created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- LRU eviction order
+CREATE INDEX IF NOT EXISTS idx_image_analysis_cache_last_used_at
+    ON image_analysis_cache (last_used_at DESC);
+
+-- Background DALL-E generation jobs
+CREATE TABLE IF NOT EXISTS image_jobs (
+	id TEXT PRIMARY KEY,
+	status TEXT NOT NULL DEFAULT 'queued',
+	prompt TEXT NOT NULL,
+	size TEXT NOT NULL,
+	result_url TEXT,
+	error TEXT,
+	attempts INTEGER NOT NULL DEFAULT 0,
+	max_attempts INTEGER NOT NULL DEFAULT 3,
+	run_after TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	started_at TIMESTAMPTZ,
+	finished_at TIMESTAMPTZ,
+	updated_at TIMESTAMPTZ
+);
+
+-- Worker polling for due jobs
+CREATE INDEX IF NOT EXISTS idx_image_jobs_queued
+    ON image_jobs (created_at)
+    WHERE status = 'queued';
+
+-- Announce status changes (payload: job id) to SSE subscribers (imageJobs.IMAGE_JOB_CHANNEL)
+CREATE OR REPLACE FUNCTION notify_image_job() RETURNS trigger AS $$
+BEGIN
+	PERFORM pg_notify('image_jobs', NEW.id);
+	RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS image_jobs_notify ON image_jobs;
+CREATE TRIGGER image_jobs_notify
+    AFTER UPDATE OF status, attempts ON image_jobs
+    FOR EACH ROW EXECUTE FUNCTION notify_image_job();
+
+-- Memoized structured LLM responses, keyed by a hash of prompt + messages + model params
+CREATE TABLE IF NOT EXISTS llm_response_cache (
+	cache_key TEXT PRIMARY KEY,
+	response JSONB NOT NULL,
+	hits INTEGER NOT NULL DEFAULT 0,
+	created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- LRU eviction order (agents.responseCache.PostgresTier)
+CREATE INDEX IF NOT EXISTS idx_llm_response_cache_last_used_at
+    ON llm_response_cache (last_used_at DESC);
+
+-- Extracted PDF page text keyed by file hash (same shape as llm_response_cache)
+CREATE TABLE IF NOT EXISTS pdf_text_cache (
+	cache_key TEXT PRIMARY KEY,
+	response JSONB NOT NULL,
+	hits INTEGER NOT NULL DEFAULT 0,
+	created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- LRU eviction order (agents.responseCache.PostgresTier)
+CREATE INDEX IF NOT EXISTS idx_pdf_text_cache_last_used_at
+    ON pdf_text_cache (last_used_at DESC);
+
+-- Shared LLM rate limit buckets (LLM_RATE_LIMIT_BACKEND=postgres)
+CREATE TABLE IF NOT EXISTS llm_rate_buckets (
+	bucket_key TEXT PRIMARY KEY,
+	tokens DOUBLE PRECISION NOT NULL,
+	updated_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+-- Responses replayed for repeated Idempotency-Key requests (same shape as llm_response_cache)
+CREATE TABLE IF NOT EXISTS idempotency_results (
+	cache_key TEXT PRIMARY KEY,
+	response JSONB NOT NULL,
+	hits INTEGER NOT NULL DEFAULT 0,
+	created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	last_used_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- LRU eviction order (agents.responseCache.PostgresTier)
+CREATE INDEX IF NOT EXISTS idx_idempotency_results_last_used_at
+    ON idempotency_results (last_used_at DESC);
+
+-- Guidelines pipeline stage outputs, reused while the hash of the stage's inputs is unchanged
+CREATE TABLE IF NOT EXISTS brand_guideline_artifacts (
+	company_id INTEGER NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+	stage TEXT NOT NULL,
+	input_hash TEXT NOT NULL,
+	-- What the hash was taken over, diffed to regenerate only the affected parts
+	inputs JSONB,
+	output JSONB NOT NULL,
+	updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+	PRIMARY KEY (company_id, stage)
+);
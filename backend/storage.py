@@ -0,0 +1,352 @@
+import os
+import io
+import asyncio
+import time
+import random
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, IO
+
+import httpx
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+
+from analysisCache import hash_file
+from metrics import timed
+from agents.lazyLoading import Lazy
+
+
+# Storage settings
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "uploads")
+STORAGE_LOCAL_BASE_URL = os.getenv("STORAGE_LOCAL_BASE_URL", "")
+UPLOAD_MAX_WORKERS = int(os.getenv("UPLOAD_MAX_WORKERS", "4"))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", "3"))
+UPLOAD_BACKOFF = float(os.getenv("UPLOAD_BACKOFF", "0.5"))
+# Files larger than this are sent to Cloudinary in chunks of this size
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(6 * 1024 * 1024)))
+UPLOAD_HTTP_TIMEOUT = float(os.getenv("UPLOAD_HTTP_TIMEOUT", "60"))
+
+
+def _stream_size(stream: IO[bytes]) -> int:
+    position = stream.tell()
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(position)
+    return size
+
+
+# Keeps the underlying stream open when an uploader closes it, so retries can rewind
+class _NonClosingStream(io.RawIOBase):
+    def __init__(self, stream: IO[bytes]):
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._stream.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._stream.tell()
+
+    def close(self) -> None:
+        pass
+
+
+# Shared HTTP client for async uploads, one per event loop
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _async_http_client() -> httpx.AsyncClient:
+    global _http_client, _http_client_loop
+
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(timeout=UPLOAD_HTTP_TIMEOUT)
+        _http_client_loop = loop
+    return _http_client
+
+
+# =====================================================
+# BACKENDS
+# =====================================================
+# The Cloudinary SDK, imported and configured on first upload
+def _load_cloudinary() -> Any:
+    import cloudinary
+    import cloudinary.exceptions
+    import cloudinary.uploader
+    import cloudinary.utils
+
+    cloudinary.config(
+        cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+        api_key=os.getenv("CLOUDINARY_API_KEY"),
+        api_secret=os.getenv("CLOUDINARY_API_SECRET")
+    )
+    return cloudinary
+
+
+cloudinary_sdk = Lazy("cloudinary", _load_cloudinary)
+
+
+class CloudinaryStorage:
+    name = "cloudinary"
+
+    def __init__(self, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    @timed("cloudinary_upload")
+    def upload(
+        self,
+        stream: IO[bytes],
+        folder: str,
+        filename: str | None = None,
+        public_id: str | None = None,
+        resource_type: str = "image",
+    ) -> str:
+        cloudinary = cloudinary_sdk.get()
+        options: dict[str, Any] = {"folder": folder, "resource_type": resource_type}
+        if public_id:
+            options["public_id"] = public_id
+
+        # Chunked upload reads the stream piece by piece instead of all at once
+        if _stream_size(stream) > self.chunk_size:
+            result = cloudinary.uploader.upload_large(
+                _NonClosingStream(stream),
+                chunk_size=self.chunk_size,
+                filename=filename or "stream",
+                **options,
+            )
+        else:
+            result = cloudinary.uploader.upload(stream, **options)
+
+        return result["secure_url"]
+
+    # Signed upload over async HTTP; chunked uploads stay on the SDK (in a thread)
+    @timed("cloudinary_upload")
+    async def aupload(
+        self,
+        stream: IO[bytes],
+        folder: str,
+        filename: str | None = None,
+        public_id: str | None = None,
+        resource_type: str = "image",
+    ) -> str:
+        if _stream_size(stream) > self.chunk_size:
+            return await asyncio.to_thread(self.upload, stream, folder, filename, public_id, resource_type)
+
+        cloudinary = cloudinary_sdk.get()
+        params: dict[str, Any] = {"folder": folder, "timestamp": int(time.time())}
+        if public_id:
+            params["public_id"] = public_id
+
+        response = await _async_http_client().post(
+            cloudinary.utils.cloudinary_api_url("upload", resource_type=resource_type),
+            data=cloudinary.utils.sign_request(params, {}),
+            files={"file": (filename or "stream", stream.read())},
+        )
+
+        # Same exception types as the SDK so `is_transient` applies to both paths
+        if response.status_code != 200:
+            message = response.text
+            try:
+                message = response.json()["error"]["message"]
+            except Exception:
+                pass
+            if response.status_code == 420 or response.status_code == 429:
+                raise cloudinary.exceptions.RateLimited(message)
+            if response.status_code >= 500:
+                raise cloudinary.exceptions.GeneralError(message)
+            raise cloudinary.exceptions.BadRequest(message)
+
+        return response.json()["secure_url"]
+
+    def is_transient(self, error: Exception) -> bool:
+        if isinstance(error, httpx.TransportError):
+            return True
+        cloudinary = cloudinary_sdk.get()
+        if isinstance(error, (cloudinary.exceptions.RateLimited, cloudinary.exceptions.GeneralError)):
+            return True
+        # Network and malformed-response failures surface as the base Error
+        if type(error) is cloudinary.exceptions.Error:
+            return str(error).startswith(("Unexpected error", "Socket error", "Error parsing server response"))
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+
+# Stand-in for Cloudinary in tests, benchmarks and local development
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_DIR, base_url: str = STORAGE_LOCAL_BASE_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+
+    def upload(
+        self,
+        stream: IO[bytes],
+        folder: str,
+        filename: str | None = None,
+        public_id: str | None = None,
+        resource_type: str = "image",
+    ) -> str:
+        extension = os.path.splitext(filename or "")[1]
+        name = secure_filename(public_id or "") or uuid.uuid4().hex
+        relative = os.path.join(folder, f"{name}{extension}")
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, "wb") as out:
+            shutil.copyfileobj(stream, out, 1024 * 1024)
+
+        if self.base_url:
+            return f"{self.base_url}/{relative.replace(os.sep, '/')}"
+        return f"file://{path}"
+
+    async def aupload(
+        self,
+        stream: IO[bytes],
+        folder: str,
+        filename: str | None = None,
+        public_id: str | None = None,
+        resource_type: str = "image",
+    ) -> str:
+        return await asyncio.to_thread(self.upload, stream, folder, filename, public_id, resource_type)
+
+    def is_transient(self, error: Exception) -> bool:
+        return False
+
+
+STORAGE_BACKENDS = {"cloudinary": CloudinaryStorage, "local": LocalStorage}
+
+_storage: Any = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = STORAGE_BACKENDS[STORAGE_BACKEND]()
+    return _storage
+
+
+def set_storage(storage) -> None:
+    global _storage
+    _storage = storage
+
+
+# =====================================================
+# UPLOADS
+# =====================================================
+# Upload one stream, retrying transient failures with jittered backoff
+def upload_with_retry(
+    stream: IO[bytes],
+    folder: str,
+    filename: str | None = None,
+    public_id: str | None = None,
+    resource_type: str = "image",
+    storage: Any = None,
+    max_attempts: int = UPLOAD_MAX_ATTEMPTS,
+) -> str:
+    storage = storage or get_storage()
+    attempt = 1
+
+    while True:
+        try:
+            stream.seek(0)
+            return storage.upload(stream, folder, filename=filename, public_id=public_id, resource_type=resource_type)
+        except Exception as e:
+            if attempt >= max_attempts or not storage.is_transient(e):
+                raise
+            delay = UPLOAD_BACKOFF * (2 ** (attempt - 1))
+            print(f"Retrying upload of {filename} ({attempt}/{max_attempts}) after error: {e}")
+            time.sleep(delay + random.uniform(0, delay / 2))
+            attempt += 1
+
+
+# Upload files concurrently; one result per file (in order), failures included
+def upload_files(
+    files: list[FileStorage],
+    folder: str,
+    storage: Any = None,
+    max_workers: int = UPLOAD_MAX_WORKERS,
+) -> list[dict[str, Any]]:
+    storage = storage or get_storage()
+
+    def upload_one(f: FileStorage) -> dict[str, Any]:
+        result: dict[str, Any] = {"filename": f.filename, "success": False}
+        try:
+            # Hash the content so repeat images reuse cached analyses
+            result["hash"] = hash_file(f.stream)
+            result["url"] = upload_with_retry(f.stream, folder, filename=f.filename, storage=storage)
+            result["success"] = True
+        except Exception as e:
+            print(f"Error uploading {f.filename}: {e}")
+            result["error"] = str(e)
+        return result
+
+    if len(files) <= 1:
+        return [upload_one(f) for f in files]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+        return list(executor.map(upload_one, files))
+
+
+# =====================================================
+# ASYNC UPLOADS (asgiApp.py)
+# =====================================================
+async def aupload_with_retry(
+    stream: IO[bytes],
+    folder: str,
+    filename: str | None = None,
+    public_id: str | None = None,
+    resource_type: str = "image",
+    storage: Any = None,
+    max_attempts: int = UPLOAD_MAX_ATTEMPTS,
+) -> str:
+    storage = storage or get_storage()
+    attempt = 1
+
+    while True:
+        try:
+            stream.seek(0)
+            return await storage.aupload(stream, folder, filename=filename, public_id=public_id, resource_type=resource_type)
+        except Exception as e:
+            if attempt >= max_attempts or not storage.is_transient(e):
+                raise
+            delay = UPLOAD_BACKOFF * (2 ** (attempt - 1))
+            print(f"Retrying upload of {filename} ({attempt}/{max_attempts}) after error: {e}")
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            attempt += 1
+
+
+# Async `upload_files` for uploads with `.filename` and `.file` (Starlette's UploadFile)
+async def aupload_files(
+    files: list[Any],
+    folder: str,
+    storage: Any = None,
+    max_concurrency: int = UPLOAD_MAX_WORKERS,
+) -> list[dict[str, Any]]:
+    storage = storage or get_storage()
+    slots = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def upload_one(f: Any) -> dict[str, Any]:
+        result: dict[str, Any] = {"filename": f.filename, "success": False}
+        async with slots:
+            try:
+                # Hash the content so repeat images reuse cached analyses
+                result["hash"] = await asyncio.to_thread(hash_file, f.file)
+                result["url"] = await aupload_with_retry(f.file, folder, filename=f.filename, storage=storage)
+                result["success"] = True
+            except Exception as e:
+                print(f"Error uploading {f.filename}: {e}")
+                result["error"] = str(e)
+        return result
+
+    return list(await asyncio.gather(*(upload_one(f) for f in files)))
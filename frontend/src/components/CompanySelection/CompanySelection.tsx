@@ -1,36 +1,95 @@
 import "./CompanySelection.css"
 
 // Props
-import { Company } from "../../props"
+import { CompanySummary } from "../../props"
 import { CompanySelectionProps } from "../../props"
-import { useEffect, useState } from "react"
+import { UIEvent, useEffect, useState } from "react"
 
 const API_BASE = import.meta.env.VITE_API_BASE_URL || "http://localhost:5000";
+// Companies per page; the next page loads when the carousel is scrolled to its end
+const PAGE_SIZE = 50
+// Wait for typing to pause before searching
+const SEARCH_DELAY_MS = 250
+
+// One page of the carousel: just the fields it shows, optionally filtered by name prefix
+const fetchCompanyPage = async (search: string, cursor: string | null, signal?: AbortSignal) => {
+  const params = new URLSearchParams({ fields: "id,name,logo", limit: String(PAGE_SIZE) })
+  if (search) params.set("q", search)
+  if (cursor) params.set("cursor", cursor)
+
+  const res: Response = await fetch(`${API_BASE}/api/companies?${params}`, { signal })
+  if (!res.ok) throw new Error(`Failed to fetch companies (${res.status})`)
+  const page: CompanySummary[] = await res.json()
+  return { page, nextCursor: res.headers.get("X-Next-Cursor") }
+}
 
 // Destructure interface to get keys as function parameters
 function CompanySelection({ selectedCompany, onSelectCompany }: CompanySelectionProps) {
-  const [companies, setCompanies] = useState<Company[]>([])
+  const [companies, setCompanies] = useState<CompanySummary[]>([])
+  const [search, setSearch] = useState("")
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
-  // Fetch companies from api
+  // Fetch the first page from api whenever the search changes
   useEffect(() => {
-    const fetchCompanies = async () => {
+    const controller = new AbortController()
+    const timer = setTimeout(async () => {
       try {
-        const res = await fetch(`${API_BASE}/api/companies`)
-        const resJson = await res.json()
-        setCompanies(resJson)
+        const { page, nextCursor } = await fetchCompanyPage(search.trim(), null, controller.signal)
+        setCompanies(page)
+        setNextCursor(nextCursor)
       } catch (e) {
-        console.error('Error fetching companies:', e);
+        if (!controller.signal.aborted) console.error('Error fetching companies:', e);
       }
+    }, search ? SEARCH_DELAY_MS : 0)
+
+    return () => {
+      clearTimeout(timer)
+      controller.abort()
     }
+  }, [search])
 
-    // useEffect doesn't take async fn as callback
-    fetchCompanies()
-  }, [])
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return
+    setLoadingMore(true)
+    try {
+      const { page, nextCursor: cursor } = await fetchCompanyPage(search.trim(), nextCursor)
+      setCompanies((previous) => [...previous, ...page])
+      setNextCursor(cursor)
+    } catch (e) {
+      console.error('Error fetching companies:', e);
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  const handleScroll = (e: UIEvent<HTMLDivElement>) => {
+    const { scrollLeft, clientWidth, scrollWidth } = e.currentTarget
+    if (scrollLeft + clientWidth >= scrollWidth - 200) loadMore()
+  }
+
+  // The carousel only has id, name and logo; fetch the full company when one is picked
+  const selectCompany = async (id: number) => {
+    try {
+      const res: Response = await fetch(`${API_BASE}/api/companies/${id}`)
+      if (!res.ok) throw new Error(`Failed to fetch company (${res.status})`)
+      onSelectCompany?.(await res.json())
+    } catch (e) {
+      console.error('Error fetching company:', e);
+    }
+  }
 
   return (
     <section className="company-selection component">
       <div className='section-title'>
         <h2>+ COMPANIES</h2>
+        <input
+          className="input-primary cs-search"
+          type="search"
+          placeholder="Search companies"
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+        />
       </div>
       <div className="cs-container">
         <div className="cs-add-new">
@@ -49,12 +108,12 @@ function CompanySelection({ selectedCompany, onSelectCompany }: CompanySelection
             </defs>
           </svg>
         </div>
-        <div className="cs-carousel">
+        <div className="cs-carousel" onScroll={handleScroll}>
           {/* Map saved companies */}
           {companies.map((company) => (
             <div
               key={company.id}
-              onClick={() => onSelectCompany?.(company)}
+              onClick={() => selectCompany(company.id)}
               className={`cs-company-item ${selectedCompany?.id === company.id ? "selected" : ""}`}
             >
               <img className="cs-company-logo" src={company.logo} alt="logo-img" />
@@ -14,6 +14,9 @@ export interface Company {
   createdAt?: string | null,
 }
 
+// Fields of the company carousel (`/api/companies?fields=id,name,logo`)
+export type CompanySummary = Pick<Company, "id" | "name" | "logo">
+
 export interface CompanySelectionProps {
   selectedCompany: Company | null,
   onSelectCompany?: (company: Company) => void,